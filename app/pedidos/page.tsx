@@ -11,7 +11,7 @@ import { Footer } from "@/components/footer"
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card"
 import { Badge } from "@/components/ui/badge"
 import { Button } from "@/components/ui/button"
-import { fetchOrders, type Order } from "@/lib/api"
+import { fetchOrders, subscribeToOrderEvents, type CursorPage, type Order } from "@/lib/api"
 import { getAuthToken } from "@/lib/auth"
 
 const STATUS_META = {
@@ -20,9 +20,18 @@ const STATUS_META = {
   completed: { label: "Completado", icon: CheckCircle2, color: "bg-green-500", progress: 100 },
 } as const
 
+// Orders come newest first: by order_date, then by id.
+function isOlder(order: Order, than: Order) {
+  return order.order_date < than.order_date || (order.order_date === than.order_date && order.id < than.id)
+}
+
 export default function PedidosPage() {
-  const [orders, setOrders] = useState<Order[]>([])
+  const [{ orders, next: nextPage }, setFeed] = useState<{ orders: Order[]; next: string | null }>({
+    orders: [],
+    next: null,
+  })
   const [isLoading, setIsLoading] = useState(true)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
   const [error, setError] = useState<string | null>(null)
 
   useEffect(() => {
@@ -34,8 +43,8 @@ export default function PedidosPage() {
     }
 
     fetchOrders(token)
-      .then((data) => {
-        setOrders(data)
+      .then((page) => {
+        setFeed({ orders: page.results, next: page.next })
       })
       .catch((err) => {
         const message = err instanceof Error ? err.message : "No se pudieron cargar tus pedidos."
@@ -44,8 +53,56 @@ export default function PedidosPage() {
       .finally(() => {
         setIsLoading(false)
       })
+
+    // Refresh the first page and keep the older pages already loaded below it.
+    const reload = () => {
+      fetchOrders(token)
+        .then((page: CursorPage<Order>) => {
+          const last = page.results[page.results.length - 1]
+          setFeed((current) => {
+            const older = last ? current.orders.filter((order) => isOlder(order, last)) : []
+            return { orders: [...page.results, ...older], next: older.length > 0 ? current.next : page.next }
+          })
+        })
+        .catch(() => {
+          // Keep the orders already shown; the next event retries.
+        })
+    }
+    return subscribeToOrderEvents(token, {
+      // Events sent while disconnected are lost, so every (re)connection reloads the list.
+      onOpen: reload,
+      onCreated: reload,
+      onPoll: reload,
+      onStatusChanged: (event) => {
+        setFeed((current) => ({
+          ...current,
+          orders: current.orders.map((order) => (order.id === event.id ? { ...order, status: event.status } : order)),
+        }))
+      },
+    })
   }, [])
 
+  const loadMore = () => {
+    const token = getAuthToken()
+    if (!token || !nextPage) {
+      return
+    }
+    setIsLoadingMore(true)
+    fetchOrders(token, nextPage)
+      .then((page) => {
+        setFeed((current) => ({
+          orders: [...current.orders, ...page.results.filter((order) => !current.orders.some(({ id }) => id === order.id))],
+          next: page.next,
+        }))
+      })
+      .catch((err) => {
+        setError(err instanceof Error ? err.message : "No se pudieron cargar tus pedidos.")
+      })
+      .finally(() => {
+        setIsLoadingMore(false)
+      })
+  }
+
   const content = useMemo(() => {
     if (isLoading) {
       return (
@@ -161,6 +218,14 @@ export default function PedidosPage() {
           </div>
 
           <div className="space-y-6">{content}</div>
+
+          {!isLoading && !error && nextPage && (
+            <div className="text-center">
+              <Button variant="outline" onClick={loadMore} disabled={isLoadingMore}>
+                {isLoadingMore ? "Cargando..." : "Cargar mas pedidos"}
+              </Button>
+            </div>
+          )}
         </div>
       </div>
 
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
-from .models import ContactMessage, Order, OrderItem, Product, User
+from .models import ArchivedOrder, ArchivedOrderItem, ContactMessage, Order, OrderItem, Product, User
 
 
 @admin.register(User)
@@ -17,6 +17,7 @@ class UserAdmin(DjangoUserAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    readonly_fields = ("unit_price", "subtotal")
 
 
 @admin.register(Product)
@@ -28,11 +29,39 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "customer", "status", "order_date", "delivery_date")
+    list_display = ("id", "customer", "status", "order_date", "delivery_date", "total_amount")
     list_filter = ("status", "order_date")
     search_fields = ("customer__username", "customer__email")
+    readonly_fields = ("total_amount",)
     inlines = [OrderItemInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_total()
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    readonly_fields = ("product", "quantity", "unit_price", "personalization", "subtotal")
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only: orders only get here through ``manage.py archive_orders``."""
+
+    list_display = ("id", "customer", "status", "order_date", "total_amount", "archived_at")
+    list_filter = ("order_date",)
+    search_fields = ("customer__username", "customer__email")
+    inlines = [ArchivedOrderItemInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(ContactMessage)
 class ContactMessageAdmin(admin.ModelAdmin):
@@ -0,0 +1,179 @@
+"""
+Archival of old completed orders.
+
+``api_order`` and ``api_orderitem`` only grow, and lists, reports and the
+admin keep paying for years of completed orders nobody opens.
+``archive_batch`` moves the oldest completed orders placed before a cutoff,
+with their items, into ``ArchivedOrder`` and ``ArchivedOrderItem``. Every
+batch is its own transaction, so ``manage.py archive_orders`` can be
+stopped at any point and simply run again to continue.
+
+Archiving is not deleting: the archived orders leave the rollups, so the
+report covers the hot tables only, but no tombstones are written and no
+events published, so clients syncing changes keep their copy. The archive
+is read only on request, through ``GET /api/orders/archived/`` and
+``?include_archived=1`` on the report.
+"""
+import time
+from calendar import monthrange
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DateField, DecimalField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import rollups
+from .caching import bump_report_version
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+TABLES = (Order, OrderItem, ArchivedOrder, ArchivedOrderItem)
+
+
+def months_before(moment, months):
+    month = moment.month - 1 - months
+    year, month = moment.year + month // 12, month % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, monthrange(year, month)[1]))
+
+
+def cutoff(months=None):
+    """Orders placed before this moment are old enough to archive."""
+    return months_before(timezone.now(), settings.ORDER_ARCHIVE_AFTER_MONTHS if months is None else months)
+
+
+def archivable(before):
+    return Order.objects.filter(status=Order.Status.COMPLETED, order_date__lt=before)
+
+
+@transaction.atomic
+def archive_batch(before, batch_size=1000) -> int:
+    """Archive up to ``batch_size`` of the oldest archivable orders and return how many moved."""
+    orders = list(archivable(before).select_for_update().order_by("order_date", "id")[:batch_size])
+    if not orders:
+        return 0
+    ids = [order.pk for order in orders]
+    items = list(OrderItem.objects.filter(order_id__in=ids))
+    now = timezone.now()
+    ArchivedOrder.objects.bulk_create(
+        [
+            ArchivedOrder(
+                id=order.pk,
+                customer_id=order.customer_id,
+                status=order.status,
+                order_date=order.order_date,
+                delivery_date=order.delivery_date,
+                notes=order.notes,
+                total_amount=order.total_amount,
+                updated_at=order.updated_at,
+                version=order.version,
+                archived_at=now,
+            )
+            for order in orders
+        ]
+    )
+    ArchivedOrderItem.objects.bulk_create(
+        [
+            ArchivedOrderItem(
+                id=item.pk,
+                order_id=item.order_id,
+                product_id=item.product_id,
+                quantity=item.quantity,
+                unit_price=item.unit_price,
+                personalization=item.personalization,
+            )
+            for item in items
+        ]
+    )
+    rollups.remove_orders(orders)
+    # Suspended, the delete skips the per-row rollup, tombstone and report handlers; the lines above cover them.
+    with rollups.suspended():
+        Order.objects.filter(pk__in=ids).delete()
+    bump_report_version()
+    return len(orders)
+
+
+def add_archived(orders_by_status, revenue, monthly_sales, product_totals, top=5):
+    """
+    Add the archive's totals to report rows read from the rollups.
+    ``product_totals`` must cover every product; the top ``top`` are kept.
+    """
+    statuses = defaultdict(int, {row["status"]: row["total"] for row in orders_by_status})
+    for status, total in ArchivedOrder.objects.values_list("status").annotate(total=Count("id")).order_by():
+        statuses[status] += total
+
+    months = defaultdict(int, {row["month"]: row["total"] for row in monthly_sales})
+    archived_months = (
+        ArchivedOrder.objects.annotate(month=TruncMonth("order_date", output_field=DateField()))
+        .values_list("month")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    for month, total in archived_months:
+        months[month] += total
+
+    archived_revenue = ArchivedOrderItem.objects.aggregate(
+        total=Sum(F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=12, decimal_places=2))
+    )["total"]
+    if archived_revenue:
+        revenue = (revenue or 0) + archived_revenue
+
+    products = {row["product_id"]: dict(row) for row in product_totals}
+    archived_products = (
+        ArchivedOrderItem.objects.values("product_id", "product__name")
+        .annotate(total_sold=Sum("quantity"))
+        .order_by()
+    )
+    for row in archived_products:
+        products.setdefault(row["product_id"], {**row, "total_sold": 0})["total_sold"] += row["total_sold"]
+
+    return (
+        [{"status": status, "total": total} for status, total in sorted(statuses.items())],
+        revenue,
+        [{"month": month, "total": total} for month, total in sorted(months.items()) if total > 0],
+        sorted(
+            (row for row in products.values() if row["total_sold"] > 0),
+            key=lambda row: (-row["total_sold"], row["product_id"]),
+        )[:top],
+    )
+
+
+def table_sizes():
+    """Rows per table and, on PostgreSQL, bytes on disk including indexes and TOAST."""
+    sizes = {}
+    with connection.cursor() as cursor:
+        for model in TABLES:
+            table = model._meta.db_table
+            size = None
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+                size = cursor.fetchone()[0]
+            sizes[table] = (model.objects.count(), size)
+    return sizes
+
+
+def _hot_queries():
+    completed = Order.objects.filter(status=Order.Status.COMPLETED)
+    return {
+        "order-list": lambda: list(Order.objects.order_by("-order_date", "-id")[:50]),
+        "completed-list": lambda: list(completed.order_by("-order_date", "-id")[:50]),
+        "order-count": Order.objects.count,
+        "sales-by-product": lambda: list(
+            OrderItem.objects.values("product_id").annotate(units=Sum("quantity")).order_by()
+        ),
+    }
+
+
+def time_hot_queries(repeat=3):
+    """Best of ``repeat`` runs, in milliseconds, of queries every list, report and admin page resembles."""
+    timings = {}
+    for name, query in _hot_queries().items():
+        query()  # warm up
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best * 1000
+    return timings
@@ -0,0 +1,37 @@
+from django.urls import path
+
+from . import async_views
+from .views import OrderViewSet, ProductViewSet, ReportView
+
+LIST = {"get": "list", "post": "create"}
+DETAIL = {"get": "retrieve", "put": "update", "patch": "partial_update", "delete": "destroy"}
+
+urlpatterns = [
+    path(
+        "products/",
+        async_views.read_path(async_views.product_list, ProductViewSet.as_view(LIST)),
+        name="product-list-async",
+    ),
+    path(
+        "products/<int:pk>/",
+        async_views.read_path(async_views.product_detail, ProductViewSet.as_view(DETAIL)),
+        name="product-detail-async",
+    ),
+    path(
+        "orders/",
+        async_views.read_path(async_views.order_list, OrderViewSet.as_view(LIST)),
+        name="order-list-async",
+    ),
+    path("orders/events/", async_views.order_events, name="order-events"),
+    path(
+        "orders/<int:pk>/",
+        async_views.read_path(async_views.order_detail, OrderViewSet.as_view(DETAIL)),
+        name="order-detail-async",
+    ),
+    path("exports/orders.<str:file_format>", async_views.order_export, name="orders-export-async"),
+    path(
+        "reports/overview/",
+        async_views.read_path(async_views.report_overview, ReportView.as_view()),
+        name="reports-overview-async",
+    ),
+]
@@ -0,0 +1,258 @@
+"""
+Async versions of the read-heavy endpoints, for the ASGI application.
+
+Under ASGI a sync DRF view holds a worker thread for the whole request,
+including every wait on the database or the cache. These views answer
+GET and HEAD for the product list and detail, the order list and detail
+and the report overview with Django's async ORM and cache APIs, sharing
+validators, serializers, pagination and cached payloads with the sync
+views so both paths return the same bytes. Conditional requests and
+catalog cache hits never leave the event loop. Other methods, product
+searches, reports including the archive and browsable-API requests fall
+through to the sync views.
+
+``order_events`` streams order creations and status changes as
+Server-Sent Events: admins receive every event and customers those of
+their own orders. It exists only under ASGI, where an idle stream is a
+suspended coroutine rather than a blocked worker thread.
+
+``order_export`` runs the sync export view and streams its body from the
+event loop one block at a time; handed a sync iterator, the ASGI handler
+would read the whole export into memory before sending a byte.
+
+``backend.asgi_urls`` mounts these views in front of the regular routes.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import conditional, events
+from .authentication import CachedTokenAuthentication
+from .caching import (
+    aget_catalog_deleted_at,
+    aget_catalog_version,
+    aget_report_version,
+    catalog_cache,
+)
+from .models import DailySalesRollup, Order, Product, User
+from .pagination import OrderCursorPagination
+from .serializers import OrderSerializer, ProductSerializer
+from .views import OrderExportView, OrderViewSet, ProductViewSet, ReportView
+
+JSON = "application/json"
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type=JSON)
+
+
+def _error(detail, status):
+    response = _json({"detail": detail}, status=status)
+    if status == 401:
+        response["WWW-Authenticate"] = CachedTokenAuthentication.keyword
+    return response
+
+
+async def _drf_request(request):
+    """Wrap ``request`` for the serializers and paginators, with the token user resolved."""
+    drf_request = Request(request, authenticators=())
+    resolved = await CachedTokenAuthentication().aauthenticate(request)
+    if resolved is not None:
+        drf_request.user, drf_request.auth = resolved
+    return drf_request
+
+
+class _FallThrough(Exception):
+    """Raised by an async view for requests only the sync view handles."""
+
+
+def _falls_through(request):
+    return (
+        request.method not in ("GET", "HEAD")
+        or "format" in request.GET
+        or "text/html" in request.headers.get("Accept", "")
+    )
+
+
+def read_path(async_view, sync_view):
+    """Serve reads with ``async_view`` and everything else with the sync DRF ``sync_view``."""
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if _falls_through(request):
+            return await sync_view(request, *args, **kwargs)
+        try:
+            return await async_view(request, *args, **kwargs)
+        except _FallThrough:
+            return await sync_view(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return _error(exc.detail, exc.status_code)
+
+    return csrf_exempt(view)
+
+
+async def product_list(request):
+    if request.GET.get("search", "").strip():
+        raise _FallThrough
+    drf_request = await _drf_request(request)
+    state = await Product.objects.aaggregate(**ProductViewSet.catalog_state)
+    state["version"] = await aget_catalog_version()
+    validator, last_modified = ProductViewSet.list_validator(request, state, await aget_catalog_deleted_at())
+    etag, timestamp, not_modified = conditional.evaluate(request, validator, last_modified)
+    if not_modified is not None:
+        return conditional.add_validators(not_modified, etag, timestamp)
+
+    version = ProductViewSet.body_version(state)
+    key = request.GET.urlencode()
+    content = catalog_cache.get(version, key)
+    if content is None:
+        queryset = ProductSerializer.setup_queryset(ProductViewSet.queryset.all(), drf_request)
+        products = [product async for product in queryset]
+        data = ProductSerializer(products, many=True, context={"request": drf_request}).data
+        content = JSONRenderer().render(data, JSON)
+        catalog_cache.set(version, key, content)
+    return conditional.add_validators(HttpResponse(content, content_type=JSON), etag, timestamp)
+
+
+async def product_detail(request, pk):
+    drf_request = await _drf_request(request)
+    updated_at = await Product.objects.filter(pk=pk).values_list("updated_at", flat=True).afirst()
+    if updated_at is None:
+        return _error("No encontrado.", 404)
+    validator = ("detail", str(pk), updated_at, request.GET.urlencode())
+    etag, timestamp, not_modified = conditional.evaluate(request, validator, updated_at)
+    if not_modified is not None:
+        return conditional.add_validators(not_modified, etag, timestamp)
+    try:
+        product = await ProductSerializer.setup_queryset(Product.objects.all(), drf_request).aget(pk=pk)
+    except Product.DoesNotExist:
+        return _error("No encontrado.", 404)
+    data = ProductSerializer(product, context={"request": drf_request}).data
+    return conditional.add_validators(_json(data), etag, timestamp)
+
+
+async def _authenticated(request):
+    drf_request = await _drf_request(request)
+    if not drf_request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return drf_request
+
+
+async def order_list(request):
+    drf_request = await _authenticated(request)
+    paginator = OrderCursorPagination()
+    # DRF's cursor paginator evaluates the page itself, so it runs where the ORM would.
+    orders = OrderViewSet.visible_orders(drf_request)
+    page = await sync_to_async(paginator.paginate_queryset)(orders, drf_request)
+    data = OrderSerializer(page, many=True, context={"request": drf_request}).data
+    return _json(paginator.get_paginated_response(data).data)
+
+
+async def order_detail(request, pk):
+    drf_request = await _authenticated(request)
+    try:
+        order = await OrderViewSet.visible_orders(drf_request).aget(pk=pk)
+    except Order.DoesNotExist:
+        return _error("No encontrado.", 404)
+    return _json(OrderSerializer(order, context={"request": drf_request}).data)
+
+
+async def report_overview(request):
+    if "include_archived" in request.GET:
+        raise _FallThrough
+    drf_request = await _authenticated(request)
+    if drf_request.user.role != User.Role.ADMIN:
+        raise exceptions.PermissionDenied()
+
+    key = ReportView.cache_key
+    version = await aget_report_version()
+    entry = await cache.aget(f"{key}:{version}")
+    if entry is None and settings.REPORT_CACHE_MAX_STALENESS:
+        latest = await cache.aget(f"{key}:latest")
+        if latest and time.time() - latest["computed_at"] <= settings.REPORT_CACHE_MAX_STALENESS:
+            entry = latest
+    served_version = entry["version"] if entry else version
+
+    etag = f'"report-{served_version}"'
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        return ReportView.with_validators(HttpResponse(status=304), etag)
+
+    if entry is None:
+        orders_by_status, monthly_sales, top_products = ReportView.report_queries()
+        revenue = (await DailySalesRollup.objects.aaggregate(**ReportView.revenue_aggregate))["total"]
+        data = ReportView.report_payload(
+            [row async for row in orders_by_status],
+            revenue,
+            [row async for row in monthly_sales],
+            [row async for row in top_products],
+        )
+        entry = {"version": version, "computed_at": time.time(), "data": data}
+        await cache.aset(f"{key}:{version}", entry, settings.REPORT_CACHE_TIMEOUT)
+        await cache.aset(f"{key}:latest", entry, settings.REPORT_CACHE_TIMEOUT)
+    return ReportView.with_validators(_json(entry["data"]), etag)
+
+
+async def _event_stream(customer):
+    # Subscribing on the first iteration ties the subscription to the generator's cleanup.
+    subscription = events.get_broker().subscribe(customer)
+    try:
+        yield f"retry: {settings.ORDER_EVENTS_RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await subscription.get(settings.ORDER_EVENTS_KEEPALIVE)
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is events.OVERFLOW:
+                return
+            yield event.as_sse()
+    finally:
+        subscription.close()
+
+
+@require_GET
+async def order_events(request):
+    ticket = request.GET.get("ticket")
+    if ticket:
+        user_id = events.ticket_user_id(ticket)
+        user = user_id and await User.objects.filter(pk=user_id, is_active=True).afirst()
+        if not user:
+            return _error("Ticket invalido o expirado.", 401)
+    else:
+        try:
+            user = (await _authenticated(request)).user
+        except exceptions.APIException as exc:
+            return _error(exc.detail, exc.status_code)
+
+    customer = None if user.role == User.Role.ADMIN else user.pk
+    response = StreamingHttpResponse(_event_stream(customer), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def _blocks(iterator):
+    # Thread-sensitive, so every block is read in the thread holding the export's cursor.
+    next_block = sync_to_async(next)
+    while (block := await next_block(iterator, None)) is not None:
+        yield block
+
+
+_export_view = sync_to_async(OrderExportView.as_view())
+
+
+async def order_export(request, file_format):
+    response = await _export_view(request, file_format=file_format)
+    if response.streaming and not response.is_async:
+        # The sync generator stays registered for closing along with the response.
+        response.streaming_content = _blocks(iter(response.streaming_content))
+    return response
@@ -0,0 +1,164 @@
+"""
+Token authentication that resolves tokens without touching the database.
+
+A resolved token is kept for a few seconds in a small per-process LRU and
+for a few minutes in the shared cache, so most requests never query
+``authtoken_token``. Shared entries are deleted whenever the user is saved
+(deactivation, role or password changes) or the token is deleted (logout),
+and again once that transaction commits. Other workers only notice when
+their local entry expires, so a deactivated user keeps authenticating
+there for at most ``AUTH_TOKEN_LOCAL_CACHE_TTL`` seconds; with a cache
+that is not shared between workers the bound is
+``AUTH_TOKEN_CACHE_TIMEOUT`` instead. Tokens expire ``AUTH_TOKEN_TTL`` seconds after they are issued and are
+replaced on login once they are older than ``AUTH_TOKEN_ROTATE_AFTER``.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+CACHE_KEY = "api:auth:token:{}"
+
+
+class _LocalTokenCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+local_tokens = _LocalTokenCache(settings.AUTH_TOKEN_LOCAL_CACHE_SIZE, settings.AUTH_TOKEN_LOCAL_CACHE_TTL)
+
+
+def _is_expired(created) -> bool:
+    ttl = settings.AUTH_TOKEN_TTL
+    return bool(ttl) and created + timedelta(seconds=ttl) <= timezone.now()
+
+
+def _forget(key: str) -> None:
+    local_tokens.discard(key)
+    cache.delete(CACHE_KEY.format(key))
+
+
+def invalidate_token(key: str) -> None:
+    """
+    Drop ``key`` now and again once the transaction commits: a request that
+    reads the old row in between would otherwise cache it for
+    ``AUTH_TOKEN_CACHE_TIMEOUT`` seconds.
+    """
+    _forget(key)
+    transaction.on_commit(lambda: _forget(key))
+
+
+def invalidate_user_tokens(user_id) -> None:
+    for key in Token.objects.filter(user_id=user_id).values_list("key", flat=True):
+        invalidate_token(key)
+
+
+def issue_token(user) -> Token:
+    """Return the user's token, replacing it when it is due for rotation or expired."""
+    token, created = Token.objects.get_or_create(user=user)
+    rotate_after = settings.AUTH_TOKEN_ROTATE_AFTER
+    if not created and (
+        _is_expired(token.created)
+        or (rotate_after and token.created + timedelta(seconds=rotate_after) <= timezone.now())
+    ):
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        entry = local_tokens.get(key)
+        if entry is None:
+            entry = cache.get(CACHE_KEY.format(key))
+            if entry is None:
+                entry = self._load(key)
+                cache.set(CACHE_KEY.format(key), entry, timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            local_tokens.set(key, entry)
+        return self._credentials(key, entry)
+
+    async def aauthenticate(self, request):
+        """Async counterpart of ``authenticate`` for plain Django async views."""
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Encabezado de token invalido.")
+        try:
+            key = auth[1].decode()
+        except UnicodeError as exc:
+            raise exceptions.AuthenticationFailed("Encabezado de token invalido.") from exc
+
+        entry = local_tokens.get(key)
+        if entry is None:
+            entry = await cache.aget(CACHE_KEY.format(key))
+            if entry is None:
+                entry = await self._aload(key)
+                await cache.aset(CACHE_KEY.format(key), entry, timeout=settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            local_tokens.set(key, entry)
+        return self._credentials(key, entry)
+
+    @staticmethod
+    def _credentials(key, entry):
+        user, created = entry
+        if _is_expired(created):
+            raise exceptions.AuthenticationFailed("El token ha expirado.")
+        # Every request gets its own instance so changes to one cannot leak into another.
+        user = copy.copy(user)
+        return user, Token(key=key, user=user, created=created)
+
+    @staticmethod
+    def _checked(token):
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed("Usuario inactivo o eliminado.")
+        return token.user, token.created
+
+    def _load(self, key):
+        try:
+            return self._checked(Token.objects.select_related("user").get(key=key))
+        except Token.DoesNotExist as exc:
+            raise exceptions.AuthenticationFailed("Token invalido.") from exc
+
+    async def _aload(self, key):
+        try:
+            return self._checked(await Token.objects.select_related("user").aget(key=key))
+        except Token.DoesNotExist as exc:
+            raise exceptions.AuthenticationFailed("Token invalido.") from exc
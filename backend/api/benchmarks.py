@@ -0,0 +1,283 @@
+"""
+In-process benchmarks of the main API endpoints.
+
+Every scenario is driven through DRF's test client against the current
+database, inside a transaction that is rolled back at the end and with a
+private in-memory cache, so a run leaves neither rows nor cache entries
+behind. Results are checked against the budgets stored in
+``benchmark_budgets.json``: a p95 latency in milliseconds and the most
+queries a single request may run. Load realistic volumes first with
+``manage.py generate_load_data``.
+
+The cached read paths are measured twice: warm, as most requests find
+them, and ``-cold``, with the cache cleared before every request so the
+budget also covers the request that rebuilds the cached payload.
+
+``compare_throughput`` measures requests per second for the read paths
+under concurrency, once through the WSGI handler with one thread per
+client and once through the ASGI handler with the async read views.
+"""
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .authentication import issue_token, local_tokens
+from .models import Order, Product, User
+
+BUDGETS_PATH = Path(__file__).with_name("benchmark_budgets.json")
+PASSWORD = "Benchmark123!"
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Result(NamedTuple):
+    name: str
+    requests: int
+    p50: float
+    p95: float
+    p99: float
+    queries: int
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def save_budgets(results, path=BUDGETS_PATH, headroom=3.0, floor_ms=50.0):
+    budgets = {
+        result.name: {
+            "p95_ms": math.ceil(max(result.p95 * 1000 * headroom, floor_ms)),
+            "queries": result.queries,
+        }
+        for result in results
+    }
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(budgets, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def check_budgets(results, budgets):
+    """Return a message for every result over its budget."""
+    failures = []
+    for result in results:
+        budget = budgets.get(result.name)
+        if budget is None:
+            continue
+        if result.p95 * 1000 > budget["p95_ms"]:
+            failures.append(f"{result.name}: p95 {result.p95 * 1000:.1f} ms > {budget['p95_ms']} ms")
+        if result.queries > budget["queries"]:
+            failures.append(f"{result.name}: {result.queries} consultas > {budget['queries']}")
+    return failures
+
+
+class Throughput(NamedTuple):
+    handler: str
+    requests: int
+    seconds: float
+
+    @property
+    def per_second(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _client(token=None):
+    client = APIClient()
+    if token:
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+    return client
+
+
+def _scenarios():
+    admin = User.objects.create_user(
+        email="benchmark-admin@example.com", password=PASSWORD, username="benchmark-admin", role=User.Role.ADMIN
+    )
+    customer = User.objects.create_user(
+        email="benchmark-cliente@example.com", password=PASSWORD, username="benchmark-cliente"
+    )
+    products = list(Product.objects.order_by("pk").values_list("pk", flat=True)[:3])
+    if not products:
+        products = [Product.objects.create(name="Producto de prueba", price="100.00").pk]
+    Product.objects.filter(pk__in=products).update(stock=10**9)
+
+    anonymous = _client()
+    as_admin = _client(issue_token(admin).key)
+    as_customer = _client(issue_token(customer).key)
+    order_payload = {"items": [{"product": pk, "quantity": 1} for pk in products]}
+    order = as_customer.post("/api/orders/", order_payload, format="json").data["id"]
+    credentials = {"email": customer.email, "password": PASSWORD}
+
+    def reopen_order(iteration):
+        # Orders only move forward, so every iteration starts again from "new". Untimed; rolled back.
+        Order.objects.filter(pk=order).update(status=Order.Status.NEW)
+
+    def clear_cache(iteration):
+        # Untimed. The version counters restart too, so the per-process catalog cache misses as well;
+        # tokens are dropped from both caches so no scenario finds one only in the short-lived local copy.
+        cache.clear()
+        local_tokens.clear()
+
+    def set_status(iteration):
+        return as_admin.post(f"/api/orders/{order}/set_status/", {"status": "in_process"}, format="json")
+
+    return [
+        ("product-list", 200, lambda i: anonymous.get("/api/products/")),
+        ("product-list-cold", 200, lambda i: anonymous.get("/api/products/"), clear_cache),
+        ("order-list", 200, lambda i: as_admin.get("/api/orders/")),
+        ("order-create", 201, lambda i: as_customer.post("/api/orders/", order_payload, format="json")),
+        ("order-set-status", 200, set_status, reopen_order),
+        ("report-overview", 200, lambda i: as_admin.get("/api/reports/overview/")),
+        ("report-overview-cold", 200, lambda i: as_admin.get("/api/reports/overview/"), clear_cache),
+        ("login", 200, lambda i: anonymous.post("/api/auth/login/", credentials, format="json")),
+    ]
+
+
+def _measure(name, expected_status, request, setup=None, *, iterations):
+    if setup:
+        setup(-1)
+    request(-1)  # warm up
+    timings, queries = [], 0
+    for iteration in range(iterations):
+        if setup:
+            setup(iteration)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request(iteration)
+            timings.append(time.perf_counter() - start)
+        if response.status_code != expected_status:
+            raise BenchmarkError(f"{name}: respuesta {response.status_code}, se esperaba {expected_status}.")
+        queries = max(queries, len(captured))
+    return Result(
+        name,
+        iterations,
+        percentile(timings, 0.50),
+        percentile(timings, 0.95),
+        percentile(timings, 0.99),
+        queries,
+    )
+
+
+def run(iterations=30, only=None):
+    rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": {}}
+    caches = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"}}
+    results = []
+    allowed_hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+    with override_settings(
+        CACHES=caches, REST_FRAMEWORK=rest_framework, NTFY_TOPIC=None, ALLOWED_HOSTS=allowed_hosts
+    ):
+        try:
+            with transaction.atomic():
+                for name, expected_status, *steps in _scenarios():
+                    if only and name not in only:
+                        continue
+                    results.append(_measure(name, expected_status, *steps, iterations=iterations))
+                raise _Rollback
+        except _Rollback:
+            pass
+    return results
+
+
+def _read_paths():
+    paths = ["/api/products/", "/api/orders/", "/api/reports/overview/"]
+    product = Product.objects.order_by("pk").values_list("pk", flat=True).first()
+    order = Order.objects.order_by("-order_date", "-id").values_list("pk", flat=True).first()
+    if product:
+        paths.append(f"/api/products/{product}/")
+    if order:
+        paths.append(f"/api/orders/{order}/")
+    return paths
+
+
+def _shares(total, workers):
+    return [total // workers + (1 if n < total % workers else 0) for n in range(workers)]
+
+
+def _check_status(path, response):
+    if response.status_code != 200:
+        raise BenchmarkError(f"{path}: respuesta {response.status_code}, se esperaba 200.")
+
+
+def _wsgi_throughput(paths, headers, concurrency, total):
+    def worker(count):
+        client = Client()
+        try:
+            for n in range(count):
+                path = paths[n % len(paths)]
+                _check_status(path, client.get(path, headers=headers))
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, _shares(total, concurrency)))
+    return Throughput("wsgi", total, time.perf_counter() - start)
+
+
+def _asgi_throughput(paths, headers, concurrency, total):
+    async def worker(count):
+        client = AsyncClient()
+        for n in range(count):
+            # Like ASGIHandler, give every request its own thread-sensitive context.
+            path = paths[n % len(paths)]
+            async with ThreadSensitiveContext():
+                _check_status(path, await client.get(path, headers=headers))
+
+    async def main():
+        await asyncio.gather(*(worker(count) for count in _shares(total, concurrency)))
+
+    start = time.perf_counter()
+    with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+        asyncio.run(main())
+    return Throughput("asgi", total, time.perf_counter() - start)
+
+
+def compare_throughput(concurrency=16, requests=400):
+    """
+    Requests per second for a mix of the read paths, through WSGI and ASGI.
+
+    The clients run in other threads, so this needs committed data: a
+    temporary admin is created for the run and deleted afterwards.
+    """
+    admin = User.objects.create_user(
+        email="benchmark-throughput@example.com",
+        password=None,
+        username="benchmark-throughput",
+        role=User.Role.ADMIN,
+    )
+    try:
+        headers = {"Authorization": f"Token {issue_token(admin).key}"}
+        paths = _read_paths()
+        allowed_hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        with override_settings(ALLOWED_HOSTS=allowed_hosts, NTFY_TOPIC=None):
+            for run_throughput in (_wsgi_throughput, _asgi_throughput):
+                run_throughput(paths, headers, concurrency, len(paths))  # warm up
+            return [
+                _wsgi_throughput(paths, headers, concurrency, requests),
+                _asgi_throughput(paths, headers, concurrency, requests),
+            ]
+    finally:
+        admin.delete()
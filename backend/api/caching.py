@@ -0,0 +1,136 @@
+"""
+Version counters stored in Django's cache framework.
+
+Each counter names a generation of some derived data (the report
+overview, for example). Writers bump it after their transaction commits
+and readers key their cached payloads and ETags by it, so stale entries
+are simply never read again. Counters start from the current time so a
+counter evicted from the cache can never come back with an old value.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+REPORT_VERSION_KEY = "api:reports:version"
+CATALOG_VERSION_KEY = "api:catalog:version"
+CATALOG_DELETED_AT_KEY = "api:catalog:deleted_at"
+
+
+def get_version(key: str) -> int:
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(key: str) -> int:
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def get_report_version() -> int:
+    return get_version(REPORT_VERSION_KEY)
+
+
+async def aget_report_version() -> int:
+    return await aget_version(REPORT_VERSION_KEY)
+
+
+def bump_report_version() -> None:
+    bump_version(REPORT_VERSION_KEY)
+
+
+def get_catalog_version() -> int:
+    return get_version(CATALOG_VERSION_KEY)
+
+
+async def aget_catalog_version() -> int:
+    return await aget_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version() -> None:
+    bump_version(CATALOG_VERSION_KEY)
+
+
+class VersionedLRUCache:
+    """
+    Small per-process LRU of rendered payloads for one version of some data.
+
+    Entries are dropped as soon as a lookup sees a different version. The
+    version must be something every worker reads from the same place, such
+    as the database state the response is validated against.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._entries.clear()
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, version, key, value) -> None:
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version = None
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+catalog_cache = VersionedLRUCache(maxsize=settings.CATALOG_CACHE_SIZE)
+
+
+def mark_catalog_deletion() -> None:
+    """Remember when a product was last deleted, for the catalog Last-Modified."""
+    transaction.on_commit(lambda: cache.set(CATALOG_DELETED_AT_KEY, time.time(), timeout=None))
+
+
+def get_catalog_deleted_at():
+    return cache.get(CATALOG_DELETED_AT_KEY)
+
+
+async def aget_catalog_deleted_at():
+    return await cache.aget(CATALOG_DELETED_AT_KEY)
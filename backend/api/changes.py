@@ -0,0 +1,119 @@
+"""
+Delta sync for clients that keep a local copy of their orders.
+
+Every order write refreshes ``Order.updated_at`` and every deletion leaves
+an ``OrderTombstone``. ``order_changes`` pages through both in
+``(timestamp, id)`` order after a cursor, so a refresh reads a few index
+entries instead of the whole history.
+
+``updated_at`` is stamped when a row is written, not when its transaction
+commits, so a slow transaction can commit a timestamp older than a cursor
+already handed out. The last page therefore never moves the cursor past
+``ORDER_CHANGES_SETTLE_SECONDS`` ago: recent changes are sent again on the
+next call, and clients apply them idempotently by id. Tombstones are kept
+for ``ORDER_TOMBSTONE_RETENTION_DAYS``; older cursors must resync from
+scratch.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Order, OrderTombstone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+# Largest primary key the database can store (a signed 64-bit integer).
+MAX_ID = 2**63 - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class ExpiredCursor(ValueError):
+    pass
+
+
+class Changes(NamedTuple):
+    orders: list
+    deleted: list
+    cursor: str
+    has_more: bool
+
+
+def encode_cursor(moment, pk) -> str:
+    return f"{(moment - EPOCH) // MICROSECOND}-{pk}"
+
+
+def decode_cursor(cursor: str):
+    parts = cursor.split("-")
+    if len(parts) != 2 or not all(part.isascii() and part.isdigit() for part in parts):
+        raise InvalidCursor(cursor)
+    micros, pk = (int(part) for part in parts)
+    if pk > MAX_ID:
+        raise InvalidCursor(cursor)
+    try:
+        return EPOCH + micros * MICROSECOND, pk
+    except OverflowError as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def record_deletion(order) -> None:
+    now = timezone.now()
+    OrderTombstone.objects.update_or_create(
+        order_id=order.pk, defaults={"customer_id": order.customer_id, "deleted_at": now}
+    )
+    cutoff = now - timedelta(days=settings.ORDER_TOMBSTONE_RETENTION_DAYS)
+    OrderTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+
+
+def touch_order(order_id) -> None:
+    Order.objects.filter(pk=order_id).update(updated_at=timezone.now())
+
+
+def _after(queryset, time_field, id_field, position):
+    if position is None:
+        return queryset
+    moment, pk = position
+    return queryset.filter(Q(**{f"{time_field}__gt": moment}) | Q(**{time_field: moment, f"{id_field}__gt": pk}))
+
+
+def order_changes(orders, customer_id, cursor=None, limit=100) -> Changes:
+    """
+    Orders from ``orders`` written after ``cursor``, and the ids of orders
+    deleted since, oldest first. ``customer_id`` restricts the tombstones
+    to one customer; ``None`` returns all of them.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    now = timezone.now()
+    if position and position[0] < now - timedelta(days=settings.ORDER_TOMBSTONE_RETENTION_DAYS):
+        raise ExpiredCursor(cursor)
+
+    changed = _after(orders, "updated_at", "id", position).order_by("updated_at", "id")[: limit + 1]
+    tombstones = OrderTombstone.objects.all()
+    if customer_id is not None:
+        tombstones = tombstones.filter(customer_id=customer_id)
+    tombstones = _after(tombstones, "deleted_at", "order_id", position).order_by("deleted_at", "order_id")
+    entries = sorted(
+        [((order.updated_at, order.pk), order) for order in changed]
+        + [((deleted_at, pk), pk) for pk, deleted_at in tombstones.values_list("order_id", "deleted_at")[: limit + 1]],
+        key=lambda entry: entry[0],
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    last = entries[-1][0] if entries else position
+    if not has_more:
+        settled = (now - timedelta(seconds=settings.ORDER_CHANGES_SETTLE_SECONDS), 0)
+        last = min(last, settled) if last else settled
+        if position:
+            last = max(last, position)
+    return Changes(
+        orders=[value for _, value in entries if isinstance(value, Order)],
+        deleted=[value for _, value in entries if not isinstance(value, Order)],
+        cursor=encode_cursor(*last),
+        has_more=has_more,
+    )
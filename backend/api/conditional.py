@@ -0,0 +1,37 @@
+"""
+Conditional GET helpers shared by the sync and async read views.
+
+A view describes the state it would render as a ``validator`` (any value
+with a stable ``repr``) and an optional last-modified time. When the
+client already holds that state it gets a 304 before any work is done.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def evaluate(request, validator, last_modified):
+    """Return ``(etag, timestamp, not_modified)``, where ``not_modified`` is a 304 or ``None``."""
+    etag = quote_etag(hashlib.md5(repr(validator).encode("utf-8")).hexdigest())
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return etag, timestamp, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def add_validators(response, etag, timestamp):
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        response["Cache-Control"] = "no-cache"
+    return response
+
+
+def conditional_response(request, validator, last_modified, build_response):
+    """
+    Answer a conditional GET with a 304 before doing any work, otherwise
+    build the response and attach the validators to it.
+    """
+    etag, timestamp, not_modified = evaluate(request, validator, last_modified)
+    response = not_modified if not_modified is not None else build_response()
+    return add_validators(response, etag, timestamp)
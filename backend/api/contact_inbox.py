@@ -0,0 +1,185 @@
+"""
+Buffered ingestion for public contact messages.
+
+``POST /api/contact/`` is anonymous, so a bot can submit thousands of
+messages a minute. Rather than one INSERT transaction per request,
+submissions go into an in-process buffer that is written with
+``bulk_create`` once ``CONTACT_BUFFER_SIZE`` messages are waiting (by the
+request that fills it) or every ``CONTACT_FLUSH_INTERVAL`` seconds (by a
+background thread). A message identical to one the same sender submitted
+in the last ``CONTACT_DEDUP_WINDOW`` seconds is dropped; its content hash
+is claimed with ``cache.add``, so the check holds across workers. A
+message turned away because the buffer is full claims nothing, so the
+sender can submit it again; the view answers it with 503 and
+``Retry-After``. ``created_at`` is the time of submission, not
+of the flush.
+
+The buffer holds at most ``CONTACT_MAX_PENDING`` messages, including those
+kept after a failed write. It is flushed when the process exits cleanly.
+Messages still buffered when a worker is killed outright are lost.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from .models import ContactMessage, User
+
+logger = logging.getLogger(__name__)
+
+DEDUP_KEY = "api:contact:seen:{}"
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+FULL = "full"
+
+
+def content_hash(sender: str, message: str) -> str:
+    normalized = " ".join(message.split()).casefold()
+    return hashlib.sha256(f"{sender}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class ContactBuffer:
+    def __init__(
+        self,
+        *,
+        max_batch: int = 50,
+        flush_interval: Optional[float] = 2.0,
+        dedup_window: int = 600,
+        max_pending: int = 5000,
+    ):
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.dedup_window = dedup_window
+        self.max_pending = max_pending
+        self.written = 0
+        self.duplicates = 0
+        self.dropped = 0
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_batch=settings.CONTACT_BUFFER_SIZE,
+            flush_interval=settings.CONTACT_FLUSH_INTERVAL,
+            dedup_window=settings.CONTACT_DEDUP_WINDOW,
+            max_pending=settings.CONTACT_MAX_PENDING,
+        )
+
+    def submit(self, message: str, *, sender: str, customer_id=None) -> str:
+        """Buffer ``message`` and return ``ACCEPTED``, ``DUPLICATE`` or ``FULL``."""
+        submitted_at = timezone.now()
+        if self._is_full():
+            self._drop()
+            return FULL
+        key = DEDUP_KEY.format(content_hash(sender, message)) if self.dedup_window else None
+        if key and not cache.add(key, True, timeout=self.dedup_window):
+            with self._lock:
+                self.duplicates += 1
+            return DUPLICATE
+        with self._lock:
+            # Another request may have filled the buffer while the key was being claimed.
+            accepted = len(self._pending) < self.max_pending
+            if accepted:
+                self._pending.append(ContactMessage(customer_id=customer_id, message=message, created_at=submitted_at))
+                full = len(self._pending) >= self.max_batch or self._stopping.is_set()
+        if not accepted:
+            if key:
+                cache.delete(key)
+            self._drop()
+            return FULL
+        if full:
+            self.flush()
+        else:
+            self._start()
+        return ACCEPTED
+
+    def flush(self) -> int:
+        """Write everything buffered so far and return how many rows were inserted."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            self._forget_deleted_senders(batch)
+            try:
+                ContactMessage.objects.bulk_create(batch, batch_size=self.max_batch)
+            except DatabaseError:
+                logger.exception("Could not write %d contact messages; keeping them buffered", len(batch))
+                with self._lock:
+                    self._pending[:0] = batch
+                    overflow = len(self._pending) - self.max_pending
+                    if overflow > 0:
+                        # The newest go, as they would have been turned away had the write not failed.
+                        del self._pending[-overflow:]
+                        self.dropped += overflow
+                        logger.warning("Contact buffer is full; dropping %d messages", overflow)
+                return 0
+            with self._lock:
+                self.written += len(batch)
+            return len(batch)
+
+    def _is_full(self) -> bool:
+        with self._lock:
+            return len(self._pending) >= self.max_pending
+
+    def _drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+        logger.warning("Contact buffer is full; dropping a message")
+
+    @staticmethod
+    def _forget_deleted_senders(batch) -> None:
+        # A customer deleted since submitting would fail the whole insert; keep the message without them.
+        customer_ids = {message.customer_id for message in batch if message.customer_id is not None}
+        if not customer_ids:
+            return
+        existing = set(User.objects.filter(pk__in=customer_ids).values_list("pk", flat=True))
+        for message in batch:
+            if message.customer_id not in existing:
+                message.customer_id = None
+
+    def shutdown(self, timeout: float = 10) -> None:
+        """Stop the flush thread and write whatever is still buffered."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _start(self) -> None:
+        if self.flush_interval is None:
+            return
+        with self._lock:
+            if self._thread is not None or self._stopping.is_set():
+                return
+            self._thread = threading.Thread(target=self._run, name="contact-buffer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            if self.flush():
+                connection.close()
+
+
+_buffer: Optional[ContactBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> ContactBuffer:
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ContactBuffer.from_settings()
+            atexit.register(_buffer.shutdown)
+        return _buffer
@@ -0,0 +1,81 @@
+"""
+Customer directory: prefix search plus per-customer order statistics.
+
+Prefix search uses ``istartswith`` on email, first and last name. Django
+cannot declare indexes that serve case-insensitive ``LIKE 'abc%'`` on both
+backends, so they are created here: ``upper(column) text_pattern_ops`` on
+PostgreSQL and ``column COLLATE NOCASE`` on SQLite. Like the product
+search index, SQLite table rebuilds drop them and
+``manage.py rebuild_search_index`` puts them back.
+
+The statistics cover the customer's whole history, archived orders
+included. They are correlated subqueries over the ``(customer, -order_date)``
+indexes of both order tables, so a page of customers costs one query
+however long their order histories are.
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import ArchivedOrder, Order, User
+
+PREFIX_COLUMNS = ("email", "first_name", "last_name")
+
+SQLITE_INSTALL = [
+    f"CREATE INDEX IF NOT EXISTS api_user_{column}_prefix_idx ON api_user ({column} COLLATE NOCASE)"
+    for column in PREFIX_COLUMNS
+]
+
+POSTGRES_INSTALL = [
+    f"CREATE INDEX IF NOT EXISTS api_user_{column}_prefix_idx ON api_user (upper({column}) text_pattern_ops)"
+    for column in PREFIX_COLUMNS
+]
+
+UNINSTALL = [f"DROP INDEX IF EXISTS api_user_{column}_prefix_idx" for column in PREFIX_COLUMNS]
+
+
+def install_indexes(conn=connection):
+    statements = {"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_indexes(conn=connection):
+    if conn.vendor not in ("sqlite", "postgresql"):
+        return
+    with conn.cursor() as cursor:
+        for statement in UNINSTALL:
+            cursor.execute(statement)
+
+
+def _order_stat(model, aggregate, output_field, default):
+    orders = model.objects.filter(customer=OuterRef("pk")).order_by().values("customer")
+    value = Subquery(orders.annotate(value=aggregate).values("value"), output_field=output_field)
+    return Coalesce(value, Value(default), output_field=output_field)
+
+
+def _last_order_date(model):
+    return Subquery(model.objects.filter(customer=OuterRef("pk")).order_by("-order_date").values("order_date")[:1])
+
+
+def customer_directory(search=None):
+    """Customers annotated with ``order_count``, ``lifetime_spend`` and ``last_order_date``."""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    count = IntegerField()
+    zero = Decimal("0.00")
+    active, archived = _last_order_date(Order), _last_order_date(ArchivedOrder)
+    customers = User.objects.filter(role=User.Role.CUSTOMER).annotate(
+        order_count=_order_stat(Order, Count("pk"), count, 0) + _order_stat(ArchivedOrder, Count("pk"), count, 0),
+        lifetime_spend=_order_stat(Order, Sum("total_amount"), money, zero)
+        + _order_stat(ArchivedOrder, Sum("total_amount"), money, zero),
+        # GREATEST returns NULL on SQLite when either side is NULL, so each side falls back to the other.
+        last_order_date=Greatest(Coalesce(active, archived), Coalesce(archived, active)),
+    )
+    for term in (search or "").split():
+        customers = customers.filter(
+            Q(email__istartswith=term) | Q(first_name__istartswith=term) | Q(last_name__istartswith=term)
+        )
+    return customers
@@ -0,0 +1,213 @@
+"""
+Order events for the Server-Sent Events stream.
+
+Order signals publish ``order.created`` and ``order.status_changed`` once
+the writing transaction commits. A broker fans every event out to the
+streams open in this process; ``ORDER_EVENTS_BROKER`` selects it.
+``LocalBroker`` only reaches streams of the process that made the change.
+``PostgresBroker`` relays events through ``LISTEN``/``NOTIFY`` so every
+worker sees the events of the others, at the cost of one listening
+connection per worker.
+
+Subscribers that fall ``ORDER_EVENTS_QUEUE_SIZE`` events behind are cut
+off; like any client that reconnects, they reload the order list and
+continue from there.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection, connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TICKET_SALT = "api.events.ticket"
+
+CREATED = "order.created"
+STATUS_CHANGED = "order.status_changed"
+
+# Queued in place of further events once a subscriber has fallen behind.
+OVERFLOW = None
+
+
+class OrderEvent(NamedTuple):
+    kind: str
+    order: int
+    customer: int
+    status: str
+    previous_status: Optional[str] = None
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict())
+
+    @classmethod
+    def from_json(cls, payload: str) -> "OrderEvent":
+        return cls(**json.loads(payload))
+
+    def as_sse(self) -> str:
+        data = {"id": self.order, "customer": self.customer, "status": self.status}
+        if self.kind == STATUS_CHANGED:
+            data["previous_status"] = self.previous_status
+        return f"event: {self.kind}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    """Events for one stream, queued on the event loop that reads them."""
+
+    def __init__(self, broker, customer=None, maxsize=100):
+        self.broker = broker
+        self.customer = customer
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+        self._overflowed = False
+
+    def wants(self, event: OrderEvent) -> bool:
+        return self.customer is None or event.customer == self.customer
+
+    def put(self, event: OrderEvent) -> None:
+        """Queue ``event`` from any thread."""
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # the loop is closed; the stream is gone
+            self.close()
+
+    def _put(self, event):
+        if self._overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._overflowed = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(OVERFLOW)
+
+    async def get(self, timeout=None):
+        """The next event, ``OVERFLOW`` when the subscriber fell behind, or ``TimeoutError``."""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event: OrderEvent) -> None:
+        self.deliver(event)
+
+    def deliver(self, event: OrderEvent) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.put(event)
+
+    def subscribe(self, customer=None) -> Subscription:
+        """Subscribe the running event loop to every event, or to one customer's."""
+        subscription = Subscription(self, customer, self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+
+class PostgresBroker(LocalBroker):
+    """Share events between workers through PostgreSQL ``NOTIFY``."""
+
+    channel = "api_order_events"
+    reconnect_delay = 1.0
+
+    def __init__(self, queue_size: int = 100):
+        super().__init__(queue_size)
+        self._listener = None
+
+    def publish(self, event: OrderEvent) -> None:
+        # Local streams get the event back through the listener, like every other worker.
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, event.to_json()])
+
+    def subscribe(self, customer=None) -> Subscription:
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="order-events-listener", daemon=True)
+                self._listener.start()
+        return super().subscribe(customer)
+
+    def _listen(self) -> None:
+        while True:
+            wrapper = connections.create_connection("default")
+            try:
+                wrapper.ensure_connection()
+                raw = wrapper.connection
+                with raw.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([raw], [], [], 30)[0]:
+                        raw.poll()
+                        while raw.notifies:
+                            self.deliver(OrderEvent.from_json(raw.notifies.pop(0).payload))
+            except Exception:
+                logger.exception("Order event listener lost its connection; reconnecting")
+            finally:
+                wrapper.close()
+            time.sleep(self.reconnect_delay)
+
+
+_broker: Optional[LocalBroker] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> LocalBroker:
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.ORDER_EVENTS_BROKER)(queue_size=settings.ORDER_EVENTS_QUEUE_SIZE)
+        return _broker
+
+
+def issue_ticket(user) -> str:
+    """A short-lived stream credential: ``EventSource`` cannot send an Authorization header."""
+    return signing.dumps(user.pk, salt=TICKET_SALT)
+
+
+def ticket_user_id(ticket: str):
+    try:
+        return signing.loads(ticket, salt=TICKET_SALT, max_age=settings.ORDER_EVENTS_TICKET_TTL)
+    except signing.BadSignature:
+        return None
+
+
+def publish_on_commit(event: OrderEvent) -> None:
+    def publish():
+        try:
+            get_broker().publish(event)
+        except Exception:
+            logger.exception("Could not publish %s for order %s", event.kind, event.order)
+
+    transaction.on_commit(publish)
+
+
+def order_saved(order, created, previous_status) -> None:
+    if created:
+        publish_on_commit(OrderEvent(CREATED, order.pk, order.customer_id, order.status))
+    elif previous_status is not None and previous_status != order.status:
+        publish_on_commit(OrderEvent(STATUS_CHANGED, order.pk, order.customer_id, order.status, previous_status))
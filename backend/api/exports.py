@@ -0,0 +1,149 @@
+"""
+Streaming exports of orders and their items for accounting.
+
+Orders are read with ``QuerySet.iterator(chunk_size=...)`` and items are
+prefetched one chunk at a time, so memory use does not grow with the size
+of the export. The output is produced as a generator of text blocks that
+can feed a ``StreamingHttpResponse`` or be written to a file.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+CHUNK_SIZE = 500
+BLOCK_SIZE = 64 * 1024
+
+CSV_COLUMNS = [
+    "order_id",
+    "order_date",
+    "delivery_date",
+    "status",
+    "customer_email",
+    "customer_name",
+    "order_total",
+    "item_id",
+    "product_id",
+    "product_name",
+    "quantity",
+    "unit_price",
+    "subtotal",
+    "personalization",
+]
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(start=None, end=None, status=None):
+    """Orders whose local order day falls in ``[start, end]``, oldest first."""
+    items = OrderItem.objects.select_related("product").only(
+        "id", "order_id", "product_id", "product__name", "quantity", "unit_price", "personalization"
+    ).order_by("pk")
+    orders = Order.objects.select_related("customer").prefetch_related(Prefetch("items", queryset=items))
+    if start:
+        orders = orders.filter(order_date__gte=_day_start(start))
+    if end:
+        orders = orders.filter(order_date__lt=_day_start(end + timedelta(days=1)))
+    if status:
+        orders = orders.filter(status=status)
+    return orders.order_by("order_date", "id")
+
+
+def _customer_name(customer):
+    return customer.get_full_name().strip()
+
+
+def _csv_rows(orders):
+    for order in orders.iterator(chunk_size=CHUNK_SIZE):
+        head = [
+            order.pk,
+            order.order_date.isoformat(),
+            order.delivery_date.isoformat() if order.delivery_date else "",
+            order.status,
+            order.customer.email,
+            _customer_name(order.customer),
+            order.total_amount,
+        ]
+        items = order.items.all()
+        if not items:
+            yield head + [""] * (len(CSV_COLUMNS) - len(head))
+        for item in items:
+            yield head + [
+                item.pk,
+                item.product_id,
+                item.product.name,
+                item.quantity,
+                item.unit_price,
+                item.subtotal,
+                item.personalization,
+            ]
+
+
+def _ndjson_records(orders):
+    for order in orders.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            "id": order.pk,
+            "order_date": order.order_date,
+            "delivery_date": order.delivery_date,
+            "status": order.status,
+            "customer": {
+                "id": order.customer_id,
+                "email": order.customer.email,
+                "name": _customer_name(order.customer),
+            },
+            "notes": order.notes,
+            "total": order.total_amount,
+            "items": [
+                {
+                    "id": item.pk,
+                    "product": item.product_id,
+                    "product_name": item.product.name,
+                    "quantity": item.quantity,
+                    "unit_price": item.unit_price,
+                    "subtotal": item.subtotal,
+                    "personalization": item.personalization,
+                }
+                for item in order.items.all()
+            ],
+        }
+
+
+def _lines(orders, file_format):
+    if file_format == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(CSV_COLUMNS)
+        for row in _csv_rows(orders):
+            yield writer.writerow(row)
+    else:
+        for record in _ndjson_records(orders):
+            yield json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def stream_orders(orders, file_format):
+    """Yield the export in blocks of roughly ``BLOCK_SIZE`` characters."""
+    block, size = [], 0
+    for line in _lines(orders, file_format):
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield "".join(block)
+            block, size = [], 0
+    if block:
+        yield "".join(block)
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from .caching import bump_catalog_version
+from .models import Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, products):
+        self.products = products
+        super().__init__(", ".join(product.name for product in products))
+
+
+def adjust_stock(changes):
+    """
+    Take (positive) or return (negative) units of stock per product id.
+
+    The rows are locked in primary-key order and then changed by a single
+    conditional ``UPDATE ... SET stock = stock - n WHERE stock >= n``, so
+    parallel orders for the same products neither oversell nor deadlock.
+    Raises ``InsufficientStock`` and leaves every row untouched when any
+    product cannot cover its quantity.
+    """
+    changes = {product_id: quantity for product_id, quantity in changes.items() if quantity}
+    if not changes:
+        return
+    amount = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in changes.items()],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        products = Product.objects.filter(pk__in=changes)
+        list(products.select_for_update().order_by("pk").values_list("pk", flat=True))
+        updated = products.filter(stock__gte=amount).update(stock=F("stock") - amount, updated_at=Now())
+        if updated != len(changes):
+            raise InsufficientStock(list(products.filter(stock__lt=amount).order_by("name")))
+    bump_catalog_version()
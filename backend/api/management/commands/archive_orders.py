@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve los pedidos completados mas antiguos que N meses, con sus productos, a las tablas de "
+        "archivo. Trabaja por lotes y puede interrumpirse y volver a ejecutarse."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=settings.ORDER_ARCHIVE_AFTER_MONTHS,
+            help="Antiguedad minima en meses (por defecto ORDER_ARCHIVE_AFTER_MONTHS).",
+        )
+        parser.add_argument("--batch-size", type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, help="Detenerse tras este numero de lotes.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo contar los pedidos a archivar.")
+        parser.add_argument(
+            "--measure",
+            action="store_true",
+            help="Medir tamano de las tablas y tiempos de consultas antes y despues.",
+        )
+
+    def handle(self, *args, **options):
+        if options["months"] < 0:
+            raise CommandError("--months no puede ser negativo.")
+        if options["batch_size"] < 1 or (options["max_batches"] is not None and options["max_batches"] < 1):
+            raise CommandError("El tamano de lote y el numero de lotes deben ser positivos.")
+        before = archive.cutoff(options["months"])
+        if options["dry_run"]:
+            pending = archive.archivable(before).count()
+            self.stdout.write(f"{pending} pedidos completados anteriores a {before:%Y-%m-%d} por archivar.")
+            return
+
+        if options["measure"]:
+            sizes, timings = archive.table_sizes(), archive.time_hot_queries()
+
+        archived = batches = 0
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            moved = archive.archive_batch(before, options["batch_size"])
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Lote {batches}: {moved} pedidos archivados.")
+
+        remaining = archive.archivable(before).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{archived} pedidos archivados en {batches} lotes; quedan {remaining} por archivar."
+            )
+        )
+        if options["measure"]:
+            self._report(sizes, archive.table_sizes(), timings, archive.time_hot_queries())
+
+    def _report(self, sizes_before, sizes_after, timings_before, timings_after):
+        self.stdout.write(
+            f"{'tabla':<24} {'filas antes':>12} {'filas despues':>14} {'bytes antes':>12} {'bytes despues':>14}"
+        )
+        for table, (rows, size) in sizes_before.items():
+            rows_after, size_after = sizes_after[table]
+            self.stdout.write(
+                f"{table:<24} {rows:>12} {rows_after:>14} {_bytes(size):>12} {_bytes(size_after):>14}"
+            )
+        self.stdout.write(f"{'consulta':<24} {'ms antes':>12} {'ms despues':>14}")
+        for name, elapsed in timings_before.items():
+            self.stdout.write(f"{name:<24} {elapsed:>12.2f} {timings_after[name]:>14.2f}")
+
+
+def _bytes(size):
+    return "-" if size is None else str(size)
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide latencia (p50/p95/p99) y consultas de los endpoints principales y falla si se "
+        "excede el presupuesto guardado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--only", nargs="+", help="Escenarios a ejecutar, por ejemplo order-list login.")
+        parser.add_argument("--budgets", default=str(benchmarks.BUDGETS_PATH))
+        parser.add_argument(
+            "--update-budgets", action="store_true", help="Guarda los resultados como nuevo presupuesto."
+        )
+        parser.add_argument(
+            "--throughput",
+            action="store_true",
+            help="Compara peticiones por segundo de las lecturas bajo WSGI y ASGI en lugar del presupuesto.",
+        )
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--requests", type=int, default=400)
+
+    def handle(self, *args, **options):
+        if options["throughput"]:
+            return self._throughput(options)
+        if options["iterations"] < 1:
+            raise CommandError("Se necesita al menos una iteracion.")
+        try:
+            results = benchmarks.run(options["iterations"], only=options["only"])
+        except benchmarks.BenchmarkError as exc:
+            raise CommandError(str(exc)) from exc
+
+        self.stdout.write(f"{'escenario':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'consultas':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result.name:<22} {result.p50 * 1000:>9.1f} {result.p95 * 1000:>9.1f} "
+                f"{result.p99 * 1000:>9.1f} {result.queries:>10}"
+            )
+
+        if options["update_budgets"]:
+            benchmarks.save_budgets(results, options["budgets"])
+            self.stdout.write(self.style.SUCCESS(f"Presupuesto guardado en {options['budgets']}."))
+            return
+
+        failures = benchmarks.check_budgets(results, benchmarks.load_budgets(options["budgets"]))
+        if failures:
+            raise CommandError("Presupuesto excedido:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("Todos los escenarios estan dentro del presupuesto."))
+
+    def _throughput(self, options):
+        if options["concurrency"] < 1 or options["requests"] < 1:
+            raise CommandError("La concurrencia y el numero de peticiones deben ser positivos.")
+        try:
+            results = benchmarks.compare_throughput(options["concurrency"], options["requests"])
+        except benchmarks.BenchmarkError as exc:
+            raise CommandError(str(exc)) from exc
+
+        self.stdout.write(f"{'handler':<8} {'peticiones':>10} {'segundos':>9} {'pet/s':>9}")
+        for result in results:
+            self.stdout.write(
+                f"{result.handler:<8} {result.requests:>10} {result.seconds:>9.2f} {result.per_second:>9.1f}"
+            )
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api import exports
+from api.models import Order
+
+
+def _date(value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f"Fecha invalida: {value}. Use el formato AAAA-MM-DD.")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Exporta pedidos y sus productos en CSV o NDJSON sin cargarlos todos en memoria."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", dest="file_format", choices=sorted(exports.FORMATS), default="csv")
+        parser.add_argument("--from", dest="start", type=_date, help="Primer dia incluido (AAAA-MM-DD).")
+        parser.add_argument("--to", dest="end", type=_date, help="Ultimo dia incluido (AAAA-MM-DD).")
+        parser.add_argument("--status", choices=[value for value, _ in Order.Status.choices])
+        parser.add_argument("--output", help="Archivo de salida; por defecto la salida estandar.")
+
+    def handle(self, *args, **options):
+        orders = exports.export_queryset(
+            start=options["start"], end=options["end"], status=options["status"]
+        )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as target:
+                for block in exports.stream_orders(orders, options["file_format"]):
+                    target.write(block)
+            self.stderr.write(self.style.SUCCESS(f"Exportacion escrita en {options['output']}."))
+        else:
+            for block in exports.stream_orders(orders, options["file_format"]):
+                sys.stdout.write(block)
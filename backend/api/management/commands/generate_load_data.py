@@ -0,0 +1,174 @@
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api import rollups
+from api.caching import bump_catalog_version, bump_report_version
+from api.models import Order, OrderItem, Product, User
+
+
+def _month_list(value):
+    try:
+        months = {int(month) for month in value.split(",") if month.strip()}
+    except ValueError as exc:
+        raise CommandError("Los meses pico deben ser numeros separados por comas.") from exc
+    if not months <= set(range(1, 13)):
+        raise CommandError("Los meses pico deben estar entre 1 y 12.")
+    return months
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera clientes, pedidos y productos sinteticos en lotes con bulk_create para probar "
+        "la API con volumenes realistas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=50_000)
+        parser.add_argument("--orders", type=int, default=1_000_000)
+        parser.add_argument("--items-per-order", type=float, default=3.0, help="Promedio de productos por pedido.")
+        parser.add_argument("--products", type=int, default=40, help="Minimo de productos en el catalogo.")
+        parser.add_argument("--days", type=int, default=730, help="Dias de historial hacia atras.")
+        parser.add_argument("--peak-months", type=_month_list, default={2, 5, 12})
+        parser.add_argument(
+            "--seasonality", type=float, default=1.5, help="Demanda extra en los meses pico (1.5 = +150%%)."
+        )
+        parser.add_argument("--weekend-boost", type=float, default=0.4, help="Demanda extra en fin de semana.")
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--email-prefix", default="carga")
+
+    def handle(self, *args, **options):
+        if options["customers"] < 1 and options["orders"]:
+            raise CommandError("Se necesita al menos un cliente para generar pedidos.")
+        if options["items_per_order"] < 1:
+            raise CommandError("El promedio de productos por pedido debe ser al menos 1.")
+        self.random = random.Random(options["seed"])
+        self.batch_size = max(options["batch_size"], 1)
+
+        products = self._ensure_products(options["products"])
+        customers = self._create_customers(options["customers"], options["email_prefix"])
+        if options["orders"] and not customers:
+            customers = list(User.objects.filter(role=User.Role.CUSTOMER).values_list("pk", flat=True))
+        items = self._create_orders(options, customers, products)
+
+        self.stdout.write("Recalculando acumulados diarios...")
+        rollups.rebuild()
+        bump_report_version()
+        bump_catalog_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Se generaron {len(customers)} clientes, {options['orders']} pedidos y {items} productos de pedido."
+            )
+        )
+
+    def _ensure_products(self, minimum):
+        missing = minimum - Product.objects.count()
+        if missing > 0:
+            start = Product.objects.count()
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        name=f"Producto de carga {start + n + 1}",
+                        description="Producto generado para pruebas de carga.",
+                        price=Decimal(self.random.randrange(2_000, 60_000)) / 100,
+                        stock=1_000_000,
+                    )
+                    for n in range(missing)
+                ],
+                batch_size=self.batch_size,
+            )
+        return list(Product.objects.values_list("pk", "price"))
+
+    def _create_customers(self, count, prefix):
+        if count <= 0:
+            return []
+        offset = User.objects.filter(email__startswith=f"{prefix}-").count()
+        password = make_password(None)
+        for start in range(0, count, self.batch_size):
+            User.objects.bulk_create(
+                [
+                    User(
+                        email=f"{prefix}-{offset + n}@example.com",
+                        username=f"{prefix}-{offset + n}",
+                        first_name="Cliente",
+                        last_name=f"{offset + n}",
+                        password=password,
+                        role=User.Role.CUSTOMER,
+                    )
+                    for n in range(start, min(start + self.batch_size, count))
+                ]
+            )
+            self.stdout.write(f"Clientes: {min(start + self.batch_size, count)}/{count}")
+        return list(
+            User.objects.filter(email__startswith=f"{prefix}-").order_by("pk").values_list("pk", flat=True)
+        )[offset:]
+
+    def _day_weights(self, options):
+        today = timezone.localdate()
+        days = [today - timedelta(days=n) for n in range(options["days"])]
+        weights = []
+        for day in days:
+            weight = 1.0
+            if day.month in options["peak_months"]:
+                weight += options["seasonality"]
+            if day.weekday() >= 5:
+                weight += options["weekend_boost"]
+            weights.append(weight)
+        return days, weights
+
+    def _status(self, day, today):
+        age = (today - day).days
+        if age > 3:
+            return Order.Status.COMPLETED if self.random.random() < 0.97 else Order.Status.NEW
+        return self.random.choice([Order.Status.NEW, Order.Status.IN_PROGRESS, Order.Status.COMPLETED])
+
+    def _create_orders(self, options, customers, products):
+        total = options["orders"]
+        if total <= 0:
+            return 0
+        today = timezone.localdate()
+        days, weights = self._day_weights(options)
+        day_weights = list(accumulate(weights))
+        # A few regulars place most of the orders.
+        customer_weights = list(accumulate(1 / (rank + 1) ** 0.6 for rank in range(len(customers))))
+        max_lines = min(len(products), max(1, round(options["items_per_order"] * 2 - 1)))
+        items_created = 0
+
+        for start in range(0, total, self.batch_size):
+            size = min(self.batch_size, total - start)
+            order_days = self.random.choices(days, cum_weights=day_weights, k=size)
+            buyers = self.random.choices(customers, cum_weights=customer_weights, k=size)
+            orders, lines = [], []
+            for day, customer_id in zip(order_days, buyers):
+                moment = time(self.random.randrange(8, 21), self.random.randrange(60))
+                chosen = self.random.sample(products, self.random.randint(1, max_lines))
+                order_lines = [(pk, price, self.random.choice((1, 1, 1, 2, 2, 3, 6, 12))) for pk, price in chosen]
+                orders.append(
+                    Order(
+                        customer_id=customer_id,
+                        status=self._status(day, today),
+                        order_date=timezone.make_aware(datetime.combine(day, moment)),
+                        delivery_date=day + timedelta(days=self.random.randint(1, 7)),
+                        total_amount=sum(price * quantity for _, price, quantity in order_lines),
+                    )
+                )
+                lines.append(order_lines)
+
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                items = [
+                    OrderItem(order_id=order.pk, product_id=pk, quantity=quantity, unit_price=price)
+                    for order, order_lines in zip(orders, lines)
+                    for pk, price, quantity in order_lines
+                ]
+                OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+            items_created += len(items)
+            self.stdout.write(f"Pedidos: {start + size}/{total}")
+        return items_created
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api import directory
+from api.search import install_index
+
+
+class Command(BaseCommand):
+    help = "Crea o repara los indices de busqueda de productos y clientes, y los reconstruye."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            install_index(connection)
+            directory.install_indexes(connection)
+        self.stdout.write(self.style.SUCCESS("Indices de busqueda de productos y clientes listos."))
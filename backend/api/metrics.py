@@ -0,0 +1,174 @@
+"""
+Per-endpoint request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and, through
+``connection.execute_wrapper``, counts its queries and the time spent in
+them. Observations are aggregated in process memory per resolved URL name
+and method, so recording one costs a few additions under a lock. Each
+worker reports its own numbers; Prometheus sums them across scrapes of
+every worker. Queries run while a streaming response is being consumed
+happen after the middleware returns and are not counted.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "seconds", "queries", "sql_seconds", "response_bytes")
+
+    def __init__(self):
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.response_bytes = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, seconds, queries, sql_seconds, response_bytes) -> None:
+        bucket = bisect_left(DURATION_BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get((endpoint, method))
+            if series is None:
+                series = self._series[(endpoint, method)] = _Series()
+            series.buckets[bucket] += 1
+            series.count += 1
+            series.seconds += seconds
+            series.queries += queries
+            series.sql_seconds += sql_seconds
+            series.response_bytes += response_bytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                key: {
+                    "buckets": list(series.buckets),
+                    "count": series.count,
+                    "seconds": series.seconds,
+                    "queries": series.queries,
+                    "sql_seconds": series.sql_seconds,
+                    "response_bytes": series.response_bytes,
+                }
+                for key, series in self._series.items()
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+registry = MetricsRegistry()
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        start = time.perf_counter()
+        # Async ORM calls run on the request's thread-sensitive executor, so the
+        # wrapper goes on that thread's connection.
+        wrapper = await sync_to_async(_install_wrapper)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrapper.__exit__(None, None, None)
+        self._record(request, response, time.perf_counter() - start, timer)
+        return response
+
+    @staticmethod
+    def _record(request, response, seconds, timer):
+        match = getattr(request, "resolver_match", None)
+        endpoint = match.view_name if match else "unresolved"
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(endpoint, request.method, seconds, timer.count, timer.seconds, size)
+
+
+def _install_wrapper(timer):
+    wrapper = connection.execute_wrapper(timer)
+    wrapper.__enter__()
+    return wrapper
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def render(extra_counters=()):
+    """
+    Render the registry, plus ``(name, help, {labels_tuple: value})``
+    counters from elsewhere in the app, in the Prometheus text format.
+    """
+    series = sorted(registry.snapshot().items())
+    lines = [
+        "# HELP api_request_duration_seconds Request latency per endpoint.",
+        "# TYPE api_request_duration_seconds histogram",
+    ]
+    for (endpoint, method), data in series:
+        cumulative = 0
+        for bound, observed in zip(DURATION_BUCKETS + ("+Inf",), data["buckets"]):
+            cumulative += observed
+            labels = _labels(endpoint=endpoint, method=method, le=bound)
+            lines.append(f"api_request_duration_seconds_bucket{labels} {cumulative}")
+        labels = _labels(endpoint=endpoint, method=method)
+        lines.append(f"api_request_duration_seconds_sum{labels} {data['seconds']}")
+        lines.append(f"api_request_duration_seconds_count{labels} {data['count']}")
+
+    for name, help_text, field in (
+        ("api_db_queries_total", "Database queries run while serving requests.", "queries"),
+        ("api_db_query_seconds_total", "Time spent in database queries.", "sql_seconds"),
+        ("api_response_bytes_total", "Bytes of non-streaming response bodies.", "response_bytes"),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for (endpoint, method), data in series:
+            lines.append(f"{name}{_labels(endpoint=endpoint, method=method)} {data[field]}")
+
+    for name, help_text, values in extra_counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{name}{_labels(**dict(labels))} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    Order = apps.get_model("api", "Order")
+    OrderItem = apps.get_model("api", "OrderItem")
+    DailyOrderRollup = apps.get_model("api", "DailyOrderRollup")
+    DailySalesRollup = apps.get_model("api", "DailySalesRollup")
+
+    orders = (
+        Order.objects.annotate(day=TruncDate("order_date"))
+        .values("day", "status")
+        .annotate(order_count=Count("id"))
+        .order_by()
+    )
+    DailyOrderRollup.objects.bulk_create([DailyOrderRollup(**row) for row in orders], batch_size=1000)
+
+    sales = (
+        OrderItem.objects.annotate(day=TruncDate("order__order_date"), order_status=F("order__status"))
+        .values("day", "order_status", "product_id")
+        .annotate(
+            units=Sum("quantity"),
+            sales=Sum(
+                F("quantity") * F("product__price"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        .order_by()
+    )
+    DailySalesRollup.objects.bulk_create(
+        [
+            DailySalesRollup(
+                day=row["day"],
+                status=row["order_status"],
+                product_id=row["product_id"],
+                quantity=row["units"],
+                revenue=row["sales"],
+            )
+            for row in sales
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('new', 'Nuevo'), ('in_process', 'En proceso'), ('completed', 'Completado')], max_length=20)),
+                ('order_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='unique_daily_order_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('new', 'Nuevo'), ('in_process', 'En proceso'), ('completed', 'Completado')], max_length=20)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='api.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'status', 'product'), name='unique_daily_sales_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
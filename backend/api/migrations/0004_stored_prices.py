@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:12
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_prices(apps, schema_editor):
+    Order = apps.get_model("api", "Order")
+    OrderItem = apps.get_model("api", "OrderItem")
+    Product = apps.get_model("api", "Product")
+
+    OrderItem.objects.update(
+        unit_price=Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("price")[:1])
+    )
+    totals = (
+        OrderItem.objects.filter(order_id=OuterRef("pk"))
+        .values("order_id")
+        .annotate(total=Sum(F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=12, decimal_places=2)))
+        .values("total")
+    )
+    Order.objects.update(
+        total_amount=Coalesce(
+            Subquery(totals, output_field=DecimalField(max_digits=12, decimal_places=2)),
+            Value(Decimal("0.00")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from api.search import install_index
+
+    install_index(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from api.search import uninstall_index
+
+    uninstall_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_stored_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install_prefix_indexes(apps, schema_editor):
+    from api.directory import install_indexes
+
+    install_indexes(schema_editor.connection)
+
+
+def uninstall_prefix_indexes(apps, schema_editor):
+    from api.directory import uninstall_indexes
+
+    uninstall_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_prefix_indexes, uninstall_prefix_indexes),
+    ]
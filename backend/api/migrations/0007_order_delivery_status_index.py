@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_customer_directory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['delivery_date', 'status'], name='order_delivery_status_idx'),
+        ),
+    ]
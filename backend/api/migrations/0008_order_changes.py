@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_order_delivery_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField(unique=True)),
+                ('customer_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'updated_at', 'id'], name='order_customer_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordertombstone',
+            index=models.Index(fields=['deleted_at', 'order_id'], name='tombstone_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordertombstone',
+            index=models.Index(fields=['customer_id', 'deleted_at', 'order_id'], name='tombstone_customer_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_order_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contactmessage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F, Sum
 from django.utils import timezone
 
 
@@ -75,6 +76,26 @@ class Order(models.Model):
         IN_PROGRESS = "in_process", "En proceso"
         COMPLETED = "completed", "Completado"
 
+        @property
+        def targets(self):
+            """Statuses an order in this status may move to."""
+            return Order.TRANSITIONS[self]
+
+        @property
+        def sources(self):
+            """Statuses an order may move to this status from."""
+            return tuple(source for source, targets in Order.TRANSITIONS.items() if self in targets)
+
+        def can_become(self, target) -> bool:
+            return target in self.targets
+
+    # Orders only move forward.
+    TRANSITIONS = {
+        Status.NEW: (Status.IN_PROGRESS, Status.COMPLETED),
+        Status.IN_PROGRESS: (Status.COMPLETED,),
+        Status.COMPLETED: (),
+    }
+
     customer = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name="orders", on_delete=models.CASCADE
     )
@@ -82,29 +103,176 @@ class Order(models.Model):
     order_date = models.DateTimeField(default=timezone.now)
     delivery_date = models.DateField(null=True, blank=True)
     notes = models.TextField(blank=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped by every write; transitions, edits and deletes only apply to the version the client saw.
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-order_date", "-id"], name="order_date_id_idx"),
+            models.Index(fields=["customer", "-order_date"], name="order_customer_date_idx"),
+            models.Index(fields=["status", "-order_date"], name="order_status_date_idx"),
+            models.Index(fields=["delivery_date", "status"], name="order_delivery_status_idx"),
+            models.Index(fields=["updated_at", "id"], name="order_updated_id_idx"),
+            models.Index(fields=["customer", "updated_at", "id"], name="order_customer_updated_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version", "updated_at"}
+        super().save(*args, **kwargs)
 
     @property
-    def total(self) -> float:
-        return sum((item.subtotal for item in self.items.all()), Decimal("0.00"))
+    def total(self) -> Decimal:
+        return self.total_amount
+
+    def update_total(self) -> Decimal:
+        """Recompute ``total_amount`` from the stored item prices in a single query."""
+        self.total_amount = self.items.aggregate(
+            total=Sum(
+                F("quantity") * F("unit_price"),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+        )["total"] or Decimal("0.00")
+        self.updated_at = timezone.now()
+        Order.objects.filter(pk=self.pk).update(total_amount=self.total_amount, updated_at=self.updated_at)
+        return self.total_amount
 
     def __str__(self) -> str:
         return f"Pedido #{self.pk} - {self.customer}"
 
 
+class OrderTombstone(models.Model):
+    """A deleted order, kept for a while so clients syncing changes can drop their copy."""
+
+    order_id = models.BigIntegerField(unique=True)
+    # Not a foreign key: the customer may be the row whose deletion removed the order.
+    customer_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deleted_at", "order_id"], name="tombstone_deleted_idx"),
+            models.Index(fields=["customer_id", "deleted_at", "order_id"], name="tombstone_customer_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Pedido #{self.order_id} eliminado"
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name="items", on_delete=models.CASCADE)
     product = models.ForeignKey(Product, related_name="order_items", on_delete=models.PROTECT)
     quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
+    personalization = models.TextField(blank=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.price
+        super().save(*args, **kwargs)
+
+    @property
+    def subtotal(self) -> Decimal:
+        return Decimal(self.quantity) * self.unit_price
+
+    def __str__(self) -> str:
+        return f"{self.product} x{self.quantity}"
+
+
+class ArchivedOrder(models.Model):
+    """A completed order moved out of ``Order`` by ``archive_orders``; keeps its original id."""
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="archived_orders", on_delete=models.CASCADE
+    )
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    order_date = models.DateTimeField()
+    delivery_date = models.DateField(null=True, blank=True)
+    notes = models.TextField(blank=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=1)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-order_date", "-id"], name="archived_order_date_id_idx"),
+            models.Index(fields=["customer", "-order_date"], name="archived_order_customer_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Pedido archivado #{self.pk}"
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name="items", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name="archived_order_items", on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     personalization = models.TextField(blank=True)
 
     @property
-    def subtotal(self) -> float:
-        return Decimal(self.quantity) * self.product.price
+    def subtotal(self) -> Decimal:
+        return Decimal(self.quantity) * self.unit_price
 
     def __str__(self) -> str:
         return f"{self.product} x{self.quantity}"
 
 
+class DailyOrderRollup(models.Model):
+    """Number of orders per local order day and status."""
+
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "status"], name="unique_daily_order_rollup"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} {self.status}: {self.order_count}"
+
+
+class DailySalesRollup(models.Model):
+    """Units sold and revenue per local order day, status and product."""
+
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.Status.choices)
+    product = models.ForeignKey(Product, related_name="daily_sales", on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "status", "product"], name="unique_daily_sales_rollup"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} {self.status} {self.product_id}: {self.quantity}"
+
+
 class ContactMessage(models.Model):
     customer = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -114,7 +282,8 @@ class ContactMessage(models.Model):
         blank=True,
     )
     message = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the message is submitted; it can be written to the table a few seconds later.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self) -> str:
         return f"Mensaje #{self.pk}"
@@ -1,11 +1,48 @@
+import atexit
 import logging
-from typing import Iterable, Optional
+import queue
+import threading
+import time
+from typing import Iterable, NamedTuple, Optional, Tuple
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+_STOP = object()
+
+
+class NtfyMessage(NamedTuple):
+    message: str
+    title: Optional[str] = None
+    tags: Tuple[str, ...] = ()
+    priority: Optional[int] = None
+
+    @property
+    def group_key(self):
+        return (self.title, self.tags, self.priority)
+
+
+def _build_request(notification: NtfyMessage):
+    topic = getattr(settings, "NTFY_TOPIC", None)
+    if not topic:
+        return None
+
+    url = f"{settings.NTFY_SERVER}/{topic}"
+    headers = {}
+
+    if settings.NTFY_TOKEN:
+        headers["Authorization"] = f"Bearer {settings.NTFY_TOKEN}"
+    if notification.title:
+        headers["Title"] = notification.title
+    if notification.tags:
+        headers["Tags"] = ",".join(notification.tags)
+    if notification.priority:
+        headers["Priority"] = str(notification.priority)
+    return url, headers
+
 
 def send_ntfy_message(
     message: str,
@@ -18,31 +55,212 @@ def send_ntfy_message(
     Send a notification to an ntfy topic if it is configured.
 
     The function is a no-op when NTFY_TOPIC is blank so it can be
-    enabled per environment without code changes.
+    enabled per environment without code changes. It blocks until the
+    server answers; request handlers should use ``queue_ntfy_message``.
     """
-    topic = getattr(settings, "NTFY_TOPIC", None)
-    if not topic:
+    notification = NtfyMessage(message, title, tuple(tags or ()), priority)
+    prepared = _build_request(notification)
+    if prepared is None:
         return
-
-    url = f"{settings.NTFY_SERVER}/{topic}"
-    headers = {}
-
-    if settings.NTFY_TOKEN:
-        headers["Authorization"] = f"Bearer {settings.NTFY_TOKEN}"
-    if title:
-        headers["Title"] = title
-    if tags:
-        headers["Tags"] = ",".join(tags)
-    if priority:
-        headers["Priority"] = str(priority)
+    url, headers = prepared
 
     try:
         response = requests.post(
             url,
             data=message.encode("utf-8"),
             headers=headers,
-            timeout=5,
+            timeout=settings.NTFY_TIMEOUT,
         )
         response.raise_for_status()
     except requests.RequestException as exc:
         logger.warning("Failed to send ntfy notification: %s", exc)
+
+
+class NtfyDispatcher:
+    """
+    Background sender for ntfy notifications.
+
+    Requests only enqueue messages; a small pool of worker threads posts
+    them over a shared keep-alive session. Messages that arrive within
+    ``coalesce_window`` seconds of each other and share title, tags and
+    priority are joined into a single notification. When the queue is
+    full new messages are dropped and counted instead of blocking the
+    caller.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int = 2,
+        max_queue: int = 1000,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        coalesce_window: float = 1.0,
+        max_batch: int = 20,
+        timeout: float = 5,
+    ):
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            workers=settings.NTFY_WORKERS,
+            max_queue=settings.NTFY_QUEUE_SIZE,
+            max_retries=settings.NTFY_MAX_RETRIES,
+            retry_backoff=settings.NTFY_RETRY_BACKOFF,
+            coalesce_window=settings.NTFY_COALESCE_WINDOW,
+            timeout=settings.NTFY_TIMEOUT,
+        )
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads or self._stopping.is_set():
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"ntfy-dispatcher-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(
+        self,
+        message: str,
+        *,
+        title: Optional[str] = None,
+        tags: Optional[Iterable[str]] = None,
+        priority: Optional[int] = None,
+    ) -> bool:
+        if not getattr(settings, "NTFY_TOPIC", None) or self._stopping.is_set():
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(NtfyMessage(message, title, tuple(tags or ()), priority))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning("ntfy queue is full; dropping notification %r", title)
+            return False
+        return True
+
+    def shutdown(self, timeout: float = 10) -> None:
+        """Stop accepting messages, flush what is queued and stop the workers."""
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            self._stopping.set()
+            threads = list(self._threads)
+        deadline = time.monotonic() + timeout
+        for _ in threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self._session.close()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stop = self._collect(item)
+            self._deliver(batch)
+            if stop:
+                return
+
+    def _collect(self, first: NtfyMessage):
+        batch = [first]
+        deadline = time.monotonic() + self.coalesce_window
+        while len(batch) < self.max_batch:
+            if self._stopping.is_set():
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _deliver(self, batch) -> None:
+        groups = {}
+        for item in batch:
+            groups.setdefault(item.group_key, []).append(item.message)
+        for (title, tags, priority), messages in groups.items():
+            self._post(NtfyMessage("\n".join(messages), title, tags, priority))
+
+    def _post(self, notification: NtfyMessage) -> None:
+        prepared = _build_request(notification)
+        if prepared is None:
+            return
+        url, headers = prepared
+        data = notification.message.encode("utf-8")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._session.post(url, data=data, headers=headers, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException as exc:
+                status_code = getattr(exc.response, "status_code", None)
+                retryable = status_code is None or status_code == 429 or status_code >= 500
+                if not retryable or attempt == self.max_retries:
+                    with self._lock:
+                        self.failed += 1
+                    logger.warning("Failed to send ntfy notification: %s", exc)
+                    return
+                time.sleep(self.retry_backoff * (2**attempt))
+            else:
+                with self._lock:
+                    self.sent += 1
+                return
+
+
+_dispatcher: Optional[NtfyDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> NtfyDispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NtfyDispatcher.from_settings()
+            atexit.register(_dispatcher.shutdown)
+        return _dispatcher
+
+
+def queue_ntfy_message(
+    message: str,
+    *,
+    title: Optional[str] = None,
+    tags: Optional[Iterable[str]] = None,
+    priority: Optional[int] = None,
+) -> bool:
+    """Hand a notification to the background dispatcher without waiting for ntfy."""
+    return get_dispatcher().enqueue(message, title=title, tags=tags, priority=priority)
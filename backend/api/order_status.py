@@ -0,0 +1,115 @@
+"""
+Order status transitions.
+
+``Order.TRANSITIONS`` declares which moves are legal; orders only move
+forward. Every transition is a conditional ``UPDATE`` that writes just
+``status``, ``version`` and ``updated_at`` and only matches the row in the
+status and version the caller saw, so two admins racing on one order
+cannot silently overwrite each other: the second gets a conflict.
+``bulk_transition`` moves many orders in one such ``UPDATE``.
+
+These writes bypass ``Order.save``, so the rollups, the report version and
+the order events are updated here rather than by the model signals.
+"""
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import events, rollups
+from .caching import bump_report_version
+from .models import Order
+
+Status = Order.Status
+
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+NOT_FOUND = "not_found"
+INVALID_TRANSITION = "invalid_transition"
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+class TransitionConflict(Exception):
+    """The order changed since the caller read it."""
+
+
+class BulkTransition(NamedTuple):
+    results: dict
+    updated: list
+
+
+def _moved(orders, previous_statuses, target, now) -> None:
+    previous_keys = {}
+    for order in orders:
+        previous = previous_statuses[order.pk]
+        previous_keys[order.pk] = (rollups.order_day(order.order_date), previous)
+        event = events.OrderEvent(events.STATUS_CHANGED, order.pk, order.customer_id, target, previous)
+        events.publish_on_commit(event)
+        order.status, order.updated_at = target, now
+    rollups.move_orders(orders, previous_keys)
+    bump_report_version()
+
+
+@transaction.atomic
+def transition(order, target):
+    """Move ``order`` to ``target`` if it is still in the status and version it was loaded with."""
+    previous = order.status
+    if not Status(previous).can_become(target):
+        raise InvalidTransition(f"{previous} -> {target}")
+    now = timezone.now()
+    updated = Order.objects.filter(pk=order.pk, status=previous, version=order.version).update(
+        status=target, version=F("version") + 1, updated_at=now
+    )
+    if not updated:
+        raise TransitionConflict(order.pk)
+    order.version += 1
+    _moved([order], {order.pk: previous}, target, now)
+    return order
+
+
+@transaction.atomic
+def bulk_transition(order_ids, target) -> BulkTransition:
+    """
+    Move the orders in ``order_ids`` to ``target``.
+
+    ``results`` maps every requested id to ``updated``, ``unchanged``
+    (already in ``target``), ``not_found`` or ``invalid_transition``;
+    ``updated`` holds the moved orders with their new status.
+    """
+    sources = Status(target).sources
+    # Lock first so the rollups and events see exactly the rows the UPDATE moves.
+    orders = {
+        order.pk: order
+        for order in Order.objects.select_for_update()
+        .filter(pk__in=order_ids)
+        .only("id", "status", "order_date", "customer_id", "version")
+        .order_by("pk")
+    }
+    results, movable = {}, []
+    for pk in dict.fromkeys(order_ids):
+        order = orders.get(pk)
+        if order is None:
+            results[pk] = NOT_FOUND
+        elif order.status == target:
+            results[pk] = UNCHANGED
+        elif order.status not in sources:
+            results[pk] = INVALID_TRANSITION
+        else:
+            results[pk] = UPDATED
+            movable.append(order)
+    if not movable:
+        return BulkTransition(results, [])
+
+    now = timezone.now()
+    Order.objects.filter(pk__in=[order.pk for order in movable], status__in=sources).update(
+        status=target, version=F("version") + 1, updated_at=now
+    )
+    previous_statuses = {order.pk: order.status for order in movable}
+    for order in movable:
+        order.version += 1
+    _moved(movable, previous_statuses, target, now)
+    return BulkTransition(results, movable)
@@ -0,0 +1,31 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by (order_date, id), newest first.
+
+    DRF's cursor holds the last seen ``order_date`` only, plus an offset
+    past the rows sharing it, so each page is an index range scan on
+    ``order_date`` no matter how deep the client has paged; ``id`` only
+    makes the order stable. The offset stays small as long as few orders
+    share a timestamp.
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-order_date", "-id")
+
+
+class ProductSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class CustomerCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("email",)
@@ -0,0 +1,311 @@
+"""
+Incremental maintenance of the daily order and sales rollups.
+
+Every write to an order or one of its items is translated into a delta
+against the affected (day, status[, product]) rows, so ``ReportView``
+can read a few hundred pre-aggregated rows instead of scanning the
+order history. ``rebuild`` recomputes both tables from scratch.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyOrderRollup, DailySalesRollup, Order, OrderItem
+
+_local = threading.local()
+
+
+def _deleting_orders():
+    if not hasattr(_local, "orders"):
+        _local.orders = set()
+    return _local.orders
+
+
+@contextmanager
+def suspended():
+    """
+    Skip the per-row signal handlers for writes done inside the block.
+
+    Batched write paths use this and report their net effect themselves:
+    rollups through ``apply_sales_deltas`` or ``remove_orders``, and the
+    report version with one bump. Orders deleted inside the block leave no
+    tombstone, so it is only for removals clients must not see as deletions.
+    """
+    previous = getattr(_local, "suspended", False)
+    _local.suspended = True
+    try:
+        yield
+    finally:
+        _local.suspended = previous
+
+
+def is_suspended():
+    return getattr(_local, "suspended", False)
+
+
+def order_day(order_date):
+    return timezone.localdate(order_date) if timezone.is_aware(order_date) else order_date.date()
+
+
+def _revenue_expression():
+    return Sum(F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _bump(model, lookup, **deltas):
+    if not any(deltas.values()):
+        return
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**updates)
+
+
+def bump_orders(day, status, count):
+    _bump(DailyOrderRollup, {"day": day, "status": status}, order_count=count)
+
+
+def bump_sales(day, status, product_id, quantity, revenue):
+    _bump(
+        DailySalesRollup,
+        {"day": day, "status": status, "product_id": product_id},
+        quantity=quantity,
+        revenue=revenue,
+    )
+
+
+def apply_sales_deltas(day, status, deltas):
+    """
+    Add ``{product_id: (quantity, revenue)}`` to one day and status in a
+    fixed number of queries, however many products are involved. Rows are
+    locked in product order so concurrent writers cannot deadlock.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    with transaction.atomic():
+        DailySalesRollup.objects.bulk_create(
+            [DailySalesRollup(day=day, status=status, product_id=product_id) for product_id in deltas],
+            ignore_conflicts=True,
+        )
+        rows = list(
+            DailySalesRollup.objects.select_for_update()
+            .filter(day=day, status=status, product_id__in=deltas)
+            .order_by("product_id")
+        )
+        for row in rows:
+            quantity, revenue = deltas[row.product_id]
+            row.quantity += quantity
+            row.revenue += revenue
+        DailySalesRollup.objects.bulk_update(rows, ["quantity", "revenue"])
+
+
+def order_lines(order_ids):
+    """Quantity and revenue per (order, product) for the given orders, in one query."""
+    return (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values("order_id", "product_id")
+        .annotate(units=Sum("quantity"), sales=_revenue_expression())
+        .order_by()
+    )
+
+
+def _shift(moves):
+    """
+    Apply ``{order_id: (previous_key, current_key)}``, where a ``None`` key
+    means the order does not contribute on that side. Deltas are netted per
+    key first, so a batch of orders costs a few queries per distinct key
+    rather than per order.
+    """
+    counts = defaultdict(int)
+    sales = defaultdict(lambda: [0, Decimal("0.00")])
+    for previous, current in moves.values():
+        if previous is not None:
+            counts[previous] -= 1
+        if current is not None:
+            counts[current] += 1
+    for line in order_lines(list(moves)):
+        for key, sign in zip(moves[line["order_id"]], (-1, 1)):
+            if key is not None:
+                delta = sales[(*key, line["product_id"])]
+                delta[0] += sign * line["units"]
+                delta[1] += sign * line["sales"]
+    with transaction.atomic():
+        for key, count in sorted(counts.items()):
+            bump_orders(*key, count)
+        for key, (quantity, revenue) in sorted(sales.items()):
+            bump_sales(*key, quantity, revenue)
+
+
+def move_orders(orders, previous_keys):
+    """
+    Move the contribution of ``orders`` from their previous (day, status)
+    key to their current one. ``previous_keys`` maps order id to the old
+    key, or to ``None`` for orders that did not contribute before.
+    """
+    moves = {}
+    for order in orders:
+        current = (order_day(order.order_date), order.status)
+        if previous_keys.get(order.pk) != current:
+            moves[order.pk] = (previous_keys.get(order.pk), current)
+    if moves:
+        _shift(moves)
+
+
+def remove_orders(orders):
+    """Take ``orders`` and their items out of the rollups; call it before deleting the items."""
+    if orders:
+        _shift({order.pk: ((order_day(order.order_date), order.status), None) for order in orders})
+
+
+def _stored_order_key(order):
+    loaded = getattr(order, "_loaded_values", {})
+    if "status" in loaded and "order_date" in loaded:
+        return order_day(loaded["order_date"]), loaded["status"]
+    row = Order.objects.filter(pk=order.pk).values_list("order_date", "status").first()
+    return (order_day(row[0]), row[1]) if row else None
+
+
+def _order_key_for_item(item):
+    if item.order_id in _deleting_orders():
+        return None
+    order = item._state.fields_cache.get("order")
+    if order is None or order.pk != item.order_id:
+        order = Order.objects.only("order_date", "status").filter(pk=item.order_id).first()
+        if order is None:
+            return None
+    return order_day(order.order_date), order.status
+
+
+def _remember(instance, *fields):
+    instance._loaded_values = {field: getattr(instance, field) for field in fields}
+
+
+def before_order_saved(order):
+    order._rollup_previous = None if order._state.adding else _stored_order_key(order)
+
+
+def previous_status(order):
+    """Status ``order`` had before the save in progress, or ``None`` for new orders."""
+    previous = getattr(order, "_rollup_previous", None)
+    return previous[1] if previous else None
+
+
+def order_saved(order, created):
+    if created:
+        # Items are always written after their order, so there is nothing to move yet.
+        bump_orders(order_day(order.order_date), order.status, 1)
+    else:
+        move_orders([order], {order.pk: getattr(order, "_rollup_previous", None)})
+    _remember(order, "status", "order_date")
+
+
+def before_order_deleted(order):
+    key = _stored_order_key(order)
+    if key is None:
+        return
+    _deleting_orders().add(order.pk)
+    with transaction.atomic():
+        bump_orders(*key, -1)
+        for line in order_lines([order.pk]):
+            bump_sales(*key, line["product_id"], -line["units"], -line["sales"])
+
+
+def order_is_being_deleted(order_id) -> bool:
+    return order_id in _deleting_orders()
+
+
+def order_deleted(order):
+    _deleting_orders().discard(order.pk)
+
+
+def _stored_item_state(item):
+    loaded = getattr(item, "_loaded_values", {})
+    if {"order_id", "product_id", "quantity", "unit_price"} <= loaded.keys():
+        return loaded["order_id"], loaded["product_id"], loaded["quantity"], loaded["unit_price"]
+    return (
+        OrderItem.objects.filter(pk=item.pk)
+        .values_list("order_id", "product_id", "quantity", "unit_price")
+        .first()
+    )
+
+
+def before_item_saved(item):
+    if is_suspended():
+        return
+    item._rollup_previous = None if item._state.adding else _stored_item_state(item)
+
+
+def item_saved(item, created):
+    if is_suspended():
+        return
+    previous = None if created else getattr(item, "_rollup_previous", None)
+    with transaction.atomic():
+        if previous is not None:
+            order_id, product_id, quantity, unit_price = previous
+            if order_id == item.order_id:
+                key = _order_key_for_item(item)
+            else:
+                key = _stored_order_key(Order(pk=order_id))
+            if key is not None:
+                bump_sales(*key, product_id, -quantity, -quantity * unit_price)
+        key = _order_key_for_item(item)
+        if key is not None:
+            bump_sales(*key, item.product_id, item.quantity, item.subtotal)
+    _remember(item, "order_id", "product_id", "quantity", "unit_price")
+
+
+def item_deleted(item):
+    if is_suspended():
+        return
+    key = _order_key_for_item(item)
+    if key is None:
+        return
+    bump_sales(*key, item.product_id, -item.quantity, -item.subtotal)
+
+
+def rebuild():
+    """Recompute both rollup tables from the order history."""
+    with transaction.atomic():
+        DailyOrderRollup.objects.all().delete()
+        DailySalesRollup.objects.all().delete()
+
+        orders = (
+            Order.objects.annotate(day=TruncDate("order_date"))
+            .values("day", "status")
+            .annotate(order_count=Count("id"))
+            .order_by()
+        )
+        DailyOrderRollup.objects.bulk_create(
+            [DailyOrderRollup(**row) for row in orders], batch_size=1000
+        )
+
+        sales = (
+            OrderItem.objects.annotate(day=TruncDate("order__order_date"), order_status=F("order__status"))
+            .values("day", "order_status", "product_id")
+            .annotate(units=Sum("quantity"), sales=_revenue_expression())
+            .order_by()
+        )
+        DailySalesRollup.objects.bulk_create(
+            [
+                DailySalesRollup(
+                    day=row["day"],
+                    status=row["order_status"],
+                    product_id=row["product_id"],
+                    quantity=row["units"],
+                    revenue=row["sales"],
+                )
+                for row in sales
+            ],
+            batch_size=1000,
+        )
+    return DailyOrderRollup.objects.count(), DailySalesRollup.objects.count()
@@ -0,0 +1,193 @@
+"""
+Full-text product search over ``Product.name`` and ``Product.description``.
+
+SQLite uses an FTS5 external-content table kept in sync by triggers, with
+diacritics folded by the ``unicode61`` tokenizer. FTS5 has no Spanish
+stemmer, so query terms lose a plural ending and are matched as prefixes.
+PostgreSQL uses a generated ``tsvector`` column over a ``spanish_unaccent``
+text search configuration (Spanish stemming plus ``unaccent``) behind a GIN
+index. Name matches rank above description matches on both backends.
+Results are paged in SQL: the count and each page are separate queries,
+the page with ``LIMIT``/``OFFSET`` on the ranked query.
+
+Django rebuilds SQLite tables for some schema changes, which drops the
+triggers; ``manage.py rebuild_search_index`` puts everything back.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS api_product_fts USING fts5(
+        name, description, content='api_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_product_fts_ai AFTER INSERT ON api_product BEGIN
+        INSERT INTO api_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_product_fts_ad AFTER DELETE ON api_product BEGIN
+        INSERT INTO api_product_fts(api_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS api_product_fts_au AFTER UPDATE OF name, description ON api_product BEGIN
+        INSERT INTO api_product_fts(api_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO api_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO api_product_fts(api_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS api_product_fts_au",
+    "DROP TRIGGER IF EXISTS api_product_fts_ad",
+    "DROP TRIGGER IF EXISTS api_product_fts_ai",
+    "DROP TABLE IF EXISTS api_product_fts",
+]
+
+POSTGRES_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'spanish_unaccent') THEN
+            CREATE TEXT SEARCH CONFIGURATION spanish_unaccent (COPY = spanish);
+            ALTER TEXT SEARCH CONFIGURATION spanish_unaccent
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+        END IF;
+    END
+    $$
+    """,
+    """
+    ALTER TABLE api_product ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish_unaccent', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('spanish_unaccent', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS api_product_search_idx ON api_product USING gin (search_vector)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS api_product_search_idx",
+    "ALTER TABLE api_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_QUERY = """
+    SELECT rowid FROM api_product_fts
+    WHERE api_product_fts MATCH %s
+    ORDER BY bm25(api_product_fts, 10.0, 1.0), rowid
+    LIMIT %s OFFSET %s
+"""
+
+SQLITE_COUNT = "SELECT count(*) FROM api_product_fts WHERE api_product_fts MATCH %s"
+
+POSTGRES_QUERY = """
+    SELECT id FROM api_product, websearch_to_tsquery('spanish_unaccent', %s) AS query
+    WHERE search_vector @@ query
+    ORDER BY ts_rank(search_vector, query) DESC, id
+    LIMIT %s OFFSET %s
+"""
+
+POSTGRES_COUNT = """
+    SELECT count(*) FROM api_product
+    WHERE search_vector @@ websearch_to_tsquery('spanish_unaccent', %s)
+"""
+
+
+def install_index(conn=connection):
+    """Create the search index and its sync machinery; safe to run repeatedly."""
+    statements = {"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def uninstall_index(conn=connection):
+    statements = {"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL}.get(conn.vendor, [])
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def _fold(text):
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _sqlite_match(query):
+    terms = []
+    for term in re.findall(r"\w+", _fold(query)):
+        if len(term) > 4 and term.endswith("es"):
+            term = term[:-2]
+        elif len(term) > 3 and term.endswith("s"):
+            term = term[:-1]
+        terms.append(f'"{term}"*')
+    return " AND ".join(terms)
+
+
+class SearchResults:
+    """
+    Ids of the products matching one search, best match first.
+
+    Like a queryset, it runs nothing until counted or sliced, and a slice
+    reads only its own rows, so it can be handed to a paginator.
+    """
+
+    def __init__(self, sql, count_sql, term):
+        self.sql = sql
+        self.count_sql = count_sql
+        self.term = term
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(self.count_sql, [self.term])
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            raise TypeError("SearchResults only supports contiguous slices.")
+        start, stop, _ = index.indices(self.count())
+        if stop <= start:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(self.sql, [self.term, stop - start, start])
+            return [row[0] for row in cursor.fetchall()]
+
+
+def search_product_ids(query):
+    """The ids of matching products, best match first, as a lazily sliced sequence."""
+    query = query.strip()
+    if connection.vendor == "sqlite":
+        match = _sqlite_match(query)
+        if match:
+            return SearchResults(SQLITE_QUERY, SQLITE_COUNT, match)
+    elif connection.vendor == "postgresql":
+        if query:
+            return SearchResults(POSTGRES_QUERY, POSTGRES_COUNT, query)
+    elif query:
+        return (
+            Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+            .order_by("name", "id")
+            .values_list("id", flat=True)
+        )
+    return []
@@ -1,8 +1,84 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from . import rollups
+from .caching import bump_report_version
+from .inventory import InsufficientStock, adjust_stock
+from .models import ArchivedOrder, ArchivedOrderItem, ContactMessage, Order, OrderItem, Product, User
+
+
+class StaleOrder(Exception):
+    """The order changed since it was loaded."""
+
+
+def _query_list(request, name):
+    if request is None or name not in request.query_params:
+        return None
+    return {part.strip() for part in request.query_params[name].split(",") if part.strip()}
+
+
+def requested_fields(request):
+    """Top-level fields named in ``?fields=``, or None to return them all."""
+    return _query_list(request, "fields")
+
+
+def requested_expansions(request):
+    """Relations named in ``?expand=``, or None to embed every relation as before."""
+    return _query_list(request, "expand")
+
+
+class SparseFieldsMixin:
+    """
+    Trim read responses to ``?fields=`` and let ``?expand=`` decide which
+    relations are embedded. Serializers list their relations in
+    ``expandable_fields``; ``setup_queryset`` gives the view a queryset
+    that only loads what will be rendered.
+    """
+
+    expandable_fields = ()
+    column_map = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        fields = requested_fields(request)
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+        expand = requested_expansions(request)
+        if expand is not None:
+            for relation in set(self.expandable_fields) - expand:
+                self.collapse(relation)
 
-from .models import ContactMessage, Order, OrderItem, Product, User
+    def collapse(self, relation):
+        """Replace the embedded ``relation`` with something cheaper to render."""
+
+    @classmethod
+    def selection(cls, request):
+        fields = requested_fields(request)
+        expand = requested_expansions(request)
+        return (
+            lambda name: fields is None or name in fields,
+            lambda relation: expand is None or relation in expand,
+        )
+
+    @classmethod
+    def setup_queryset(cls, queryset, request, required=()):
+        fields = requested_fields(request)
+        if fields is None:
+            return queryset
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        columns = {cls.column_map.get(name, name) for name in fields} & model_fields
+        return queryset.only(*columns, *required)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,6 +88,15 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "role"]
 
 
+class CustomerSerializer(UserSerializer):
+    order_count = serializers.IntegerField(read_only=True)
+    lifetime_spend = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    last_order_date = serializers.DateTimeField(read_only=True, allow_null=True)
+
+    class Meta(UserSerializer.Meta):
+        fields = UserSerializer.Meta.fields + ["order_count", "lifetime_spend", "last_order_date"]
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     confirm_password = serializers.CharField(write_only=True)
@@ -52,28 +137,34 @@ class LoginSerializer(serializers.Serializer):
         return data
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = "__all__"
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(source="product_id", min_value=1)
     product_detail = ProductSerializer(source="product", read_only=True)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = OrderItem
-        fields = ["id", "product", "product_detail", "quantity", "personalization", "subtotal"]
-        read_only_fields = ["id", "subtotal", "product_detail"]
+        fields = ["id", "product", "product_detail", "quantity", "unit_price", "personalization", "subtotal"]
+        read_only_fields = ["unit_price", "subtotal", "product_detail"]
+
 
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ("customer", "items.product")
+    column_map = {"total": "total_amount"}
 
-class OrderSerializer(serializers.ModelSerializer):
     customer = UserSerializer(read_only=True)
     customer_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), write_only=True, source="customer", required=False, allow_null=True
     )
     items = OrderItemSerializer(many=True)
-    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    total = serializers.DecimalField(source="total_amount", max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
@@ -87,33 +178,236 @@ class OrderSerializer(serializers.ModelSerializer):
             "notes",
             "items",
             "total",
+            "updated_at",
+            "version",
         ]
-        read_only_fields = ["id", "order_date", "total"]
+        # Status only changes through set_status and bulk_set_status, which enforce Order.TRANSITIONS.
+        read_only_fields = ["id", "status", "order_date", "total", "updated_at", "version"]
+
+    def collapse(self, relation):
+        if relation == "customer" and "customer" in self.fields:
+            self.fields["customer"] = serializers.PrimaryKeyRelatedField(read_only=True)
+        elif relation == "items.product" and "items" in self.fields:
+            self.fields["items"].child.fields.pop("product_detail", None)
+
+    @classmethod
+    def setup_queryset(cls, queryset, request, required=()):
+        wanted, expanded = cls.selection(request)
+        if wanted("customer") and expanded("customer"):
+            queryset = queryset.select_related("customer")
+        if wanted("items"):
+            queryset = queryset.prefetch_related("items__product" if expanded("items.product") else "items")
+        if wanted("customer"):
+            required = (*required, "customer")
+        return super().setup_queryset(queryset, request, required)
 
     def validate_items(self, value):
         if not value:
             raise serializers.ValidationError("Debe incluir al menos un producto en el pedido.")
+        product_ids = {item_data["product_id"] for item_data in value}
+        products = Product.objects.in_bulk(product_ids)
+        missing = sorted(product_ids - products.keys())
+        if missing:
+            raise serializers.ValidationError(
+                f"Productos inexistentes: {', '.join(str(pk) for pk in missing)}."
+            )
+        for item_data in value:
+            item_data["product"] = products[item_data.pop("product_id")]
         return value
 
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop("items", [])
-        order = Order.objects.create(**validated_data)
-        self._sync_items(order, items_data)
+        for item_data in items_data:
+            item_data.pop("id", None)
+        order = Order(**validated_data)
+        plan = self._plan_items(order, [], items_data)
+        # Products are locked before the order save touches the rollups, like OrderViewSet.perform_destroy.
+        deltas = self._reserve_stock(plan)
+        order.save()
+        self._sync_items(order, plan, deltas)
+        prefetch_related_objects([order], "items__product")
         return order
 
+    @staticmethod
+    def lock(order):
+        """
+        Lock ``order``'s row until the transaction ends, before its items and
+        products: the lock order of every write to an existing order. Raises
+        ``StaleOrder`` if the row no longer has the version ``order`` was loaded with.
+        """
+        version = Order.objects.select_for_update().filter(pk=order.pk).values_list("version", flat=True).first()
+        if version != order.version:
+            raise StaleOrder(order.pk)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
+        self.lock(instance)
         items_data = validated_data.pop("items", None)
+        # Only what the request changed is written; status belongs to set_status.
+        changed = set(validated_data)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        plan = None
         if items_data is not None:
-            instance.items.all().delete()
-            self._sync_items(instance, items_data)
+            existing = list(instance.items.order_by("pk"))
+            plan = self._plan_items(instance, existing, items_data)
+            deltas = self._reserve_stock(plan)
+            changed.add("total_amount")
+        instance.save(update_fields=changed)
+        if plan is not None:
+            self._sync_items(instance, plan, deltas)
+            getattr(instance, "_prefetched_objects_cache", {}).pop("items", None)
+            prefetch_related_objects([instance], "items__product")
         return instance
 
-    def _sync_items(self, order, items_data):
+    def _plan_items(self, order, existing, items_data):
+        """
+        Diff the submitted lines against the stored ones.
+
+        Lines are matched by ``id`` when given and otherwise by product and
+        personalization, so resubmitting an unchanged order writes nothing.
+        Sets ``order.total_amount`` and returns the lines to insert, update
+        and delete.
+        """
+        unclaimed = {item.pk: item for item in existing}
+        to_create, to_update, kept = [], [], []
+
         for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+            item_id = item_data.get("id")
+            if item_id is not None:
+                item = unclaimed.pop(item_id, None)
+                if item is None:
+                    raise serializers.ValidationError(
+                        {"items": f"La linea {item_id} no pertenece a este pedido."}
+                    )
+            else:
+                item = next(
+                    (
+                        candidate
+                        for candidate in unclaimed.values()
+                        if candidate.product_id == item_data["product"].pk
+                        and candidate.personalization == item_data.get("personalization", "")
+                    ),
+                    None,
+                )
+                if item is not None:
+                    del unclaimed[item.pk]
+
+            product = item_data["product"]
+            quantity = item_data.get("quantity", 1)
+            personalization = item_data.get("personalization", "")
+            if item is None:
+                to_create.append(
+                    OrderItem(
+                        order=order,
+                        product=product,
+                        quantity=quantity,
+                        unit_price=product.price,
+                        personalization=personalization,
+                    )
+                )
+                continue
+
+            previous = (item.product_id, item.quantity, item.unit_price, item.personalization)
+            if item.product_id != product.pk:
+                item.unit_price = product.price
+            item.product = product
+            item.quantity = quantity
+            item.personalization = personalization
+            if previous != (item.product_id, item.quantity, item.unit_price, item.personalization):
+                item._previous_line = previous[:3]
+                to_update.append(item)
+            else:
+                kept.append(item)
+
+        to_delete = list(unclaimed.values())
+        order.total_amount = sum(
+            (item.subtotal for item in to_create + to_update + kept), Decimal("0.00")
+        )
+        return to_create, to_update, to_delete
+
+    @staticmethod
+    def _reserve_stock(plan):
+        """
+        Take or return the stock the planned lines change and return the
+        ``{product_id: [quantity, revenue]}`` deltas. Runs after ``lock`` on
+        existing orders and before anything touches the rollups, so every
+        order write locks the order, then products in pk order, then rollups.
+        """
+        to_create, to_update, to_delete = plan
+        deltas = defaultdict(lambda: [0, Decimal("0.00")])
+
+        def add(product_id, quantity, unit_price, sign):
+            deltas[product_id][0] += sign * quantity
+            deltas[product_id][1] += sign * quantity * unit_price
+
+        for item in to_create:
+            add(item.product_id, item.quantity, item.unit_price, 1)
+        for item in to_update:
+            add(*item._previous_line, -1)
+            add(item.product_id, item.quantity, item.unit_price, 1)
+        for item in to_delete:
+            add(item.product_id, item.quantity, item.unit_price, -1)
+
+        try:
+            adjust_stock({product_id: delta[0] for product_id, delta in deltas.items()})
+        except InsufficientStock as exc:
+            raise serializers.ValidationError(
+                {"items": f"Stock insuficiente para: {exc}."}
+            ) from exc
+        return deltas
+
+    def _sync_items(self, order, plan, deltas):
+        to_create, to_update, to_delete = plan
+        with rollups.suspended():
+            if to_delete:
+                OrderItem.objects.filter(pk__in=[item.pk for item in to_delete]).delete()
+            if to_update:
+                OrderItem.objects.bulk_update(
+                    to_update, ["product", "quantity", "unit_price", "personalization"]
+                )
+            if to_create:
+                OrderItem.objects.bulk_create(to_create)
+        rollups.apply_sales_deltas(
+            rollups.order_day(order.order_date),
+            order.status,
+            {product_id: tuple(delta) for product_id, delta in deltas.items()},
+        )
+        bump_report_version()
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    product_detail = ProductSerializer(source="product", read_only=True)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ["id", "product", "product_detail", "quantity", "unit_price", "personalization", "subtotal"]
+        read_only_fields = fields
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    customer = UserSerializer(read_only=True)
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    total = serializers.DecimalField(source="total_amount", max_digits=12, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            "id",
+            "customer",
+            "status",
+            "order_date",
+            "delivery_date",
+            "notes",
+            "items",
+            "total",
+            "updated_at",
+            "version",
+            "archived_at",
+        ]
+        read_only_fields = fields
 
 
 class ContactMessageSerializer(serializers.ModelSerializer):
@@ -125,6 +419,11 @@ class ContactMessageSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "customer", "created_at"]
 
 
+class BulkStatusSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+    status = serializers.ChoiceField(choices=Order.Status.choices)
+
+
 class ReportSerializer(serializers.Serializer):
     total_orders = serializers.IntegerField()
     total_revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
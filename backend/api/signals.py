@@ -0,0 +1,93 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import changes, events, rollups
+from .authentication import invalidate_token, invalidate_user_tokens
+from .caching import bump_catalog_version, bump_report_version, mark_catalog_deletion
+from .models import ArchivedOrder, Order, OrderItem, Product, User
+
+
+@receiver(pre_save, sender=Order)
+def order_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.before_order_saved(instance)
+
+
+@receiver(post_save, sender=Order)
+def order_post_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        rollups.order_saved(instance, created)
+        events.order_saved(instance, created, rollups.previous_status(instance))
+
+
+@receiver(pre_delete, sender=Order)
+def order_pre_delete(sender, instance, **kwargs):
+    if not rollups.is_suspended():
+        rollups.before_order_deleted(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_post_delete(sender, instance, **kwargs):
+    if not rollups.is_suspended():
+        rollups.order_deleted(instance)
+        changes.record_deletion(instance)
+
+
+@receiver(pre_save, sender=OrderItem)
+def order_item_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.before_item_saved(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_post_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        rollups.item_saved(instance, created)
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_post_delete(sender, instance, **kwargs):
+    rollups.item_deleted(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def touch_item_order(sender, instance, raw=False, **kwargs):
+    # Batched writes run inside rollups.suspended() and save the order itself, which stamps updated_at once.
+    if raw or rollups.is_suspended():
+        return
+    if not rollups.order_is_being_deleted(instance.order_id):
+        changes.touch_order(instance.order_id)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_delete, sender=ArchivedOrder)
+def invalidate_report(sender, **kwargs):
+    if not rollups.is_suspended():
+        bump_report_version()
+
+
+@receiver(post_save, sender=Product)
+def product_post_save(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Product)
+def product_post_delete(sender, **kwargs):
+    mark_catalog_deletion()
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=User)
+def user_post_save(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_post_delete(sender, instance, **kwargs):
+    invalidate_token(instance.key)
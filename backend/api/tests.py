@@ -1,3 +1,1814 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F, Sum
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from backend import asgi_settings
+
+from . import archive, benchmarks, contact_inbox, events, metrics, order_status, rollups
+from .authentication import local_tokens
+from .caching import bump_catalog_version, catalog_cache
+from .contact_inbox import ContactBuffer
+from .inventory import adjust_stock
+from .models import (
+    ArchivedOrder,
+    ArchivedOrderItem,
+    ContactMessage,
+    DailyOrderRollup,
+    DailySalesRollup,
+    Order,
+    OrderItem,
+    OrderTombstone,
+    Product,
+    User,
+)
+from .notifications import NtfyDispatcher
+from .serializers import OrderSerializer, StaleOrder
+from .throttling import rejection_counts
+from .views import OrderViewSet
+
+
+@override_settings(
+    NTFY_TOPIC=None, PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"]
+)
+class ApiTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        local_tokens.clear()
+        # No flush thread: buffered contact messages are written by the test itself.
+        buffer = mock.patch.object(contact_inbox, "_buffer", ContactBuffer(max_batch=3, flush_interval=None))
+        self.contact_buffer = buffer.start()
+        self.addCleanup(buffer.stop)
+        self.admin = User.objects.create_user(
+            email="admin@example.com", password="Admin123!", username="admin", role=User.Role.ADMIN
+        )
+        self.customer = User.objects.create_user(
+            email="cliente@example.com", password="Cliente123!", username="cliente"
+        )
+        self.product = Product.objects.create(name="Concha", price=Decimal("12.50"), stock=100)
+
+    def authenticate(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def rollup_snapshot(self):
+        orders = {
+            (row.day, row.status): row.order_count
+            for row in DailyOrderRollup.objects.all()
+            if row.order_count
+        }
+        sales = {
+            (row.day, row.status, row.product_id): (row.quantity, row.revenue)
+            for row in DailySalesRollup.objects.all()
+            if row.quantity
+        }
+        return orders, sales
+
+    def assert_matches_rebuild(self):
+        incremental = self.rollup_snapshot()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup_snapshot())
+
+    def create_order(self, customer=None, quantity=1, **kwargs):
+        order = Order.objects.create(customer=customer or self.customer, **kwargs)
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity)
+        order.update_total()
+        return order
+
+
+class OrderPaginationTests(ApiTestCase):
+    def test_order_list_is_cursor_paginated(self):
+        now = timezone.now()
+        orders = [self.create_order(order_date=now - timedelta(minutes=i)) for i in range(5)]
+        self.authenticate(self.admin)
+
+        response = self.client.get("/api/orders/", {"page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([o["id"] for o in response.data["results"]], [orders[0].id, orders[1].id])
+
+        seen = [o["id"] for o in response.data["results"]]
+        next_url = response.data["next"]
+        while next_url:
+            response = self.client.get(next_url)
+            seen.extend(o["id"] for o in response.data["results"])
+            next_url = response.data["next"]
+        self.assertEqual(seen, [order.id for order in orders])
+
+    def test_customer_only_pages_through_own_orders(self):
+        own = self.create_order()
+        other = User.objects.create_user(email="otro@example.com", password="Otro123!", username="otro")
+        self.create_order(customer=other)
+        self.authenticate(self.customer)
+
+        response = self.client.get("/api/orders/")
+        self.assertEqual([o["id"] for o in response.data["results"]], [own.id])
+
+
+class SalesRollupTests(ApiTestCase):
+
+    def test_rollups_follow_order_writes(self):
+        cake = Product.objects.create(name="Tres leches", price=Decimal("250.00"))
+        first = self.create_order(quantity=3)
+        second = self.create_order(order_date=timezone.now() - timedelta(days=40))
+        OrderItem.objects.create(order=second, product=cake, quantity=2)
+        self.assert_matches_rebuild()
+
+        second.status = Order.Status.COMPLETED
+        second.save()
+        item = first.items.get()
+        item.quantity = 5
+        item.save()
+        self.assert_matches_rebuild()
+
+        second.items.filter(product=cake).delete()
+        first.delete()
+        self.assert_matches_rebuild()
+
+    def test_report_reads_rollups(self):
+        self.create_order(quantity=2)
+        self.create_order(quantity=1, status=Order.Status.COMPLETED)
+        self.authenticate(self.admin)
+
+        response = self.client.get("/api/reports/overview/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["total_orders"], 2)
+        self.assertEqual(Decimal(response.data["total_revenue"]), Decimal("37.50"))
+        self.assertEqual(response.data["orders_by_status"], {"completed": 1, "new": 1})
+        self.assertEqual(response.data["top_products"][0]["total_sold"], 3)
+
+
+    def test_rebuilding_the_rollups_refreshes_the_cached_report(self):
+        order = self.create_order()
+        self.authenticate(self.admin)
+        self.assertEqual(self.client.get("/api/reports/overview/").data["orders_by_status"], {"new": 1})
+        # A write that bypassed the signals, which is what the command exists to repair.
+        Order.objects.filter(pk=order.pk).update(status=Order.Status.COMPLETED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_sales_rollup", stdout=io.StringIO())
+        self.assertEqual(self.client.get("/api/reports/overview/").data["orders_by_status"], {"completed": 1})
+
+
+class StoredPriceTests(ApiTestCase):
+    def test_price_changes_do_not_rewrite_existing_orders(self):
+        self.authenticate(self.customer)
+        response = self.client.post(
+            "/api/orders/", {"items": [{"product": self.product.id, "quantity": 4}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["total"], "50.00")
+
+        self.product.price = Decimal("99.00")
+        self.product.save()
+
+        order = Order.objects.get(pk=response.data["id"])
+        self.assertEqual(order.total_amount, Decimal("50.00"))
+        self.assertEqual(order.items.get().unit_price, Decimal("12.50"))
+        response = self.client.get("/api/orders/")
+        self.assertEqual(response.data["results"][0]["total"], "50.00")
+        self.assertEqual(response.data["results"][0]["items"][0]["subtotal"], "50.00")
+
+
+class OrderWriteTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [
+            Product.objects.create(name=f"Pan {index}", price=Decimal("10.00") + index, stock=100)
+            for index in range(30)
+        ]
+        self.authenticate(self.customer)
+
+    def post_order(self, count):
+        items = [{"product": product.id, "quantity": 2} for product in self.products[:count]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/api/orders/", {"items": items}, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return response, len(queries)
+
+    def test_create_query_count_does_not_depend_on_item_count(self):
+        self.post_order(30)  # create today's rollup rows first
+        _, small = self.post_order(3)
+        response, large = self.post_order(30)
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data["items"]), 30)
+        expected = sum((Decimal(2) * product.price for product in self.products), Decimal("0.00"))
+        self.assertEqual(Decimal(response.data["total"]), expected)
+
+    def test_update_only_writes_changed_lines(self):
+        response, _ = self.post_order(3)
+        order_id = response.data["id"]
+        original_ids = [item["id"] for item in response.data["items"]]
+        items = [
+            {"product": self.products[0].id, "quantity": 2},
+            {"id": original_ids[1], "product": self.products[1].id, "quantity": 5},
+            {"product": self.products[3].id, "quantity": 1},
+        ]
+
+        response = self.client.patch(f"/api/orders/{order_id}/", {"items": items}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        lines = {item["product"]: item for item in response.data["items"]}
+        self.assertEqual(set(lines), {self.products[0].id, self.products[1].id, self.products[3].id})
+        self.assertEqual(lines[self.products[0].id]["id"], original_ids[0])
+        self.assertEqual(lines[self.products[1].id]["id"], original_ids[1])
+        self.assertEqual(lines[self.products[1].id]["quantity"], 5)
+        self.assertFalse(OrderItem.objects.filter(pk=original_ids[2]).exists())
+        self.assertEqual(
+            Order.objects.get(pk=order_id).total_amount, Decimal("20.00") + Decimal("55.00") + Decimal("13.00")
+        )
+
+    def test_update_query_count_does_not_depend_on_item_count(self):
+        self.post_order(30)  # create today's rollup rows first
+        counts = []
+        for count in (3, 29):
+            response, _ = self.post_order(count)
+            items = [{"product": product.id, "quantity": 3} for product in self.products[1 : count + 1]]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch(
+                    f"/api/orders/{response.data['id']}/", {"items": items}, format="json"
+                )
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_update_query_count_does_not_depend_on_removed_lines(self):
+        self.post_order(30)  # create today's rollup rows first
+        counts = []
+        for removed in (1, 20):
+            response, _ = self.post_order(21)
+            order = Order.objects.get(pk=response.data["id"])
+            items = [{"product": product.id, "quantity": 2} for product in self.products[: 21 - removed]]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.patch(f"/api/orders/{order.pk}/", {"items": items}, format="json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["items"]), 21 - removed)
+            self.assertGreater(Order.objects.get(pk=order.pk).updated_at, order.updated_at)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unknown_products_are_rejected_without_writing(self):
+        response = self.client.post(
+            "/api/orders/", {"items": [{"product": 999999, "quantity": 1}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failed_write_leaves_no_partial_order(self):
+        with mock.patch("api.rollups.apply_sales_deltas", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post_order(3)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_rollups_stay_consistent_with_batched_writes(self):
+        response, _ = self.post_order(5)
+        items = [{"product": product.id, "quantity": 1} for product in self.products[2:8]]
+        self.client.patch(f"/api/orders/{response.data['id']}/", {"items": items}, format="json")
+        self.assert_matches_rebuild()
+
+
+class StockReservationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cake = Product.objects.create(name="Pastel", price=Decimal("300.00"), stock=3)
+        self.authenticate(self.customer)
+
+    def order(self, *lines, method="post", url="/api/orders/"):
+        items = [{"product": product.id, "quantity": quantity} for product, quantity in lines]
+        return getattr(self.client, method)(url, {"items": items}, format="json")
+
+    def assert_stock(self, product, expected):
+        product.refresh_from_db()
+        self.assertEqual(product.stock, expected)
+
+    def test_creating_an_order_takes_stock(self):
+        response = self.order((self.cake, 2), (self.product, 5))
+        self.assertEqual(response.status_code, 201)
+        self.assert_stock(self.cake, 1)
+        self.assert_stock(self.product, 95)
+
+    def test_insufficient_stock_rejects_the_whole_order(self):
+        response = self.order((self.product, 5), (self.cake, 4))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Pastel", str(response.data["items"]))
+        self.assertFalse(Order.objects.exists())
+        self.assert_stock(self.cake, 3)
+        self.assert_stock(self.product, 100)
+
+    def test_stock_taken_after_validation_rejects_the_order(self):
+        def sold_out_meanwhile(changes):
+            # Another order commits between this request's validation and its reservation.
+            Product.objects.filter(pk=self.cake.pk).update(stock=1)
+            adjust_stock(changes)
+
+        with mock.patch("api.serializers.adjust_stock", side_effect=sold_out_meanwhile):
+            response = self.order((self.product, 5), (self.cake, 2))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Pastel", str(response.data["items"]))
+        self.assertFalse(Order.objects.exists())
+        # The stand-in for the other order ran inside this request's transaction, so it was rolled back too.
+        self.assert_stock(self.cake, 3)
+        self.assert_stock(self.product, 100)
+
+    def test_edits_and_deletes_lock_the_order_before_products(self):
+        url = f"/api/orders/{self.order((self.cake, 1)).data['id']}/"
+        calls = []
+        lock = OrderSerializer.lock
+
+        def locking(order):
+            calls.append("order")
+            lock(order)
+
+        def taking(changes):
+            calls.append(sorted(changes))
+            adjust_stock(changes)
+
+        with (
+            mock.patch.object(OrderSerializer, "lock", side_effect=locking),
+            mock.patch("api.serializers.adjust_stock", side_effect=taking),
+            mock.patch("api.views.adjust_stock", side_effect=taking),
+        ):
+            self.assertEqual(self.order((self.cake, 2), (self.product, 1), method="patch", url=url).status_code, 200)
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        products = sorted([self.cake.pk, self.product.pk])
+        self.assertEqual(calls, ["order", products, "order", products])
+
+    def test_updates_and_deletes_release_stock(self):
+        order_id = self.order((self.cake, 2), (self.product, 5)).data["id"]
+        url = f"/api/orders/{order_id}/"
+
+        response = self.order((self.cake, 3), method="patch", url=url)
+        self.assertEqual(response.status_code, 200)
+        self.assert_stock(self.cake, 0)
+        self.assert_stock(self.product, 100)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assert_stock(self.cake, 3)
+
+
+@override_settings(NTFY_TOPIC=None)
+class StockConcurrencyTests(TransactionTestCase):
+    workers = 8
+    attempts_per_worker = 5
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            # Shared-cache in-memory SQLite fails concurrent writers instead of making them wait.
+            self.skipTest("needs a database that serializes concurrent writers")
+
+    def test_parallel_orders_never_oversell(self):
+        products = [
+            Product.objects.create(name=f"Rosca {index}", price=Decimal("150.00"), stock=12)
+            for index in range(3)
+        ]
+        customers = [
+            User.objects.create_user(email=f"c{index}@example.com", password="x", username=f"c{index}")
+            for index in range(self.workers)
+        ]
+        tokens = [Token.objects.create(user=customer).key for customer in customers]
+        accepted = []
+        errors = []
+        lock = threading.Lock()
+
+        def place_orders(worker):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {tokens[worker]}")
+            # Each worker lists the products in a different order to provoke lock-order deadlocks.
+            ordering = products[worker % 3 :] + products[: worker % 3]
+            try:
+                for _ in range(self.attempts_per_worker):
+                    items = [{"product": product.id, "quantity": 1} for product in ordering]
+                    try:
+                        response = client.post("/api/orders/", {"items": items}, format="json")
+                    except Exception as exc:
+                        with lock:
+                            errors.append(exc)
+                        continue
+                    if response.status_code == 201:
+                        with lock:
+                            accepted.append(response.data["id"])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=place_orders, args=(worker,)) for worker in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertFalse(any(thread.is_alive() for thread in threads), "workers deadlocked")
+
+        for product in products:
+            product.refresh_from_db()
+            sold = OrderItem.objects.filter(product=product).count()
+            self.assertGreaterEqual(product.stock, 0)
+            self.assertEqual(product.stock + sold, 12)
+        self.assertEqual(errors, [])
+        self.assertEqual(Order.objects.count(), len(accepted))
+        self.assertLessEqual(len(accepted), 12)
+
+    def test_parallel_creates_and_deletes_keep_stock_and_rollups_consistent(self):
+        # Creates and deletes both lock products before rollup rows; opposite orders deadlock on PostgreSQL.
+        products = [
+            Product.objects.create(name=f"Dona {index}", price=Decimal("20.00"), stock=100) for index in range(3)
+        ]
+        customers = [
+            User.objects.create_user(email=f"d{index}@example.com", password="x", username=f"d{index}")
+            for index in range(self.workers)
+        ]
+        tokens = [Token.objects.create(user=customer).key for customer in customers]
+        items = [{"product": product.id, "quantity": 1} for product in products]
+        existing = {}
+        for worker in range(1, self.workers, 2):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {tokens[worker]}")
+            existing[worker] = [
+                client.post("/api/orders/", {"items": items}, format="json").data["id"]
+                for _ in range(self.attempts_per_worker)
+            ]
+        errors = []
+        lock = threading.Lock()
+
+        def work(worker):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {tokens[worker]}")
+            try:
+                for attempt in range(self.attempts_per_worker):
+                    try:
+                        if worker % 2:
+                            response = client.delete(f"/api/orders/{existing[worker][attempt]}/")
+                            expected = 204
+                        else:
+                            response = client.post("/api/orders/", {"items": items}, format="json")
+                            expected = 201
+                    except Exception as exc:
+                        with lock:
+                            errors.append(exc)
+                        continue
+                    if response.status_code != expected:
+                        with lock:
+                            errors.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, args=(worker,)) for worker in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertFalse(any(thread.is_alive() for thread in threads), "workers deadlocked")
+
+        self.assertEqual(errors, [])
+        created = (self.workers + 1) // 2 * self.attempts_per_worker
+        self.assertEqual(Order.objects.count(), created)
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock, 100 - created)
+        rollups_before = (
+            dict(DailyOrderRollup.objects.values_list("status").annotate(total=Sum("order_count")).order_by()),
+            dict(DailySalesRollup.objects.values_list("product").annotate(total=Sum("quantity")).order_by()),
+        )
+        rollups.rebuild()
+        self.assertEqual(
+            rollups_before,
+            (
+                dict(DailyOrderRollup.objects.values_list("status").annotate(total=Sum("order_count")).order_by()),
+                dict(DailySalesRollup.objects.values_list("product").annotate(total=Sum("quantity")).order_by()),
+            ),
+        )
+
+
+class ProductConditionalGetTests(ApiTestCase):
+    def test_unchanged_catalog_answers_304_without_serializing(self):
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        response = self.client.get(
+            "/api/products/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_validators_change_with_products(self):
+        etag = self.client.get("/api/products/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Dona", price=Decimal("9.00"))
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        etag = response["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(name="Dona").delete()
+        self.assertEqual(self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_detail_revalidates(self):
+        url = f"/api/products/{self.product.id}/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.product.price = Decimal("13.00")
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get("/api/products/999999/").status_code, 404)
+
+
+class CatalogCacheTests(ApiTestCase):
+    def test_rendered_catalog_is_served_from_memory_until_a_product_changes(self):
+        first = self.client.get("/api/products/")
+        with self.assertNumQueries(1):  # only the conditional GET validator
+            second = self.client.get("/api/products/")
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(catalog_cache.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Concha de vainilla"
+            self.product.save()
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.json()[0]["name"], "Concha de vainilla")
+        self.assertEqual(catalog_cache.stats()["misses"], 2)
+
+    def test_changes_from_another_worker_are_not_served_stale(self):
+        self.client.get("/api/products/")
+        # Another worker's write: no signal and no shared counter bump reach this process.
+        Product.objects.filter(pk=self.product.pk).update(name="Concha de nata", updated_at=timezone.now())
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.json()[0]["name"], "Concha de nata")
+
+    def test_write_committed_behind_a_newer_one_is_not_served_stale(self):
+        started = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Dona", price=Decimal("9.00"))
+        first = self.client.get("/api/products/")
+        # A transaction that stamped updated_at before the Dona commits after it.
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name="Concha de nata", updated_at=started)
+            transaction.on_commit(bump_catalog_version)
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Concha de nata", [product["name"] for product in response.json()])
+
+    def test_cache_size_is_bounded(self):
+        for index in range(catalog_cache.maxsize + 5):
+            self.client.get("/api/products/", {"page": index})
+        self.assertEqual(catalog_cache.stats()["size"], catalog_cache.maxsize)
+
+
+class ProductSearchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ganache = Product.objects.create(
+            name="Pastel de chocolate", description="Bizcocho con ganache.", price=Decimal("320.00")
+        )
+        self.tres_leches = Product.objects.create(
+            name="Tres leches", description="Decorado con virutas de chocolate.", price=Decimal("280.00")
+        )
+        self.limon = Product.objects.create(
+            name="Pay de limón", description="Sin gluten, base de almendra.", price=Decimal("190.00")
+        )
+
+    def search(self, query, **params):
+        response = self.client.get("/api/products/", {"search": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_results_are_ranked_and_paginated(self):
+        data = self.search("chocolate")
+        self.assertEqual(data["count"], 2)
+        self.assertEqual([p["id"] for p in data["results"]], [self.ganache.id, self.tres_leches.id])
+
+        data = self.search("chocolate", page_size=1, page=2)
+        self.assertEqual([p["id"] for p in data["results"]], [self.tres_leches.id])
+
+    def test_only_the_requested_page_is_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.search("chocolate", page_size=1, page=2)
+        self.assertEqual((data["count"], [p["id"] for p in data["results"]]), (2, [self.tres_leches.id]))
+        ranked = [q["sql"] for q in queries.captured_queries if "ORDER BY" in q["sql"] and "fts" in q["sql"]]
+        self.assertEqual(len(ranked), 1)
+        self.assertIn("LIMIT 1 OFFSET 1", " ".join(ranked[0].split()))
+
+    def test_accents_and_plurals_are_folded(self):
+        self.assertEqual([p["id"] for p in self.search("LIMON")["results"]], [self.limon.id])
+        self.assertEqual([p["id"] for p in self.search("sin gluten")["results"]], [self.limon.id])
+        self.assertEqual([p["id"] for p in self.search("pasteles")["results"]], [self.ganache.id])
+
+    def test_index_follows_product_writes(self):
+        self.limon.name = "Pay de maracuyá"
+        self.limon.save()
+        self.assertEqual(self.search("limon")["count"], 0)
+        self.assertEqual(self.search("maracuya")["count"], 1)
+
+        self.ganache.delete()
+        self.assertEqual([p["id"] for p in self.search("chocolate")["results"]], [self.tres_leches.id])
+
+
+class SparseFieldsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_order(quantity=2)
+        self.authenticate(self.customer)
+
+    def test_order_list_with_only_scalar_fields_skips_relations(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/orders/", {"fields": "id,status,order_date,total"})
+        (row,) = response.data["results"]
+        self.assertEqual(set(row), {"id", "status", "order_date", "total"})
+        self.assertEqual((row["id"], row["total"]), (self.order.id, "25.00"))
+        order_query = [q["sql"] for q in queries.captured_queries if 'FROM "api_order"' in q["sql"]]
+        self.assertEqual(len(order_query), 1)
+        self.assertNotIn("notes", order_query[0])
+        self.assertNotIn("api_orderitem", " ".join(q["sql"] for q in queries.captured_queries))
+
+    def test_expand_controls_embedding(self):
+        response = self.client.get("/api/orders/", {"expand": "items.product"})
+        order = response.data["results"][0]
+        self.assertEqual(order["customer"], self.customer.id)
+        self.assertEqual(order["items"][0]["product_detail"]["name"], "Concha")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/orders/{self.order.id}/", {"expand": ""})
+        self.assertEqual(response.data["customer"], self.customer.id)
+        self.assertNotIn("product_detail", response.data["items"][0])
+        self.assertNotIn("api_product", " ".join(q["sql"] for q in queries.captured_queries))
+
+        response = self.client.get(f"/api/orders/{self.order.id}/")
+        self.assertEqual(response.data["customer"]["email"], self.customer.email)
+        self.assertIn("product_detail", response.data["items"][0])
+
+    def test_product_fields(self):
+        response = self.client.get("/api/products/", {"fields": "id,name,price"})
+        self.assertEqual(response.json(), [{"id": self.product.id, "name": "Concha", "price": "12.50"}])
+        response = self.client.get(f"/api/products/{self.product.id}/", {"fields": "name"})
+        self.assertEqual(response.json(), {"name": "Concha"})
+
+
+class ReportCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.admin)
+
+    def test_unchanged_report_revalidates_with_304(self):
+        self.create_order()
+        response = self.client.get("/api/reports/overview/")
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):  # cached token, no report queries
+            response = self.client.get("/api/reports/overview/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_order_writes_invalidate_the_cached_report(self):
+        response = self.client.get("/api/reports/overview/")
+        etag = response["ETag"]
+        self.assertEqual(response.data["total_orders"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_order()
+        response = self.client.get("/api/reports/overview/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["total_orders"], 1)
+
+    @override_settings(REPORT_CACHE_MAX_STALENESS=60)
+    def test_stale_report_is_served_within_the_allowed_window(self):
+        etag = self.client.get("/api/reports/overview/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_order()
+
+        response = self.client.get("/api/reports/overview/")
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.data["total_orders"], 0)
+
+
+class LoadDataAndBenchmarkTests(ApiTestCase):
+    def test_generated_orders_match_their_items_and_rollups(self):
+        call_command(
+            "generate_load_data", customers=5, orders=40, products=4, days=30, batch_size=16, seed=7,
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(User.objects.filter(email__startswith="carga-").count(), 5)
+        self.assertEqual(Order.objects.count(), 40)
+        for order in Order.objects.prefetch_related("items")[:10]:
+            self.assertEqual(order.total_amount, sum(item.subtotal for item in order.items.all()))
+        self.assert_matches_rebuild()
+
+    def test_benchmark_reports_percentiles_and_checks_budgets(self):
+        self.create_order()
+        results = benchmarks.run(iterations=3)
+        self.assertEqual(
+            [result.name for result in results],
+            [
+                "product-list",
+                "product-list-cold",
+                "order-list",
+                "order-create",
+                "order-set-status",
+                "report-overview",
+                "report-overview-cold",
+                "login",
+            ],
+        )
+        queries = {result.name: result.queries for result in results}
+        # The warm reads are served from the caches; the cold ones rebuild the payload on every request.
+        self.assertGreater(queries["product-list-cold"], queries["product-list"])
+        self.assertGreater(queries["report-overview-cold"], queries["report-overview"])
+        self.assertFalse(Order.objects.filter(customer__email__startswith="benchmark-").exists())
+        for result in results:
+            self.assertLessEqual(result.p50, result.p95)
+            self.assertLessEqual(result.p95, result.p99)
+
+        budgets = {result.name: {"p95_ms": 60_000, "queries": result.queries} for result in results}
+        self.assertEqual(benchmarks.check_budgets(results, budgets), [])
+        budgets["order-list"]["queries"] = 0
+        self.assertEqual(len(benchmarks.check_budgets(results, budgets)), 1)
+
+
+class MetricsTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+
+    def test_requests_are_recorded_per_endpoint(self):
+        self.authenticate(self.admin)
+        self.client.get("/api/products/")
+        self.client.get("/api/products/")
+        self.client.get(f"/api/products/{self.product.id}/")
+
+        snapshot = metrics.registry.snapshot()
+        product_list = snapshot[("product-list", "GET")]
+        self.assertEqual(product_list["count"], 2)
+        self.assertGreater(product_list["queries"], 0)
+        self.assertGreater(product_list["response_bytes"], 0)
+        self.assertEqual(snapshot[("product-detail", "GET")]["count"], 1)
+
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn('api_request_duration_seconds_count{endpoint="product-list",method="GET"} 2', body)
+        self.assertIn('api_request_duration_seconds_bucket{endpoint="product-list",method="GET",le="+Inf"} 2', body)
+        self.assertIn('api_throttle_rejections_total{scope="login_ip"} 0', body)
+
+    def test_metrics_are_admin_only(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 401)
+        self.authenticate(self.customer)
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+
+
+def throttle_rates(**rates):
+    rest_framework = dict(settings.REST_FRAMEWORK)
+    rest_framework["DEFAULT_THROTTLE_RATES"] = {**rest_framework["DEFAULT_THROTTLE_RATES"], **rates}
+    return override_settings(REST_FRAMEWORK=rest_framework)
+
+
+class ThrottleTests(ApiTestCase):
+    @throttle_rates(login_account="2/min", login_ip="100/min")
+    def test_login_is_throttled_per_account_before_hashing(self):
+        credentials = {"email": "cliente@example.com", "password": "incorrecta"}
+        for _ in range(2):
+            self.assertEqual(self.client.post("/api/auth/login/", credentials).status_code, 400)
+
+        with mock.patch("api.serializers.authenticate") as authenticate, self.assertNumQueries(0):
+            response = self.client.post("/api/auth/login/", credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        authenticate.assert_not_called()
+
+        other = {"email": "admin@example.com", "password": "Admin123!"}
+        self.assertEqual(self.client.post("/api/auth/login/", other).status_code, 200)
+        self.assertEqual(rejection_counts()["login_account"], 1)
+
+    @throttle_rates(login_ip="2/min", contact="1/min")
+    def test_login_and_contact_are_throttled_per_ip(self):
+        for email in ("a@example.com", "b@example.com"):
+            self.client.post("/api/auth/login/", {"email": email, "password": "x"})
+        response = self.client.post("/api/auth/login/", {"email": "c@example.com", "password": "x"})
+        self.assertEqual(response.status_code, 429)
+
+        message = {"message": "Hola"}
+        self.assertEqual(self.client.post("/api/contact/", message).status_code, 202)
+        self.assertEqual(self.client.post("/api/contact/", message).status_code, 429)
+        self.assertEqual(rejection_counts()["contact"], 1)
+
+
+    @throttle_rates(login_ip="2/min", login_account="100/min")
+    def test_forwarded_for_header_does_not_reset_the_window(self):
+        statuses = [
+            self.client.post(
+                "/api/auth/login/",
+                {"email": f"{n}@example.com", "password": "x"},
+                HTTP_X_FORWARDED_FOR=f"203.0.113.{n}",
+            ).status_code
+            for n in range(4)
+        ]
+        self.assertEqual(statuses, [400, 400, 429, 429])
+
+    @throttle_rates(contact="100/min")
+    def test_forwarded_for_header_does_not_change_the_contact_sender(self):
+        for n in range(2):
+            self.client.post("/api/contact/", {"message": "Hola"}, HTTP_X_FORWARDED_FOR=f"203.0.113.{n}")
+        self.assertEqual(self.contact_buffer.duplicates, 1)
+
+
+class ContactBufferTests(ApiTestCase):
+    def test_messages_are_written_in_batches(self):
+        for n in range(2):
+            response = self.client.post("/api/contact/", {"message": f"Hola {n}"})
+            self.assertEqual(response.status_code, 202)
+        self.assertFalse(ContactMessage.objects.exists())
+
+        with self.assertNumQueries(1):
+            self.contact_buffer.submit("Hola 2", sender="ip:127.0.0.1")
+        self.assertEqual(ContactMessage.objects.count(), 3)
+
+    def test_repeated_messages_from_one_sender_are_dropped(self):
+        self.authenticate(self.customer)
+        for message in ("Hola", "  hola ", "Hola"):
+            self.assertEqual(self.client.post("/api/contact/", {"message": message}).status_code, 202)
+        self.assertEqual(self.contact_buffer.submit("Hola", sender="ip:10.0.0.1"), contact_inbox.ACCEPTED)
+
+        self.contact_buffer.shutdown()
+        messages = list(ContactMessage.objects.order_by("pk").values_list("customer_id", "message"))
+        self.assertEqual(messages, [(self.customer.pk, "Hola"), (None, "Hola")])
+        self.assertEqual(self.contact_buffer.duplicates, 2)
+
+    def test_shutdown_flushes_and_later_messages_are_written_directly(self):
+        self.contact_buffer.submit("Primero", sender="ip:127.0.0.1")
+        self.contact_buffer.shutdown()
+        self.assertEqual(ContactMessage.objects.count(), 1)
+
+        self.contact_buffer.submit("Segundo", sender="ip:127.0.0.1")
+        self.assertEqual(ContactMessage.objects.count(), 2)
+
+    def test_deleted_sender_does_not_lose_the_batch(self):
+        other = User.objects.create_user(email="otro@example.com", password="x", username="otro")
+        self.contact_buffer.submit("Hola", sender=f"user:{other.pk}", customer_id=other.pk)
+        self.contact_buffer.submit("Buenas", sender=f"user:{self.customer.pk}", customer_id=self.customer.pk)
+        User.objects.filter(pk=other.pk).delete()
+
+        self.assertEqual(self.contact_buffer.flush(), 2)
+        messages = dict(ContactMessage.objects.values_list("message", "customer_id"))
+        self.assertEqual(messages, {"Hola": None, "Buenas": self.customer.pk})
+
+    def test_messages_turned_away_by_a_full_buffer_can_be_sent_again(self):
+        buffer = ContactBuffer(max_batch=10, flush_interval=None, max_pending=1)
+        self.assertEqual(buffer.submit("Hola", sender="ip:127.0.0.1"), contact_inbox.ACCEPTED)
+        with self.assertLogs("api.contact_inbox", "WARNING"):
+            self.assertEqual(buffer.submit("Buenas", sender="ip:127.0.0.1"), contact_inbox.FULL)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.submit("Buenas", sender="ip:127.0.0.1"), contact_inbox.ACCEPTED)
+        buffer.flush()
+        self.assertEqual(buffer.submit("Buenas", sender="ip:127.0.0.1"), contact_inbox.DUPLICATE)
+        self.assertEqual((buffer.dropped, buffer.duplicates), (1, 1))
+
+    def test_a_full_buffer_asks_the_sender_to_retry(self):
+        self.contact_buffer.max_pending = 0
+        with self.assertLogs("api.contact_inbox", "WARNING"):
+            response = self.client.post("/api/contact/", {"message": "Hola"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+        self.contact_buffer.max_pending = 10
+        self.assertEqual(self.client.post("/api/contact/", {"message": "Hola"}).status_code, 202)
+        self.assertEqual(self.client.post("/api/contact/", {"message": "Hola"}).status_code, 202)
+        self.assertEqual(self.contact_buffer.duplicates, 1)
+
+    def test_failed_writes_keep_at_most_max_pending_messages(self):
+        buffer = ContactBuffer(max_batch=10, flush_interval=None, max_pending=3)
+        for n in range(3):
+            buffer.submit(f"Hola {n}", sender="ip:127.0.0.1")
+
+        def failing_write(*args, **kwargs):
+            # Another request submits while the write is in flight.
+            buffer.submit("Tarde", sender="ip:10.0.0.1")
+            raise DatabaseError
+
+        with mock.patch.object(ContactMessage.objects, "bulk_create", side_effect=failing_write):
+            with self.assertLogs("api.contact_inbox", "WARNING") as logs:
+                self.assertEqual(buffer.flush(), 0)
+        self.assertIn("dropping 1 messages", logs.output[-1])
+        self.assertEqual([message.message for message in buffer._pending], ["Hola 0", "Hola 1", "Hola 2"])
+        self.assertEqual(buffer.dropped, 1)
+
+    def test_created_at_is_the_time_of_submission(self):
+        submitted = timezone.now() - timedelta(minutes=5)
+        with mock.patch("api.contact_inbox.timezone.now", return_value=submitted):
+            self.contact_buffer.submit("Hola", sender="ip:127.0.0.1")
+        self.contact_buffer.flush()
+        self.assertEqual(ContactMessage.objects.get().created_at, submitted)
+
+    def test_admin_list_includes_buffered_messages(self):
+        self.client.post("/api/contact/", {"message": "Hola"})
+        self.authenticate(self.admin)
+        response = self.client.get("/api/contact/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([message["message"] for message in response.data], ["Hola"])
+
+
+class CachedTokenAuthenticationTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.customer)
+        self.client.get("/api/orders/")
+
+    def test_cached_token_skips_the_token_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/orders/")
+        self.assertFalse([q for q in queries if "authtoken_token" in q["sql"]])
+
+        local_tokens.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/orders/")
+        self.assertFalse([q for q in queries if "authtoken_token" in q["sql"]])
+
+    def test_user_changes_and_logout_invalidate_the_cache(self):
+        self.assertEqual(self.client.get("/api/reports/overview/").status_code, 403)
+        self.customer.role = User.Role.ADMIN
+        self.customer.save()
+        self.assertEqual(self.client.get("/api/reports/overview/").status_code, 200)
+
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get("/api/orders/").status_code, 401)
+
+        self.customer.is_active = True
+        self.customer.save()
+        self.assertEqual(self.client.post("/api/auth/logout/").status_code, 204)
+        self.assertEqual(self.client.get("/api/orders/").status_code, 401)
+
+    def test_entries_cached_before_the_commit_are_dropped_after_it(self):
+        token = Token.objects.get(user=self.customer)
+        still_active = User.objects.get(pk=self.customer.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.is_active = False
+            self.customer.save()
+            # A request on another connection still reads the committed, active user and caches it.
+            cache.set(f"api:auth:token:{token.key}", (still_active, token.created))
+        local_tokens.clear()
+        self.assertEqual(self.client.get("/api/orders/").status_code, 401)
+
+    @override_settings(AUTH_TOKEN_TTL=3600, AUTH_TOKEN_ROTATE_AFTER=600)
+    def test_tokens_expire_and_rotate_on_login(self):
+        Token.objects.filter(user=self.customer).update(created=timezone.now() - timedelta(hours=2))
+        local_tokens.clear()
+        cache.clear()
+        self.assertEqual(self.client.get("/api/orders/").status_code, 401)
+
+        credentials = {"email": "cliente@example.com", "password": "Cliente123!"}
+        first = self.client.post("/api/auth/login/", credentials).data["token"]
+        self.assertEqual(self.client.post("/api/auth/login/", credentials).data["token"], first)
+
+        Token.objects.filter(key=first).update(created=timezone.now() - timedelta(minutes=20))
+        rotated = self.client.post("/api/auth/login/", credentials).data["token"]
+        self.assertNotEqual(rotated, first)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {first}")
+        self.assertEqual(self.client.get("/api/orders/").status_code, 401)
+
+
+class AsyncReadPathTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = self.create_order(quantity=2)
+        self.create_order(customer=self.admin)
+        self.token = Token.objects.create(user=self.customer).key
+        self.admin_token = Token.objects.create(user=self.admin).key
+
+    def sync_get(self, path, token):
+        self.client.credentials(**({"HTTP_AUTHORIZATION": f"Token {token}"} if token else {}))
+        return self.client.get(path)
+
+    async def async_get(self, path, token=None, **headers):
+        if token:
+            headers["Authorization"] = f"Token {token}"
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            response = await AsyncClient().get(path, headers=headers)
+            response.view_name = response.resolver_match.view_name
+        return response
+
+    async def test_async_reads_match_the_sync_views(self):
+        for path, token in (
+            ("/api/products/", None),
+            (f"/api/products/{self.product.id}/", None),
+            ("/api/orders/", self.token),
+            (f"/api/orders/{self.order.id}/", self.token),
+            ("/api/orders/?fields=id,total&expand=items.product", self.token),
+            ("/api/reports/overview/", self.admin_token),
+        ):
+            expected = await sync_to_async(self.sync_get)(path, token)
+            response = await self.async_get(path, token)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(response.json(), expected.json(), path)
+            self.assertTrue(response.view_name.endswith("-async"), path)
+
+    async def test_async_reads_answer_conditional_requests(self):
+        response = await self.async_get("/api/products/")
+        again = await self.async_get("/api/products/", If_None_Match=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+        report = await self.async_get("/api/reports/overview/", self.admin_token)
+        again = await self.async_get("/api/reports/overview/", self.admin_token, If_None_Match=report["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+    async def test_async_reads_enforce_access(self):
+        self.assertEqual((await self.async_get("/api/orders/")).status_code, 401)
+        self.assertEqual((await self.async_get("/api/reports/overview/", self.token)).status_code, 403)
+        other = await Order.objects.filter(customer=self.admin).afirst()
+        self.assertEqual((await self.async_get(f"/api/orders/{other.id}/", self.token)).status_code, 404)
+        self.assertEqual((await self.async_get("/api/products/999999/")).status_code, 404)
+
+    async def test_archive_reads_fall_through_to_the_sync_views(self):
+        path = "/api/reports/overview/?include_archived=1"
+        expected = await sync_to_async(self.sync_get)(path, self.admin_token)
+        response = await self.async_get(path, self.admin_token)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response["ETag"], expected["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    async def test_exports_stream_from_the_event_loop(self):
+        def export():
+            return b"".join(self.sync_get("/api/exports/orders.ndjson", self.admin_token).streaming_content)
+
+        expected = await sync_to_async(export)()
+        response = await self.async_get("/api/exports/orders.ndjson", self.admin_token)
+        self.assertEqual(response.view_name, "orders-export-async")
+        self.assertTrue(response.is_async)
+        self.assertEqual(b"".join([block async for block in response.streaming_content]), expected)
+        self.assertEqual((await self.async_get("/api/exports/orders.ndjson", self.token)).status_code, 403)
+
+    def test_writes_and_searches_fall_through_to_the_sync_views(self):
+        self.authenticate(self.customer)
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            payload = {"items": [{"product": self.product.id, "quantity": 1}]}
+            response = self.client.post("/api/orders/", payload, format="json")
+            self.assertEqual(response.status_code, 201)
+            response = self.client.get("/api/products/", {"search": "concha"})
+            self.assertEqual(response.json()["results"][0]["id"], self.product.id)
+
+
+class StatusTransitionTests(ApiTestCase):
+    def set_status(self, order, status, **extra):
+        self.authenticate(self.admin)
+        return self.client.post(f"/api/orders/{order.id}/set_status/", {"status": status, **extra}, format="json")
+
+    def test_transition_writes_only_status_version_and_timestamp(self):
+        order = self.create_order()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.set_status(order, "in_process", version=order.version)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["status"], response.data["version"]), ("in_process", order.version + 1))
+        update = next(q["sql"] for q in queries.captured_queries if q["sql"].startswith('UPDATE "api_order" '))
+        self.assertIn('"version" = ', update.split("WHERE")[1])
+        self.assertNotIn('"notes"', update)
+        self.assert_matches_rebuild()
+
+    def test_illegal_transitions_are_rejected(self):
+        order = self.create_order(status=Order.Status.COMPLETED)
+        response = self.set_status(order, "new")
+        self.assertEqual(response.status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.COMPLETED)
+        self.assertEqual(self.set_status(order, "completed").status_code, 200)
+
+    def test_stale_versions_conflict(self):
+        order = self.create_order()
+        stale = order.version
+        self.assertEqual(self.set_status(order, "in_process", version=stale).status_code, 200)
+        response = self.set_status(order, "completed", version=stale)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.data["status"], response.data["version"]), ("in_process", stale + 1))
+
+    def changed_meanwhile(self, **changes):
+        """Apply ``changes`` to the order between the view's read and its conditional UPDATE."""
+        transition = order_status.transition
+
+        def racing(order, target):
+            Order.objects.filter(pk=order.pk).update(version=F("version") + 1, **changes)
+            return transition(order, target)
+
+        return mock.patch.object(order_status, "transition", side_effect=racing)
+
+    def test_orders_changed_by_another_admin_conflict(self):
+        for changes, expected in (({}, "new"), ({"status": Order.Status.COMPLETED}, "completed")):
+            order = self.create_order()
+            with self.changed_meanwhile(**changes):
+                response = self.set_status(order, "in_process", version=order.version)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual((response.data["status"], response.data["version"]), (expected, order.version + 1))
+        self.assertFalse(Order.objects.filter(status=Order.Status.IN_PROGRESS).exists())
+
+    def transitioned_after_loading(self):
+        """Move the order to in_process right after the view loads it, as a racing set_status would."""
+        get_object = OrderViewSet.get_object
+
+        def racing(view):
+            order = get_object(view)
+            order_status.transition(Order.objects.get(pk=order.pk), Order.Status.IN_PROGRESS)
+            return order
+
+        return mock.patch.object(OrderViewSet, "get_object", racing)
+
+    def test_edits_do_not_undo_a_concurrent_transition(self):
+        order = self.create_order()
+        stale = Order.objects.get(pk=order.pk)
+        order_status.transition(Order.objects.get(pk=order.pk), Order.Status.IN_PROGRESS)
+        serializer = OrderSerializer(stale, data={"notes": "Sin azucar"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(StaleOrder):
+            serializer.save()
+
+        order = self.create_order()
+        self.authenticate(self.customer)
+        with self.transitioned_after_loading():
+            response = self.client.patch(f"/api/orders/{order.id}/", {"notes": "Sin azucar"}, format="json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.data["status"], response.data["version"]), ("in_process", order.version + 1))
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.notes), (Order.Status.IN_PROGRESS, ""))
+        self.assert_matches_rebuild()
+
+    def test_edits_with_a_stale_version_conflict_and_write_only_changed_fields(self):
+        order = self.create_order()
+        self.authenticate(self.customer)
+        url = f"/api/orders/{order.id}/"
+        response = self.client.patch(url, {"notes": "Sin azucar", "version": order.version + 1}, format="json")
+        self.assertEqual(response.status_code, 409)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {"notes": "Sin azucar", "version": order.version}, format="json")
+        self.assertEqual((response.status_code, response.data["version"]), (200, order.version + 1))
+        update = next(q["sql"] for q in queries.captured_queries if q["sql"].startswith('UPDATE "api_order" '))
+        self.assertNotIn('"status"', update)
+        self.assertNotIn('"total_amount"', update)
+
+    def test_deleting_a_changed_order_conflicts(self):
+        order = self.create_order()
+        self.authenticate(self.customer)
+        with self.transitioned_after_loading():
+            self.assertEqual(self.client.delete(f"/api/orders/{order.id}/").status_code, 409)
+        self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+        self.assert_matches_rebuild()
+
+    def test_status_cannot_be_patched_directly(self):
+        order = self.create_order()
+        self.authenticate(self.customer)
+        response = self.client.patch(f"/api/orders/{order.id}/", {"status": "completed"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.NEW)
+
+
+@override_settings(NTFY_TOPIC=None)
+class StatusTransitionConcurrencyTests(TransactionTestCase):
+    workers = 8
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            # Shared-cache in-memory SQLite fails concurrent writers instead of making them wait.
+            self.skipTest("needs a database that serializes concurrent writers")
+
+    def test_racing_admins_get_exactly_one_success(self):
+        product = Product.objects.create(name="Rosca", price=Decimal("150.00"), stock=10)
+        customer = User.objects.create_user(email="c@example.com", password="x", username="c")
+        order = Order.objects.create(customer=customer)
+        OrderItem.objects.create(order=order, product=product, quantity=1)
+        admins = [
+            User.objects.create_user(
+                email=f"a{index}@example.com", password="x", username=f"a{index}", role=User.Role.ADMIN
+            )
+            for index in range(self.workers)
+        ]
+        tokens = [Token.objects.create(user=admin).key for admin in admins]
+        start = threading.Barrier(self.workers)
+        outcomes, lock = [], threading.Lock()
+
+        def change_status(worker):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {tokens[worker]}")
+            target = "in_process" if worker % 2 else "completed"
+            try:
+                start.wait(timeout=10)
+                response = client.post(
+                    f"/api/orders/{order.id}/set_status/", {"status": target, "version": 1}, format="json"
+                )
+                with lock:
+                    outcomes.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=change_status, args=(worker,)) for worker in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertFalse(any(thread.is_alive() for thread in threads), "workers deadlocked")
+
+        self.assertEqual(sorted(outcomes), [200] + [409] * (self.workers - 1))
+        order.refresh_from_db()
+        self.assertEqual(order.version, 2)
+        self.assertEqual(DailyOrderRollup.objects.get(status=order.status).order_count, 1)
+        self.assertFalse(DailyOrderRollup.objects.exclude(status=order.status).exclude(order_count=0).exists())
+
+
+class BulkStatusTests(ApiTestCase):
+    def test_orders_move_in_one_update_with_a_result_per_id(self):
+        fresh = [self.create_order(quantity=2) for _ in range(3)]
+        started = self.create_order(status=Order.Status.IN_PROGRESS)
+        done = self.create_order(status=Order.Status.COMPLETED)
+        ids = [order.id for order in fresh] + [started.id, done.id, 999999]
+        self.authenticate(self.admin)
+
+        with mock.patch("api.views.queue_ntfy_message") as notify, CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/api/orders/bulk_set_status/", {"ids": ids, "status": "completed"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 4)
+        self.assertEqual(
+            [(row["id"], row["result"]) for row in response.data["results"]],
+            [(pk, "updated") for pk in ids[:4]] + [(done.id, "unchanged"), (999999, "not_found")],
+        )
+        order_updates = [q for q in queries.captured_queries if q["sql"].startswith('UPDATE "api_order" ')]
+        self.assertEqual(len(order_updates), 1)
+        notify.assert_called_once()
+        self.assertIn("4 pedidos pasaron a Completado", notify.call_args.args[0])
+        self.assertEqual(set(Order.objects.values_list("status", flat=True)), {"completed"})
+        self.assert_matches_rebuild()
+
+    def test_disallowed_transitions_are_reported_and_left_alone(self):
+        done = self.create_order(status=Order.Status.COMPLETED)
+        self.authenticate(self.admin)
+        with mock.patch("api.views.queue_ntfy_message") as notify:
+            response = self.client.post(
+                "/api/orders/bulk_set_status/", {"ids": [done.id], "status": "in_process"}, format="json"
+            )
+        self.assertEqual(response.data["results"], [{"id": done.id, "result": "invalid_transition"}])
+        notify.assert_not_called()
+        done.refresh_from_db()
+        self.assertEqual(done.status, Order.Status.COMPLETED)
+
+    def test_only_admins_can_bulk_update(self):
+        order = self.create_order()
+        self.authenticate(self.customer)
+        response = self.client.post(
+            "/api/orders/bulk_set_status/", {"ids": [order.id], "status": "completed"}, format="json"
+        )
+        self.assertEqual(response.status_code, 403)
+        self.authenticate(self.admin)
+        response = self.client.post("/api/orders/bulk_set_status/", {"ids": [], "status": "done"}, format="json")
+        self.assertEqual(set(response.data), {"ids", "status"})
+
+
+@override_settings(ORDER_CHANGES_SETTLE_SECONDS=0)
+class OrderChangesTests(ApiTestCase):
+    def sync(self, since=None, **params):
+        if since:
+            params["since"] = since
+        response = self.client.get("/api/orders/changes/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_only_orders_written_after_the_cursor_are_returned(self):
+        first, second = self.create_order(), self.create_order()
+        self.authenticate(self.customer)
+        page = self.sync()
+        self.assertEqual([order["id"] for order in page["results"]], [first.id, second.id])
+
+        self.assertEqual(self.sync(page["cursor"])["results"], [])
+        OrderItem.objects.create(order=first, product=self.product, quantity=3)
+        page = self.sync(page["cursor"])
+        self.assertEqual([order["id"] for order in page["results"]], [first.id])
+
+        self.authenticate(self.admin)
+        self.client.post(f"/api/orders/{second.id}/set_status/", {"status": "completed"}, format="json")
+        self.authenticate(self.customer)
+        page = self.sync(page["cursor"])
+        self.assertEqual([(order["id"], order["status"]) for order in page["results"]], [(second.id, "completed")])
+
+    def test_deleted_orders_are_reported_to_their_owner(self):
+        mine, theirs = self.create_order(), self.create_order(customer=self.admin)
+        self.authenticate(self.customer)
+        cursor = self.sync()["cursor"]
+        mine_id, theirs_id = mine.id, theirs.id
+        mine.delete()
+        theirs.delete()
+
+        page = self.sync(cursor)
+        self.assertEqual((page["results"], page["deleted"]), ([], [mine_id]))
+        self.authenticate(self.admin)
+        self.assertEqual(self.sync(cursor)["deleted"], [mine_id, theirs_id])
+
+    def test_pages_follow_the_cursor(self):
+        orders = [self.create_order() for _ in range(5)]
+        self.authenticate(self.customer)
+        seen, cursor, has_more = [], None, True
+        while has_more:
+            page = self.sync(cursor, page_size=2)
+            seen += [order["id"] for order in page["results"]]
+            cursor, has_more = page["cursor"], page["has_more"]
+        self.assertEqual(seen, [order.id for order in orders])
+
+    def test_recent_changes_are_sent_again_until_they_settle(self):
+        order = self.create_order()
+        self.authenticate(self.customer)
+        with override_settings(ORDER_CHANGES_SETTLE_SECONDS=60):
+            cursor = self.sync()["cursor"]
+            self.assertEqual([row["id"] for row in self.sync(cursor)["results"]], [order.id])
+
+    def test_bad_and_expired_cursors_are_rejected(self):
+        self.authenticate(self.customer)
+        self.assertEqual(self.client.get("/api/orders/changes/", {"since": "ayer"}).status_code, 400)
+        response = self.client.get("/api/orders/changes/", {"since": "0-0"})
+        self.assertEqual(response.status_code, 410)
+
+    def test_out_of_range_cursors_are_rejected(self):
+        self.authenticate(self.customer)
+        for since in ("999999999999999999999999-1", f"1-{2**63}", "-5-1", "1--5", "+1-1", "1-²"):
+            response = self.client.get("/api/orders/changes/", {"since": since})
+            self.assertEqual(response.status_code, 400, since)
+
+
+@override_settings(ORDER_EVENTS_STREAM=True)
+class OrderEventTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.broker = events.LocalBroker(queue_size=3)
+        patcher = mock.patch.object(events, "_broker", self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_creations_and_status_changes_are_published_after_commit(self):
+        published = []
+        with mock.patch.object(self.broker, "publish", published.append):
+            with self.captureOnCommitCallbacks(execute=True):
+                order = self.create_order()
+            with self.captureOnCommitCallbacks(execute=True):
+                order.notes = "Sin nueces"
+                order.save()
+            self.authenticate(self.admin)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f"/api/orders/{order.id}/set_status/", {"status": "in_process"}, format="json")
+        self.assertEqual(
+            published,
+            [
+                events.OrderEvent(events.CREATED, order.id, self.customer.id, "new"),
+                events.OrderEvent(events.STATUS_CHANGED, order.id, self.customer.id, "in_process", "new"),
+            ],
+        )
+
+    async def test_subscribers_receive_their_events_and_are_cut_off_when_behind(self):
+        everything = self.broker.subscribe()
+        own = self.broker.subscribe(customer=self.customer.id)
+        mine = events.OrderEvent(events.CREATED, 1, self.customer.id, "new")
+        other = events.OrderEvent(events.CREATED, 2, self.admin.id, "new")
+        await sync_to_async(self.broker.publish)(mine)
+        self.broker.publish(other)
+        await asyncio.sleep(0)
+
+        self.assertEqual([await everything.get(1), await everything.get(1)], [mine, other])
+        self.assertEqual(await own.get(1), mine)
+        with self.assertRaises(TimeoutError):
+            await own.get(0.01)
+
+        for _ in range(4):
+            self.broker.publish(mine)
+        await asyncio.sleep(0)
+        self.assertIs(await own.get(1), events.OVERFLOW)
+        own.close()
+        everything.close()
+        self.assertEqual(self.broker.subscriber_count, 0)
+
+    async def open_stream(self, query="", **headers):
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            return await AsyncClient().get(f"/api/orders/events/{query}", headers=headers)
+
+    async def test_stream_sends_customers_only_their_own_orders(self):
+        ticket = (await sync_to_async(self.ticket_for)(self.customer))["ticket"]
+        response = await self.open_stream(f"?ticket={ticket}")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b"retry: "))
+        self.assertEqual(self.broker.subscriber_count, 1)
+
+        self.broker.publish(events.OrderEvent(events.CREATED, 2, self.admin.id, "new"))
+        self.broker.publish(events.OrderEvent(events.STATUS_CHANGED, 1, self.customer.id, "completed", "new"))
+        chunk = (await anext(stream)).decode()
+        self.assertEqual(chunk.splitlines()[0], "event: order.status_changed")
+        self.assertEqual(
+            json.loads(chunk.splitlines()[1][len("data: "):]),
+            {"id": 1, "customer": self.customer.id, "status": "completed", "previous_status": "new"},
+        )
+
+        # ASGIHandler cancels the response when the client disconnects.
+        waiting = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(self.broker.subscriber_count, 0)
+
+    async def test_stream_requires_a_valid_ticket_or_token(self):
+        self.assertEqual((await self.open_stream()).status_code, 401)
+        self.assertEqual((await self.open_stream("?ticket=forged")).status_code, 401)
+        token = await Token.objects.acreate(user=self.admin)
+        with override_settings(ORDER_EVENTS_KEEPALIVE=0.01):
+            response = await self.open_stream(Authorization=f"Token {token.key}")
+            stream = aiter(response.streaming_content)
+            await anext(stream)
+            self.assertEqual(await anext(stream), b": keepalive\n\n")
+
+    @override_settings(ORDER_EVENTS_STREAM=False)
+    def test_no_tickets_where_the_stream_is_not_served(self):
+        self.authenticate(self.customer)
+        self.assertEqual(self.client.post("/api/orders/events/ticket/").status_code, 404)
+
+    def test_asgi_settings_serve_the_stream(self):
+        self.assertEqual(asgi_settings.ROOT_URLCONF, "backend.asgi_urls")
+        self.assertTrue(asgi_settings.ORDER_EVENTS_STREAM)
+
+    def ticket_for(self, user):
+        self.authenticate(user)
+        response = self.client.post("/api/orders/events/ticket/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(events.ticket_user_id(response.data["ticket"]), user.id)
+        return response.data
+
+
+class OrderArchiveTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        old = timezone.now() - timedelta(days=800)
+        self.old = [
+            self.create_order(status=Order.Status.COMPLETED, order_date=old + timedelta(days=n), quantity=n + 1)
+            for n in range(3)
+        ]
+        self.old_open = self.create_order(status=Order.Status.IN_PROGRESS, order_date=old)
+        self.recent = self.create_order(status=Order.Status.COMPLETED)
+        self.before = archive.cutoff(12)
+
+    def test_months_before_clamps_to_the_end_of_the_month(self):
+        moment = timezone.now().replace(year=2024, month=3, day=31)
+        self.assertEqual(archive.months_before(moment, 1).date().isoformat(), "2024-02-29")
+        self.assertEqual(archive.months_before(moment, 15).date().isoformat(), "2022-12-31")
+
+    def test_batches_move_old_completed_orders_and_their_items(self):
+        self.assertEqual(archive.archive_batch(self.before, batch_size=2), 2)
+        self.assertEqual(archive.archive_batch(self.before, batch_size=2), 1)
+        self.assertEqual(archive.archive_batch(self.before, batch_size=2), 0)
+
+        self.assertEqual(set(Order.objects.values_list("pk", flat=True)), {self.old_open.pk, self.recent.pk})
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[order.pk for order in self.old]).exists())
+        archived = ArchivedOrder.objects.get(pk=self.old[2].pk)
+        self.assertEqual((archived.total_amount, archived.customer_id), (self.old[2].total, self.customer.pk))
+        self.assertEqual(list(archived.items.values_list("quantity", flat=True)), [3])
+        self.assertEqual(ArchivedOrderItem.objects.count(), 3)
+        # Archived orders are not deletions: delta sync keeps the client's copy.
+        self.assertFalse(OrderTombstone.objects.exists())
+        self.assert_matches_rebuild()
+
+    def test_command_is_resumable(self):
+        out = io.StringIO()
+        call_command("archive_orders", "--dry-run", stdout=out)
+        self.assertIn("3 pedidos", out.getvalue())
+
+        call_command("archive_orders", "--batch-size", "1", "--max-batches", "2", stdout=io.StringIO())
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+        out = io.StringIO()
+        call_command("archive_orders", "--measure", stdout=out)
+        self.assertEqual(ArchivedOrder.objects.count(), 3)
+        self.assertIn("quedan 0 por archivar", out.getvalue())
+        self.assertIn("api_order ", out.getvalue())
+
+    def test_archived_orders_are_listed_only_on_request(self):
+        other = User.objects.create_user(email="otro@example.com", password="x", username="otro")
+        foreign = self.create_order(
+            customer=other, status=Order.Status.COMPLETED, order_date=timezone.now() - timedelta(days=800)
+        )
+        archive.archive_batch(self.before)
+
+        self.authenticate(self.customer)
+        listed = [order["id"] for order in self.client.get("/api/orders/").data["results"]]
+        self.assertEqual(set(listed), {self.old_open.pk, self.recent.pk})
+
+        response = self.client.get("/api/orders/archived/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order["id"] for order in response.data["results"]], [order.pk for order in self.old][::-1])
+        detail = self.client.get(f"/api/orders/archived/{self.old[0].pk}/").data
+        self.assertEqual((detail["status"], detail["items"][0]["quantity"]), ("completed", 1))
+        self.assertEqual(self.client.get(f"/api/orders/archived/{foreign.pk}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/orders/{self.old[0].pk}/").status_code, 404)
+
+        self.authenticate(self.admin)
+        response = self.client.get("/api/orders/archived/")
+        self.assertIn(foreign.pk, [order["id"] for order in response.data["results"]])
+
+    def test_report_includes_the_archive_on_request(self):
+        self.authenticate(self.admin)
+        before = self.client.get("/api/reports/overview/").data
+        with self.captureOnCommitCallbacks(execute=True):
+            archive.archive_batch(self.before)
+
+        hot = self.client.get("/api/reports/overview/").data
+        self.assertEqual(hot["total_orders"], 2)
+        self.assertEqual(hot["orders_by_status"], {"completed": 1, "in_process": 1})
+        response = self.client.get("/api/reports/overview/?include_archived=1")
+        self.assertEqual(response.data, before)
+        self.assertNotEqual(response["ETag"], self.client.get("/api/reports/overview/")["ETag"])
+
+
+class ThroughputComparisonTests(TransactionTestCase):
+    def test_both_handlers_serve_every_read_path(self):
+        product = Product.objects.create(name="Concha", price=Decimal("25.00"), stock=10)
+        customer = User.objects.create_user(email="c@example.com", password="x", username="c")
+        order = Order.objects.create(customer=customer)
+        OrderItem.objects.create(order=order, product=product, quantity=1)
+
+        results = benchmarks.compare_throughput(concurrency=2, requests=10)
+        self.assertEqual([result.handler for result in results], ["wsgi", "asgi"])
+        self.assertTrue(all(result.requests == 10 and result.per_second > 0 for result in results))
+        self.assertFalse(User.objects.filter(email__startswith="benchmark-").exists())
+
+
+class ProductionScheduleTests(ApiTestCase):
+    def test_schedule_adds_up_quantities_per_delivery_day(self):
+        today = timezone.localdate()
+        tomorrow = today + timedelta(days=1)
+        cake = Product.objects.create(name="Tres leches", price=Decimal("250.00"))
+        first = self.create_order(quantity=2, delivery_date=tomorrow)
+        OrderItem.objects.create(order=first, product=cake, quantity=1, personalization="Feliz cumple Ana")
+        self.create_order(quantity=3, delivery_date=tomorrow)
+        self.create_order(quantity=5, delivery_date=today)
+        self.create_order(quantity=7, delivery_date=tomorrow, status=Order.Status.COMPLETED)
+        self.create_order(quantity=9, delivery_date=today + timedelta(days=20))
+        self.authenticate(self.admin)
+
+        response = self.client.get("/api/production/schedule/")
+        self.assertEqual(response.status_code, 200)
+        days = response.data["days"]
+        self.assertEqual([day["delivery_date"] for day in days], [today, tomorrow])
+        self.assertEqual(days[0]["products"], [{"id": self.product.id, "name": "Concha", "quantity": 5, "orders": 1}])
+        self.assertEqual(
+            [(p["name"], p["quantity"], p["orders"]) for p in days[1]["products"]],
+            [("Concha", 5, 2), ("Tres leches", 1, 1)],
+        )
+        self.assertEqual(
+            days[1]["personalized_orders"],
+            [
+                {
+                    "order": first.id,
+                    "customer": "cliente@example.com",
+                    "items": [{"product": "Tres leches", "quantity": 1, "personalization": "Feliz cumple Ana"}],
+                }
+            ],
+        )
+
+        day = tomorrow.isoformat()
+        response = self.client.get("/api/production/schedule/", {"from": day, "to": day, "status": "completed"})
+        self.assertEqual(response.data["days"][0]["products"][0]["quantity"], 7)
+
+    def test_unchanged_schedule_revalidates_without_queries(self):
+        self.authenticate(self.admin)
+        response = self.client.get("/api/production/schedule/")
+        with self.assertNumQueries(0):
+            again = self.client.get("/api/production/schedule/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_order(delivery_date=timezone.localdate())
+        again = self.client.get("/api/production/schedule/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 200)
+
+    def test_renamed_products_change_the_schedule_etag(self):
+        self.create_order(delivery_date=timezone.localdate())
+        self.authenticate(self.admin)
+        response = self.client.get("/api/production/schedule/")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Concha de nata"
+            self.product.save()
+        again = self.client.get("/api/production/schedule/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data["days"][0]["products"][0]["name"], "Concha de nata")
+
+    def test_schedule_validates_the_range(self):
+        self.authenticate(self.admin)
+        self.assertEqual(self.client.get("/api/production/schedule/", {"from": "manana"}).status_code, 400)
+        self.assertEqual(
+            self.client.get("/api/production/schedule/", {"from": "2026-01-01", "to": "2026-03-01"}).status_code, 400
+        )
+        self.assertEqual(self.client.get("/api/production/schedule/", {"status": "x"}).status_code, 400)
+
+
+class CustomerDirectoryTests(ApiTestCase):
+    def test_customers_carry_order_stats_in_one_query(self):
+        ana = User.objects.create_user(email="ana@example.com", password="x", username="ana", first_name="Ana")
+        self.create_order(customer=ana, quantity=2)
+        latest = self.create_order(customer=ana, quantity=1)
+        self.authenticate(self.admin)
+        self.client.get("/api/customers/")
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/customers/")
+        rows = {row["email"]: row for row in response.data["results"]}
+        self.assertEqual(rows["ana@example.com"]["order_count"], 2)
+        self.assertEqual(rows["ana@example.com"]["lifetime_spend"], "37.50")
+        self.assertEqual(
+            rows["ana@example.com"]["last_order_date"],
+            serializers.DateTimeField().to_representation(latest.order_date),
+        )
+        self.assertEqual(rows["cliente@example.com"]["order_count"], 0)
+        self.assertEqual(rows["cliente@example.com"]["lifetime_spend"], "0.00")
+        self.assertIsNone(rows["cliente@example.com"]["last_order_date"])
+        self.assertNotIn("admin@example.com", rows)
+
+    def test_order_stats_include_archived_orders(self):
+        ana = User.objects.create_user(email="ana@example.com", password="x", username="ana")
+        old = self.create_order(customer=ana, quantity=2, status=Order.Status.COMPLETED)
+        Order.objects.filter(pk=old.pk).update(order_date=timezone.now() - timedelta(days=800))
+        self.create_order(customer=ana, quantity=1)
+        pending = self.create_order(customer=ana, quantity=1)
+        Order.objects.filter(pk=pending.pk).update(order_date=timezone.now() - timedelta(days=900))
+        archive.archive_batch(archive.cutoff())
+        self.authenticate(self.admin)
+
+        rows = {row["email"]: row for row in self.client.get("/api/customers/").data["results"]}
+        self.assertEqual(rows["ana@example.com"]["order_count"], 3)
+        self.assertEqual(rows["ana@example.com"]["lifetime_spend"], "50.00")
+
+        Order.objects.filter(customer=ana).delete()
+        rows = {row["email"]: row for row in self.client.get("/api/customers/").data["results"]}
+        self.assertEqual(rows["ana@example.com"]["order_count"], 1)
+        self.assertEqual(
+            rows["ana@example.com"]["last_order_date"],
+            serializers.DateTimeField().to_representation(ArchivedOrder.objects.get().order_date),
+        )
+
+    def test_customers_are_paginated_and_searchable_by_prefix(self):
+        for n in range(5):
+            User.objects.create_user(
+                email=f"c{n}@example.com", password="x", username=f"c{n}", last_name="Gomez" if n % 2 else "Perez"
+            )
+        self.authenticate(self.admin)
+
+        response = self.client.get("/api/customers/", {"page_size": 2})
+        seen = [row["email"] for row in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen.extend(row["email"] for row in response.data["results"])
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), 6)
+
+        response = self.client.get("/api/customers/", {"search": "gom"})
+        self.assertEqual([row["email"] for row in response.data["results"]], ["c1@example.com", "c3@example.com"])
+        response = self.client.get("/api/customers/", {"search": "C3 gomez"})
+        self.assertEqual([row["email"] for row in response.data["results"]], ["c3@example.com"])
+        response = self.client.get("/api/customers/", {"search": "example"})
+        self.assertEqual(response.data["results"], [])
+
+
+class OrderExportTests(ApiTestCase):
+    def test_csv_export_has_one_row_per_item(self):
+        order = self.create_order(quantity=2)
+        cake = Product.objects.create(name="Tres leches", price=Decimal("250.00"))
+        OrderItem.objects.create(order=order, product=cake, quantity=1)
+        self.authenticate(self.admin)
+
+        response = self.client.get("/api/exports/orders.csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment", response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([row["product_name"] for row in rows], ["Concha", "Tres leches"])
+        self.assertEqual(rows[0]["subtotal"], "25.00")
+        self.assertEqual({row["order_id"] for row in rows}, {str(order.id)})
+
+    def test_ndjson_export_filters_by_day_and_status(self):
+        today = timezone.localdate()
+        recent = self.create_order(status=Order.Status.COMPLETED)
+        self.create_order()
+        self.create_order(status=Order.Status.COMPLETED, order_date=timezone.now() - timedelta(days=10))
+        self.authenticate(self.admin)
+
+        response = self.client.get(
+            "/api/exports/orders.ndjson",
+            {"from": (today - timedelta(days=1)).isoformat(), "status": Order.Status.COMPLETED},
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record["id"] for record in records], [recent.id])
+        self.assertEqual(records[0]["items"][0]["product_name"], "Concha")
+
+    def test_export_validation_and_permissions(self):
+        self.authenticate(self.customer)
+        self.assertEqual(self.client.get("/api/exports/orders.csv").status_code, 403)
+
+        self.authenticate(self.admin)
+        self.assertEqual(self.client.get("/api/exports/orders.csv", {"from": "ayer"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/exports/orders.csv", {"status": "x"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/exports/orders.xml").status_code, 404)
+
+    def test_export_command_writes_file(self):
+        self.create_order()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pedidos.ndjson")
+            call_command("export_orders", format="ndjson", output=path, stderr=io.StringIO())
+            with open(path, encoding="utf-8") as handle:
+                self.assertEqual(len(handle.readlines()), 1)
+
+
+class _NtfyStandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        with server.lock:
+            if server.failures_left:
+                server.failures_left -= 1
+                self.send_response(503)
+            else:
+                server.received.append((self.path, dict(self.headers), body))
+                self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class NtfyDispatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _NtfyStandIn)
+        self.server.lock = threading.Lock()
+        self.server.received = []
+        self.server.failures_left = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        settings_override = override_settings(
+            NTFY_SERVER=f"http://{host}:{port}", NTFY_TOPIC="pedidos", NTFY_TOKEN=None
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_burst_is_coalesced_into_one_notification(self):
+        dispatcher = NtfyDispatcher(workers=1, coalesce_window=0.3)
+        for index in range(3):
+            dispatcher.enqueue(f"Pedido #{index}", title="Nuevo pedido", tags=["bell"])
+        dispatcher.shutdown()
+
+        self.assertEqual(len(self.server.received), 1)
+        path, headers, body = self.server.received[0]
+        self.assertEqual(path, "/pedidos")
+        self.assertEqual(headers["Title"], "Nuevo pedido")
+        self.assertEqual(body.splitlines(), ["Pedido #0", "Pedido #1", "Pedido #2"])
+
+    def test_server_errors_are_retried(self):
+        self.server.failures_left = 2
+        dispatcher = NtfyDispatcher(workers=1, coalesce_window=0, retry_backoff=0.01)
+        dispatcher.enqueue("Pedido #1", title="Estado de pedido")
+        dispatcher.shutdown()
+
+        self.assertEqual([body for _, _, body in self.server.received], ["Pedido #1"])
+        self.assertEqual(dispatcher.sent, 1)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        dispatcher = NtfyDispatcher(workers=1, max_queue=1, coalesce_window=0)
+        dispatcher.start()
+        with self.server.lock, self.assertLogs("api.notifications", "WARNING"):
+            accepted = [dispatcher.enqueue(f"Pedido #{index}") for index in range(5)]
+        dispatcher.shutdown()
+
+        self.assertFalse(all(accepted))
+        self.assertEqual(dispatcher.dropped, accepted.count(False))
+        self.assertEqual(len(self.server.received), accepted.count(True))
+
+    def test_enqueue_after_shutdown_is_rejected(self):
+        dispatcher = NtfyDispatcher(workers=1)
+        dispatcher.shutdown()
+        self.assertFalse(dispatcher.enqueue("Pedido #1"))
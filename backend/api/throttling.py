@@ -0,0 +1,113 @@
+"""
+Sliding-window throttles for the anonymous endpoints.
+
+DRF's ``SimpleRateThrottle`` keeps a list of timestamps per client and
+rewrites it on every request. These throttles keep two fixed-window
+counters instead and weight the previous window by how much of it still
+overlaps the sliding window, so a check is one ``get_many`` and one
+atomic ``incr`` against the cache, with no locks. Throttles run before
+the view body, so rejected logins never reach password hashing or the
+database. Rejections are counted per scope in the cache.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+REJECTED_KEY = "api:throttle:rejected:{}"
+
+
+def rejection_counts() -> dict:
+    scopes = sorted(api_settings.DEFAULT_THROTTLE_RATES)
+    counts = cache.get_many([REJECTED_KEY.format(scope) for scope in scopes])
+    return {scope: counts.get(REJECTED_KEY.format(scope), 0) for scope in scopes}
+
+
+def _record_rejection(scope) -> None:
+    key = REJECTED_KEY.format(scope)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    cache_format = "api:throttle:%(scope)s:%(ident)s"
+
+    def get_rate(self):
+        # Read the rates on every request so overridden settings apply.
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request)
+        if not ident:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def allow_request(self, request, view):
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = time.time()
+        window = int(self.now // self.duration)
+        current_key, previous_key = f"{self.key}:{window}", f"{self.key}:{window - 1}"
+        counts = cache.get_many([current_key, previous_key])
+        self.current = counts.get(current_key, 0)
+        self.previous = counts.get(previous_key, 0)
+        self.elapsed = self.now - window * self.duration
+        if self._estimate(self.previous, self.current + 1, self.elapsed) > self.num_requests:
+            _record_rejection(self.scope)
+            return False
+
+        cache.add(current_key, 0, timeout=self.duration * 2)
+        try:
+            cache.incr(current_key)
+        except ValueError:
+            cache.add(current_key, 1, timeout=self.duration * 2)
+        return True
+
+    def _estimate(self, previous, current, elapsed):
+        return previous * (1 - elapsed / self.duration) + current
+
+    def wait(self):
+        """Seconds until the weighted count leaves room for one more request."""
+        room = self.num_requests - self.current - 1
+        if self.previous and room >= 0:
+            return max(0.0, (1 - room / self.previous) * self.duration - self.elapsed)
+        remaining = self.duration - self.elapsed
+        if self.current + 1 <= self.num_requests:
+            return remaining
+        return remaining + max(0.0, 1 - (self.num_requests - 1) / self.current) * self.duration
+
+
+class LoginIPThrottle(SlidingWindowThrottle):
+    scope = "login_ip"
+
+
+class LoginAccountThrottle(SlidingWindowThrottle):
+    scope = "login_account"
+
+    def get_ident_value(self, request):
+        email = request.data.get("email") if hasattr(request.data, "get") else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+class RegisterThrottle(SlidingWindowThrottle):
+    scope = "register"
+
+
+class ContactThrottle(SlidingWindowThrottle):
+    scope = "contact"
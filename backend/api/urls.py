@@ -5,7 +5,11 @@ from .views import (
     ContactMessageViewSet,
     CustomerViewSet,
     LoginView,
+    LogoutView,
+    MetricsView,
+    OrderExportView,
     OrderViewSet,
+    ProductionScheduleView,
     ProductViewSet,
     RegisterView,
     ReportView,
@@ -20,6 +24,10 @@ router.register(r"contact", ContactMessageViewSet, basename="contact")
 urlpatterns = [
     path("auth/register/", RegisterView.as_view(), name="auth-register"),
     path("auth/login/", LoginView.as_view(), name="auth-login"),
+    path("auth/logout/", LogoutView.as_view(), name="auth-logout"),
     path("reports/overview/", ReportView.as_view(), name="reports-overview"),
+    path("production/schedule/", ProductionScheduleView.as_view(), name="production-schedule"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("exports/orders.<str:file_format>", OrderExportView.as_view(), name="orders-export"),
     path("", include(router.urls)),
 ]
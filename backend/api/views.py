@@ -1,37 +1,72 @@
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
 
-from django.db.models import Count, Sum, F, DecimalField
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.http import HttpResponse, StreamingHttpResponse
 from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
 from rest_framework import status, viewsets
+from rest_framework.generics import get_object_or_404
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import ContactMessage, Order, Product, User
-from .notifications import send_ntfy_message
+from . import archive, contact_inbox, events, exports, metrics, order_status
+from .authentication import issue_token
+from .caching import catalog_cache, get_catalog_deleted_at, get_catalog_version, get_report_version
+from .changes import ExpiredCursor, InvalidCursor, order_changes
+from .conditional import conditional_response
+from .contact_inbox import get_buffer as get_contact_buffer
+from .directory import customer_directory
+from .inventory import adjust_stock
+from .models import ArchivedOrder, ContactMessage, DailyOrderRollup, DailySalesRollup, Order, OrderItem, Product, User
+from .notifications import queue_ntfy_message
+from .pagination import CustomerCursorPagination, OrderCursorPagination, ProductSearchPagination
 from .permissions import IsAdmin, IsAdminOrReadOnly
+from .search import search_product_ids
 from .serializers import (
+    ArchivedOrderSerializer,
+    BulkStatusSerializer,
     ContactMessageSerializer,
+    CustomerSerializer,
     LoginSerializer,
     OrderSerializer,
     ProductSerializer,
     RegisterSerializer,
     ReportSerializer,
+    StaleOrder,
     UserSerializer,
 )
+from .throttling import (
+    ContactThrottle,
+    LoginAccountThrottle,
+    LoginIPThrottle,
+    RegisterThrottle,
+    rejection_counts,
+)
 
 
 class RegisterView(APIView):
+    authentication_classes = []
     permission_classes = [AllowAny]
+    throttle_classes = [RegisterThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = RegisterSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response(
             {"token": token.key, "user": UserSerializer(user).data},
             status=status.HTTP_201_CREATED,
@@ -39,38 +74,156 @@ class RegisterView(APIView):
 
 
 class LoginView(APIView):
+    authentication_classes = []
     permission_classes = [AllowAny]
+    throttle_classes = [LoginIPThrottle, LoginAccountThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = LoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data["user"]
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response({"token": token.key, "user": UserSerializer(user).data})
 
 
+class LogoutView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.auth, Token):
+            request.auth.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def _query_date(request, param, default=None):
+    raw = request.query_params.get(param)
+    if not raw:
+        return default
+    try:
+        value = parse_date(raw)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({param: "Use el formato AAAA-MM-DD."})
+    return value
+
+
+def _query_flag(request, param):
+    return request.query_params.get(param, "").lower() in ("1", "true", "yes")
+
+
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by("-created_at")
     serializer_class = ProductSerializer
     permission_classes = [IsAdminOrReadOnly]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            queryset = ProductSerializer.setup_queryset(queryset, self.request)
+        return queryset
+
+    catalog_state = {"last_modified": Max("updated_at"), "count": Count("id")}
+
+    @staticmethod
+    def list_validator(request, state, deleted_at):
+        """The catalog list validator and Last-Modified time, from the catalog state and the last deletion."""
+        last_modified = state["last_modified"]
+        if deleted_at and (last_modified is None or deleted_at > last_modified.timestamp()):
+            last_modified = datetime.fromtimestamp(deleted_at, tz=dt_timezone.utc)
+        validator = ("list", state["version"], state["last_modified"], state["count"], request.GET.urlencode())
+        return validator, last_modified
+
+    @staticmethod
+    def body_version(state):
+        """
+        The version rendered catalog bodies are cached under. The catalog
+        counter catches writes whose ``updated_at`` commits behind a newer
+        one; ``last_modified`` and ``count`` catch another worker's writes
+        when the cache framework is not shared between workers.
+        """
+        return state["version"], state["last_modified"], state["count"]
+
+    def list(self, request, *args, **kwargs):
+        state = Product.objects.aggregate(**self.catalog_state)
+        state["version"] = get_catalog_version()
+        validator, last_modified = self.list_validator(request, state, get_catalog_deleted_at())
+        return conditional_response(
+            request, validator, last_modified, lambda: self._cached_list(request, state, *args, **kwargs)
+        )
+
+    def _cached_list(self, request, state, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return self._list_response(request, *args, **kwargs)
+        version = self.body_version(state)
+        key = request.GET.urlencode()
+        content = catalog_cache.get(version, key)
+        if content is None:
+            data = self._list_response(request, *args, **kwargs).data
+            content = request.accepted_renderer.render(
+                data, request.accepted_media_type, self.get_renderer_context()
+            )
+            catalog_cache.set(version, key, content)
+        return HttpResponse(content, content_type=request.accepted_media_type)
+
+    def _list_response(self, request, *args, **kwargs):
+        query = request.query_params.get("search", "")
+        if not query.strip():
+            return super().list(request, *args, **kwargs)
+        paginator = ProductSearchPagination()
+        page_ids = paginator.paginate_queryset(search_product_ids(query), request, view=self)
+        products = self.get_queryset().in_bulk(page_ids)
+        serializer = self.get_serializer([products[pk] for pk in page_ids if pk in products], many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            updated_at = (
+                Product.objects.filter(pk=kwargs[self.lookup_field])
+                .values_list("updated_at", flat=True)
+                .first()
+            )
+        except (TypeError, ValueError):
+            updated_at = None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        validator = ("detail", kwargs[self.lookup_field], updated_at, request.GET.urlencode())
+        return conditional_response(
+            request, validator, updated_at, lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs)
+        )
+
 
 class CustomerViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.filter(role=User.Role.CUSTOMER)
-    serializer_class = UserSerializer
+    serializer_class = CustomerSerializer
     permission_classes = [IsAdmin]
+    pagination_class = CustomerCursorPagination
+
+    def get_queryset(self):
+        return customer_directory(self.request.query_params.get("search"))
 
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
-        qs = Order.objects.select_related("customer").prefetch_related("items__product")
-        user = self.request.user
+        return self.visible_orders(self.request)
+
+    @staticmethod
+    def visible_orders(request):
+        if request.method in SAFE_METHODS:
+            # The cursor paginator reads order_date from the last row of each page.
+            qs = OrderSerializer.setup_queryset(Order.objects.all(), request, ("order_date",))
+        else:
+            qs = Order.objects.select_related("customer").prefetch_related("items__product")
+        status_value = request.query_params.get("status")
+        if status_value in dict(Order.Status.choices):
+            qs = qs.filter(status=status_value)
+        user = request.user
         if user.role == User.Role.ADMIN:
-            return qs.order_by("-order_date")
-        return qs.filter(customer=user).order_by("-order_date")
+            return qs.order_by("-order_date", "-id")
+        return qs.filter(customer=user).order_by("-order_date", "-id")
 
     def perform_create(self, serializer):
         request_user = self.request.user
@@ -81,6 +234,24 @@ class OrderViewSet(viewsets.ModelViewSet):
             order = serializer.save()
         self._notify_order_created(order)
 
+    def update(self, request, *args, **kwargs):
+        # Same as UpdateModelMixin.update, minus the prefetch cache reset:
+        # OrderSerializer.update re-prefetches the items it wrote.
+        partial = kwargs.pop("partial", False)
+        instance = self.get_object()
+        version = request.data.get("version", instance.version)
+        if isinstance(version, bool) or not str(version).isdigit():
+            return Response({"detail": "Version invalida."}, status=status.HTTP_400_BAD_REQUEST)
+        if int(version) != instance.version:
+            return self._status_conflict(instance.pk)
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        try:
+            self.perform_update(serializer)
+        except StaleOrder:
+            return self._status_conflict(instance.pk)
+        return Response(serializer.data)
+
     def perform_update(self, serializer):
         request_user = self.request.user
         instance = serializer.instance
@@ -89,18 +260,135 @@ class OrderViewSet(viewsets.ModelViewSet):
         customer = serializer.validated_data.get("customer", instance.customer)
         serializer.save(customer=customer)
 
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        try:
+            self.perform_destroy(instance)
+        except StaleOrder:
+            return self._status_conflict(instance.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # The order, then its products, then the rollup rows touched by delete(): the lock order of order writes.
+        OrderSerializer.lock(instance)
+        released = defaultdict(int)
+        for product_id, quantity in instance.items.values_list("product_id", "quantity"):
+            released[product_id] -= quantity
+        adjust_stock(released)
+        instance.delete()
+
     @action(detail=True, methods=["post"], permission_classes=[IsAdmin])
     def set_status(self, request, pk=None):
         order = self.get_object()
         status_value = request.data.get("status")
         if status_value not in dict(Order.Status.choices):
             return Response({"detail": "Estado invalido."}, status=status.HTTP_400_BAD_REQUEST)
+        version = request.data.get("version", order.version)
+        if isinstance(version, bool) or not str(version).isdigit():
+            return Response({"detail": "Version invalida."}, status=status.HTTP_400_BAD_REQUEST)
+        if int(version) != order.version:
+            return self._status_conflict(order.pk)
+        if status_value == order.status:
+            return Response(self.get_serializer(order).data)
+
         previous_status_display = order.get_status_display()
-        order.status = status_value
-        order.save()
+        try:
+            order_status.transition(order, status_value)
+        except order_status.InvalidTransition:
+            target_display = Order.Status(status_value).label
+            return Response(
+                {"detail": f"Un pedido {previous_status_display} no puede pasar a {target_display}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except order_status.TransitionConflict:
+            return self._status_conflict(order.pk)
         self._notify_order_status_updated(order, previous_status_display)
-        serializer = self.get_serializer(order)
-        return Response(serializer.data)
+        return Response(self.get_serializer(order).data)
+
+    @staticmethod
+    def _status_conflict(pk):
+        current = Order.objects.filter(pk=pk).values("status", "version").first()
+        return Response(
+            {"detail": "El pedido cambio mientras tanto; recargalo e intenta de nuevo.", **(current or {})},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAdmin])
+    def bulk_set_status(self, request):
+        serializer = BulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data["status"]
+        outcome = order_status.bulk_transition(serializer.validated_data["ids"], target)
+        if outcome.updated:
+            self._notify_orders_status_updated(outcome.updated, Order.Status(target).label)
+        return Response(
+            {
+                "status": target,
+                "updated": len(outcome.updated),
+                "results": [{"id": pk, "result": result} for pk, result in outcome.results.items()],
+            }
+        )
+
+    @action(detail=False, url_path="changes")
+    def changes(self, request):
+        """Orders written or deleted after ``?since=``, oldest first, with the cursor for the next call."""
+        orders = OrderSerializer.setup_queryset(Order.objects.all(), request, ("updated_at",))
+        customer_id = None
+        if request.user.role != User.Role.ADMIN:
+            orders = orders.filter(customer=request.user)
+            customer_id = request.user.pk
+        try:
+            limit = min(max(int(request.query_params.get("page_size", 100)), 1), 500)
+        except ValueError as exc:
+            raise ValidationError({"page_size": "Debe ser un numero entero."}) from exc
+        try:
+            result = order_changes(orders, customer_id, request.query_params.get("since"), limit)
+        except InvalidCursor as exc:
+            raise ValidationError({"since": "Cursor invalido."}) from exc
+        except ExpiredCursor:
+            return Response(
+                {"detail": "El cursor es demasiado antiguo; sincroniza de nuevo sin 'since'."},
+                status=status.HTTP_410_GONE,
+            )
+        return Response(
+            {
+                "results": self.get_serializer(result.orders, many=True).data,
+                "deleted": result.deleted,
+                "cursor": result.cursor,
+                "has_more": result.has_more,
+            }
+        )
+
+    @action(detail=False, url_path="archived")
+    def archived(self, request):
+        """Orders moved out of the hot tables by ``archive_orders``, newest first."""
+        page = self.paginate_queryset(self._archived_orders(request))
+        serializer = ArchivedOrderSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, url_path=r"archived/(?P<archived_pk>[0-9]+)")
+    def archived_detail(self, request, archived_pk=None):
+        order = get_object_or_404(self._archived_orders(request), pk=archived_pk)
+        return Response(ArchivedOrderSerializer(order, context=self.get_serializer_context()).data)
+
+    @staticmethod
+    def _archived_orders(request):
+        orders = ArchivedOrder.objects.select_related("customer").prefetch_related("items__product")
+        if request.user.role != User.Role.ADMIN:
+            orders = orders.filter(customer=request.user)
+        return orders.order_by("-order_date", "-id")
+
+    @action(detail=False, methods=["post"], url_path="events/ticket")
+    def events_ticket(self, request):
+        """Ticket for opening the order event stream, which is served by the ASGI application."""
+        if not settings.ORDER_EVENTS_STREAM:
+            # Tells the client to stop trying and reload the list instead.
+            return Response(
+                {"detail": "Los eventos en tiempo real no estan disponibles."}, status=status.HTTP_404_NOT_FOUND
+            )
+        ticket = events.issue_ticket(request.user)
+        return Response({"ticket": ticket, "expires_in": settings.ORDER_EVENTS_TICKET_TTL})
 
     def _notify_order_created(self, order):
         total_items = order.items.count()
@@ -110,7 +398,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             f"Pedido #{order.id} creado por {customer_name}. "
             f"Productos: {total_items}. Total estimado: ${total_formatted}."
         )
-        send_ntfy_message(
+        queue_ntfy_message(
             message,
             title="Nuevo pedido",
             tags=["bell"],
@@ -122,12 +410,23 @@ class OrderViewSet(viewsets.ModelViewSet):
             f"Pedido #{order.id} actualizado para {customer_name}: "
             f"{previous_status_display} → {order.get_status_display()}."
         )
-        send_ntfy_message(
+        queue_ntfy_message(
             message,
             title="Estado de pedido",
             tags=["information"],
         )
 
+    @staticmethod
+    def _notify_orders_status_updated(orders, status_display, listed=20):
+        ids = ", ".join(f"#{order.pk}" for order in orders[:listed])
+        if len(orders) > listed:
+            ids += f" y {len(orders) - listed} mas"
+        queue_ntfy_message(
+            f"{len(orders)} pedidos pasaron a {status_display}: {ids}.",
+            title="Estado de pedidos",
+            tags=["information"],
+        )
+
     @staticmethod
     def _get_customer_display(customer):
         full_name = customer.get_full_name().strip()
@@ -143,60 +442,253 @@ class ContactMessageViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return [IsAdmin()]
 
-    def perform_create(self, serializer):
-        customer = self.request.user if self.request.user.is_authenticated else None
-        serializer.save(customer=customer)
+    def get_throttles(self):
+        if self.action == "create":
+            return [ContactThrottle()]
+        return super().get_throttles()
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        customer = request.user if request.user.is_authenticated else None
+        sender = f"user:{customer.pk}" if customer else f"ip:{ContactThrottle().get_ident(request)}"
+        buffer = get_contact_buffer()
+        outcome = buffer.submit(
+            serializer.validated_data["message"], sender=sender, customer_id=customer.pk if customer else None
+        )
+        if outcome == contact_inbox.FULL:
+            # Not stored: tell the sender to try again once the next flush has made room.
+            response = Response(
+                {"detail": "No pudimos recibir tu mensaje en este momento; intenta de nuevo en unos segundos."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+            response["Retry-After"] = str(max(1, math.ceil(buffer.flush_interval or 0)))
+            return response
+        # Duplicates get the same answer as new messages, so a bot cannot tell they were dropped.
+        return Response({"detail": "Mensaje recibido."}, status=status.HTTP_202_ACCEPTED)
+
+    def list(self, request, *args, **kwargs):
+        get_contact_buffer().flush()
+        return super().list(request, *args, **kwargs)
+
+
+class OrderExportView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, file_format, *args, **kwargs):
+        if file_format not in exports.FORMATS:
+            return Response({"detail": "Formato no soportado."}, status=status.HTTP_404_NOT_FOUND)
+        filters = {"start": _query_date(request, "from"), "end": _query_date(request, "to")}
+        status_value = request.query_params.get("status")
+        if status_value:
+            if status_value not in dict(Order.Status.choices):
+                return Response({"detail": "Estado invalido."}, status=status.HTTP_400_BAD_REQUEST)
+            filters["status"] = status_value
+
+        orders = exports.export_queryset(**filters)
+        response = StreamingHttpResponse(
+            exports.stream_orders(orders, file_format), content_type=exports.FORMATS[file_format]
+        )
+        response["Content-Disposition"] = f'attachment; filename="pedidos.{file_format}"'
+        return response
 
 
-class ReportView(APIView):
+class ProductionScheduleView(APIView):
+    """What the kitchen has to make per delivery day, for orders not yet completed by default."""
+
     permission_classes = [IsAuthenticated, IsAdmin]
+    max_days = 31
 
     def get(self, request, *args, **kwargs):
-        total_orders = Order.objects.count()
-        revenue = Order.objects.prefetch_related("items__product")
-        revenue_value = (
-            revenue.aggregate(
-                total=Sum(
-                    F("items__quantity") * F("items__product__price"),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )["total"]
-            or Decimal("0.00")
+        start = _query_date(request, "from", timezone.localdate())
+        end = _query_date(request, "to", start + timedelta(days=6))
+        if end < start or (end - start).days >= self.max_days:
+            raise ValidationError({"to": f"El rango debe cubrir entre 1 y {self.max_days} dias."})
+        statuses = request.query_params.getlist("status") or [Order.Status.NEW, Order.Status.IN_PROGRESS]
+        if not set(statuses) <= set(dict(Order.Status.choices)):
+            raise ValidationError({"status": "Estado invalido."})
+
+        # Every order or item write bumps the report version and every product write the catalog
+        # version (product names are in the schedule), so together they validate it.
+        validator = (get_report_version(), get_catalog_version(), start, end, sorted(statuses))
+        return conditional_response(
+            request, validator, None, lambda: Response(self._build_schedule(start, end, statuses))
         )
 
+    @staticmethod
+    def _build_schedule(start, end, statuses):
+        items = OrderItem.objects.filter(
+            order__delivery_date__range=(start, end), order__status__in=statuses
+        )
+        days = {}
+
+        def day_entry(day):
+            if day not in days:
+                days[day] = {"delivery_date": day, "products": [], "personalized_orders": []}
+            return days[day]
+
+        totals = (
+            items.values("order__delivery_date", "product_id", "product__name")
+            .annotate(quantity=Sum("quantity"), orders=Count("order_id", distinct=True))
+            .order_by("order__delivery_date", "product__name")
+        )
+        for row in totals:
+            day_entry(row["order__delivery_date"])["products"].append(
+                {
+                    "id": row["product_id"],
+                    "name": row["product__name"],
+                    "quantity": row["quantity"],
+                    "orders": row["orders"],
+                }
+            )
+
+        personalized = (
+            items.exclude(personalization="")
+            .values(
+                "order_id",
+                "order__delivery_date",
+                "order__customer__first_name",
+                "order__customer__last_name",
+                "order__customer__email",
+                "product__name",
+                "quantity",
+                "personalization",
+            )
+            .order_by("order__delivery_date", "order_id", "id")
+        )
+        orders = {}
+        for row in personalized:
+            if row["order_id"] not in orders:
+                name = f"{row['order__customer__first_name']} {row['order__customer__last_name']}".strip()
+                orders[row["order_id"]] = {
+                    "order": row["order_id"],
+                    "customer": name or row["order__customer__email"],
+                    "items": [],
+                }
+                day_entry(row["order__delivery_date"])["personalized_orders"].append(orders[row["order_id"]])
+            orders[row["order_id"]]["items"].append(
+                {
+                    "product": row["product__name"],
+                    "quantity": row["quantity"],
+                    "personalization": row["personalization"],
+                }
+            )
+
+        return {"from": start, "to": end, "days": [days[day] for day in sorted(days)]}
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        catalog = catalog_cache.stats()
+        contact = get_contact_buffer()
+        extra = [
+            (
+                "api_throttle_rejections_total",
+                "Requests rejected by a throttle.",
+                {(("scope", scope),): count for scope, count in rejection_counts().items()},
+            ),
+            (
+                "api_catalog_cache_lookups_total",
+                "Lookups in this worker's rendered catalog cache.",
+                {(("result", "hit"),): catalog["hits"], (("result", "miss"),): catalog["misses"]},
+            ),
+            (
+                "api_contact_messages_total",
+                "Contact submissions handled by this worker's buffer.",
+                {
+                    (("result", "written"),): contact.written,
+                    (("result", "duplicate"),): contact.duplicates,
+                    (("result", "dropped"),): contact.dropped,
+                },
+            ),
+        ]
+        return HttpResponse(metrics.render(extra), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class ReportView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    cache_key = "api:reports:overview"
+    top_product_count = 5
+    revenue_aggregate = {"total": Sum("revenue")}
+
+    def get(self, request, *args, **kwargs):
+        # ?include_archived=1 adds the archive tables, which are only read on request.
+        include_archived = _query_flag(request, "include_archived")
+        key = f"{self.cache_key}:archived" if include_archived else self.cache_key
+        version = get_report_version()
+        entry = cache.get(f"{key}:{version}")
+        if entry is None and settings.REPORT_CACHE_MAX_STALENESS:
+            latest = cache.get(f"{key}:latest")
+            if latest and time.time() - latest["computed_at"] <= settings.REPORT_CACHE_MAX_STALENESS:
+                entry = latest
+        served_version = entry["version"] if entry else version
+
+        etag = f'"report-archived-{served_version}"' if include_archived else f'"report-{served_version}"'
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return self.with_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+        if entry is None:
+            entry = {"version": version, "computed_at": time.time(), "data": self._build_report(include_archived)}
+            cache.set(f"{key}:{version}", entry, settings.REPORT_CACHE_TIMEOUT)
+            cache.set(f"{key}:latest", entry, settings.REPORT_CACHE_TIMEOUT)
+        return self.with_validators(Response(entry["data"]), etag)
+
+    @staticmethod
+    def with_validators(response, etag):
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def _build_report(self, include_archived=False):
+        top = self.top_product_count
+        orders_by_status, monthly_sales, top_products = self.report_queries(None if include_archived else top)
+        revenue = DailySalesRollup.objects.aggregate(**self.revenue_aggregate)["total"]
+        rows = (list(orders_by_status), revenue, list(monthly_sales), list(top_products))
+        if include_archived:
+            rows = archive.add_archived(*rows, top=top)
+        return self.report_payload(*rows)
+
+    @staticmethod
+    def report_queries(top=top_product_count):
+        """Report rows from the rollups; ``top=None`` returns the totals of every product."""
         orders_by_status = (
-            Order.objects.values("status")
-            .annotate(total=Count("id"))
+            DailyOrderRollup.objects.values("status")
+            .annotate(total=Sum("order_count"))
             .order_by("status")
         )
-        status_dict = {item["status"]: item["total"] for item in orders_by_status}
-
         monthly_sales = (
-            Order.objects.annotate(month=TruncMonth("order_date"))
+            DailyOrderRollup.objects.annotate(month=TruncMonth("day"))
             .values("month")
-            .annotate(total=Count("id"))
+            .annotate(total=Sum("order_count"))
+            .filter(total__gt=0)
             .order_by("month")
         )
-        monthly_sales_payload = [
-            {"month": item["month"].strftime("%Y-%m") if item["month"] else None, "total": item["total"]}
-            for item in monthly_sales
-        ]
-
         top_products = (
-            Product.objects.annotate(total_sold=Sum("order_items__quantity"))
-            .order_by("-total_sold")[:5]
+            DailySalesRollup.objects.values("product_id", "product__name")
+            .annotate(total_sold=Sum("quantity"))
+            .filter(total_sold__gt=0)
+            .order_by("-total_sold")
         )
-        top_products_payload = [
-            {"id": product.id, "name": product.name, "total_sold": product.total_sold or 0}
-            for product in top_products
-        ]
+        if top is not None:
+            top_products = top_products[:top]
+        return orders_by_status, monthly_sales, top_products
 
+    @staticmethod
+    def report_payload(orders_by_status, revenue, monthly_sales, top_products):
+        status_dict = {item["status"]: item["total"] for item in orders_by_status if item["total"]}
         payload = {
-            "total_orders": total_orders,
-            "total_revenue": revenue_value,
+            "total_orders": sum(status_dict.values()),
+            "total_revenue": revenue or Decimal("0.00"),
             "orders_by_status": status_dict,
-            "monthly_sales": monthly_sales_payload,
-            "top_products": top_products_payload,
+            "monthly_sales": [
+                {"month": item["month"].strftime("%Y-%m") if item["month"] else None, "total": item["total"]}
+                for item in monthly_sales
+            ],
+            "top_products": [
+                {"id": item["product_id"], "name": item["product__name"], "total_sold": item["total_sold"]}
+                for item in top_products
+            ],
         }
-        serializer = ReportSerializer(payload)
-        return Response(serializer.data)
+        return ReportSerializer(payload).data
@@ -11,6 +11,7 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Serve the read-heavy endpoints with their async views and stream order events.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.asgi_settings')
 
 application = get_asgi_application()
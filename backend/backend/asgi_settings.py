@@ -0,0 +1,10 @@
+"""
+Settings for the ASGI application.
+
+The same as ``backend.settings``, except that the async read views in
+``backend.asgi_urls`` are mounted and the order event stream is served.
+"""
+from .settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'backend.asgi_urls'
+ORDER_EVENTS_STREAM = True
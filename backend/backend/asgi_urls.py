@@ -0,0 +1,14 @@
+"""
+URL configuration for the ASGI application.
+
+The async read views in ``api.async_urls`` come first; every other route
+is the same as in ``backend.urls``.
+"""
+from django.urls import include, path
+
+from . import urls
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+    *urls.urlpatterns,
+]
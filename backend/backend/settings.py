@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -88,6 +89,23 @@ DATABASES = {
     'default': env.db(default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Writers take the lock when their transaction starts and wait for each other instead of failing,
+    # and tests use a file so the threaded concurrency tests run rather than being skipped.
+    DATABASES['default'].setdefault('OPTIONS', {}).update(transaction_mode='IMMEDIATE', timeout=20)
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', str(BASE_DIR / 'test_db.sqlite3'))
+
+
+CACHES = {
+    'default': env.cache("CACHE_URL", default="locmemcache://"),
+}
+
+# Seconds the report overview may lag behind order writes; 0 always serves fresh data.
+REPORT_CACHE_MAX_STALENESS = env.int("REPORT_CACHE_MAX_STALENESS", default=0)
+REPORT_CACHE_TIMEOUT = env.int("REPORT_CACHE_TIMEOUT", default=60 * 60 * 24)
+# Rendered product lists kept in memory per worker (one per distinct query string).
+CATALOG_CACHE_SIZE = env.int("CATALOG_CACHE_SIZE", default=32)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,14 +146,30 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Proxies in front of Django that append to X-Forwarded-For. With 0 the throttles key on
+    # REMOTE_ADDR, so a client cannot reset its window by sending a different header.
+    'NUM_PROXIES': env.int("NUM_PROXIES", default=0),
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': env("THROTTLE_LOGIN_IP", default="30/min"),
+        'login_account': env("THROTTLE_LOGIN_ACCOUNT", default="5/min"),
+        'register': env("THROTTLE_REGISTER", default="10/hour"),
+        'contact': env("THROTTLE_CONTACT", default="5/min"),
+    },
 }
 
+AUTH_TOKEN_TTL = env.int("AUTH_TOKEN_TTL", default=60 * 60 * 24 * 30)
+AUTH_TOKEN_ROTATE_AFTER = env.int("AUTH_TOKEN_ROTATE_AFTER", default=60 * 60 * 24)
+AUTH_TOKEN_CACHE_TIMEOUT = env.int("AUTH_TOKEN_CACHE_TIMEOUT", default=300)
+# Per-worker token cache: how long another worker may still accept a deactivated user or a logged-out token.
+AUTH_TOKEN_LOCAL_CACHE_TTL = env.float("AUTH_TOKEN_LOCAL_CACHE_TTL", default=5)
+AUTH_TOKEN_LOCAL_CACHE_SIZE = env.int("AUTH_TOKEN_LOCAL_CACHE_SIZE", default=1024)
+
 CORS_ALLOWED_ORIGINS = env.list(
     "CORS_ALLOWED_ORIGINS",
     default=["http://localhost:8080", "http://127.0.0.1:8080"],
@@ -152,3 +186,36 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 NTFY_SERVER = env("NTFY_SERVER", default="https://ntfy.sh").rstrip("/")
 NTFY_TOPIC = env("NTFY_TOPIC", default=None)
 NTFY_TOKEN = env("NTFY_TOKEN", default=None)
+NTFY_TIMEOUT = env.float("NTFY_TIMEOUT", default=5)
+NTFY_WORKERS = env.int("NTFY_WORKERS", default=2)
+NTFY_QUEUE_SIZE = env.int("NTFY_QUEUE_SIZE", default=1000)
+NTFY_MAX_RETRIES = env.int("NTFY_MAX_RETRIES", default=3)
+NTFY_RETRY_BACKOFF = env.float("NTFY_RETRY_BACKOFF", default=0.5)
+NTFY_COALESCE_WINDOW = env.float("NTFY_COALESCE_WINDOW", default=1.0)
+
+# Public contact messages are buffered and written in batches of CONTACT_BUFFER_SIZE, or every
+# CONTACT_FLUSH_INTERVAL seconds; repeats from one sender within CONTACT_DEDUP_WINDOW are dropped.
+CONTACT_BUFFER_SIZE = env.int("CONTACT_BUFFER_SIZE", default=50)
+CONTACT_FLUSH_INTERVAL = env.float("CONTACT_FLUSH_INTERVAL", default=2.0)
+CONTACT_DEDUP_WINDOW = env.int("CONTACT_DEDUP_WINDOW", default=600)
+CONTACT_MAX_PENDING = env.int("CONTACT_MAX_PENDING", default=5000)
+
+# GET /api/orders/changes/: how far back the cursor of the last page stays, to catch
+# transactions that commit late, and how long deleted orders are reported.
+ORDER_CHANGES_SETTLE_SECONDS = env.int("ORDER_CHANGES_SETTLE_SECONDS", default=5)
+ORDER_TOMBSTONE_RETENTION_DAYS = env.int("ORDER_TOMBSTONE_RETENTION_DAYS", default=30)
+
+# manage.py archive_orders: completed orders older than this many months move to the archive tables.
+ORDER_ARCHIVE_AFTER_MONTHS = env.int("ORDER_ARCHIVE_AFTER_MONTHS", default=12)
+ORDER_ARCHIVE_BATCH_SIZE = env.int("ORDER_ARCHIVE_BATCH_SIZE", default=1000)
+
+# Order events streamed at /api/orders/events/ (ASGI only). Use api.events.PostgresBroker
+# when several workers serve the stream so each sees the changes made by the others.
+# backend.asgi_settings turns the stream on; set ORDER_EVENTS_STREAM=true for WSGI workers
+# too when a proxy sends /api/orders/events/ to the ASGI application.
+ORDER_EVENTS_STREAM = env.bool("ORDER_EVENTS_STREAM", default=False)
+ORDER_EVENTS_BROKER = env("ORDER_EVENTS_BROKER", default="api.events.LocalBroker")
+ORDER_EVENTS_QUEUE_SIZE = env.int("ORDER_EVENTS_QUEUE_SIZE", default=100)
+ORDER_EVENTS_KEEPALIVE = env.float("ORDER_EVENTS_KEEPALIVE", default=15)
+ORDER_EVENTS_RETRY_MS = env.int("ORDER_EVENTS_RETRY_MS", default=3000)
+ORDER_EVENTS_TICKET_TTL = env.int("ORDER_EVENTS_TICKET_TTL", default=60)
@@ -7,6 +7,7 @@ import { MenuIcon } from "@/components/icons"
 import { Button } from "@/components/ui/button"
 import { Sheet, SheetContent, SheetTrigger } from "@/components/ui/sheet"
 import { useRouter } from "next/navigation"
+import { logout } from "@/lib/api"
 import { clearAuthSession, getAuthToken } from "@/lib/auth"
 
 export function Navbar() {
@@ -30,6 +31,10 @@ export function Navbar() {
   ]
 
   const handleLogout = () => {
+    const token = getAuthToken()
+    if (token) {
+      logout(token).catch(() => undefined)
+    }
     clearAuthSession()
     setIsAuthenticated(false)
     router.push("/login")
@@ -45,6 +45,7 @@ export type OrderItem = {
   id: number
   quantity: number
   personalization?: string
+  unit_price: string
   subtotal: string
   product: number
   product_detail?: Product
@@ -58,6 +59,21 @@ export type Order = {
   notes?: string
   total: string
   items: OrderItem[]
+  updated_at: string
+  version: number
+}
+
+export type OrderEvent = {
+  id: number
+  customer: number
+  status: string
+  previous_status?: string
+}
+
+export type CursorPage<T> = {
+  next: string | null
+  previous: string | null
+  results: T[]
 }
 
 function resolveApiBaseUrl() {
@@ -85,6 +101,15 @@ function resolveApiBaseUrl() {
 
 const API_BASE_URL = resolveApiBaseUrl()
 
+export class ApiError extends Error {
+  constructor(
+    message: string,
+    readonly status: number,
+  ) {
+    super(message)
+  }
+}
+
 async function apiFetch<T>(path: string, { token, method = "GET", body }: ApiOptions = {}) {
   const headers: Record<string, string> = {
     "Content-Type": "application/json",
@@ -114,7 +139,7 @@ async function apiFetch<T>(path: string, { token, method = "GET", body }: ApiOpt
     } catch {
       // Ignore JSON parsing errors and keep default message
     }
-    throw new Error(message)
+    throw new ApiError(message, response.status)
   }
 
   if (response.status === 204) {
@@ -128,6 +153,10 @@ export function login(payload: AuthPayload) {
   return apiFetch<AuthResponse>("/auth/login/", { method: "POST", body: payload })
 }
 
+export function logout(token: string) {
+  return apiFetch<null>("/auth/logout/", { method: "POST", token })
+}
+
 export function register(payload: AuthPayload & { username: string; confirm_password: string; first_name?: string; last_name?: string }) {
   return apiFetch<AuthResponse>("/auth/register/", { method: "POST", body: payload })
 }
@@ -140,6 +169,72 @@ export function createOrder(token: string, payload: CreateOrderPayload) {
   return apiFetch("/orders/", { method: "POST", body: payload, token })
 }
 
-export function fetchOrders(token: string) {
-  return apiFetch<Order[]>("/orders/", { token })
+// Newest first, one page at a time; pass the previous page's `next` to get the following one.
+export function fetchOrders(token: string, next?: string | null) {
+  // `next` is an absolute URL built from the backend's own host, so only its cursor is reused.
+  const query = next ? new URL(next).search : ""
+  return apiFetch<CursorPage<Order>>(`/orders/${query}`, { token })
+}
+
+type OrderEventHandlers = {
+  onOpen?: () => void
+  onCreated?: (event: OrderEvent) => void
+  onStatusChanged?: (event: OrderEvent) => void
+  // Called periodically instead when the server does not stream events.
+  onPoll?: () => void
+}
+
+const ORDER_EVENTS_RETRY_MS = 15000
+const ORDER_POLL_MS = 60000
+
+// EventSource cannot send the Authorization header, so each connection uses a short-lived ticket.
+export function subscribeToOrderEvents(
+  token: string,
+  { onOpen, onCreated, onStatusChanged, onPoll }: OrderEventHandlers,
+) {
+  let source: EventSource | null = null
+  let retry: ReturnType<typeof setTimeout> | undefined
+  let poll: ReturnType<typeof setInterval> | undefined
+  let closed = false
+
+  const open = async () => {
+    try {
+      const { ticket } = await apiFetch<{ ticket: string }>("/orders/events/ticket/", { method: "POST", token })
+      if (closed) {
+        return
+      }
+      source = new EventSource(`${API_BASE_URL}/orders/events/?ticket=${encodeURIComponent(ticket)}`)
+    } catch (error) {
+      if (closed) {
+        return
+      }
+      // A 404 means this server has no event stream (e.g. WSGI); retrying would never succeed.
+      if (error instanceof ApiError && error.status === 404) {
+        poll = setInterval(() => onPoll?.(), ORDER_POLL_MS)
+        return
+      }
+      retry = setTimeout(open, ORDER_EVENTS_RETRY_MS)
+      return
+    }
+    source.onopen = () => onOpen?.()
+    source.addEventListener("order.created", (message) => onCreated?.(JSON.parse((message as MessageEvent).data)))
+    source.addEventListener("order.status_changed", (message) =>
+      onStatusChanged?.(JSON.parse((message as MessageEvent).data)),
+    )
+    source.onerror = () => {
+      // The browser reconnects by itself unless the stream was refused, e.g. with an expired ticket.
+      if (source?.readyState === EventSource.CLOSED && !closed) {
+        source = null
+        retry = setTimeout(open, ORDER_EVENTS_RETRY_MS)
+      }
+    }
+  }
+
+  open()
+  return () => {
+    closed = true
+    clearTimeout(retry)
+    clearInterval(poll)
+    source?.close()
+  }
 }